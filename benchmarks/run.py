@@ -0,0 +1,313 @@
+# benchmarks/run.py
+#
+# Benchmarks of the simulation hot paths. Run from the repository root:
+#
+#     python -m benchmarks.run --output bench.json
+#     python -m benchmarks.run --baseline bench.json --tolerance 0.2
+#
+# Every benchmark reports a throughput (higher is better). With --baseline the
+# results are compared against a saved run and the exit status is 1 when any
+# benchmark is slower than the baseline by more than the tolerance.
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+from config import config
+from src import kernels
+from src.controllers.controller import PIDBank, PIDController
+from src.database import database
+from src.ensemble import run_ensemble, simulate_ensemble
+from src.models.registry import available_models, create_model
+from src.simulation import simulate
+
+# Benchmark groups, selectable with --only
+GROUPS = ("simulate", "micro", "database", "scaling")
+
+
+@contextlib.contextmanager
+def config_overrides(**values):
+    """
+    Temporarily replace config module attributes.
+    """
+    saved = {name: getattr(config, name) for name in values}
+    for name, value in values.items():
+        setattr(config, name, value)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(config, name, value)
+
+
+def synthetic_tokens(n_tokens, n_products):
+    """
+    Build a token configuration with n_tokens copies of the first configured
+    token and n_products products.
+
+    Returns:
+        dict: TOKENS, FEES_COEFS and REWARDS_COEFS overrides for config_overrides().
+    """
+    base_name = next(iter(config.TOKENS))
+    base = config.TOKENS[base_name]
+    base_products = list(base["fees"])
+    products = [base_products[k] if k < len(base_products) else f"product_{k}" for k in range(n_products)]
+
+    def per_product(values):
+        ordered = list(values.values())
+        return {prod: ordered[k % len(ordered)] for k, prod in enumerate(products)}
+
+    tokens, fees_coefs, rewards_coefs = {}, {}, {}
+    for i in range(n_tokens):
+        name = f"token_{i}"
+        tokens[name] = dict(base, fees=per_product(base["fees"]), rewards=per_product(base["rewards"]))
+        fees_coefs[name] = per_product(config.FEES_COEFS[base_name])
+        rewards_coefs[name] = per_product(config.REWARDS_COEFS[base_name])
+    return {"TOKENS": tokens, "FEES_COEFS": fees_coefs, "REWARDS_COEFS": rewards_coefs}
+
+
+def measure(func, operations, repeat):
+    """
+    Run func() repeat times and return the best throughput in operations per second.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return operations / best
+
+
+def bench_simulate(scale, repeat):
+    results = {}
+    steps = {"nudge": 20_000, "linear": 20_000, "nn": 2_000}
+    for model_type in available_models():
+        backends = ("numpy", "numba", "python") if model_type == "nudge" else ("numpy",)
+        for backend in backends:
+            if backend == "numba" and not kernels.NUMBA_AVAILABLE:
+                # simulate() would fall back to the NumPy loop and record it under the numba key
+                continue
+            n_steps = max(1, int(steps.get(model_type, 2_000) * scale))
+            with config_overrides(TIME_STEPS=n_steps, STORE_RESULTS=False, HISTORY_PATH=None):
+                # Warm-up: lazy imports, JIT compilation, torch initialization
+                simulate(model_type, backend=backend, seed=0, cache=False)
+                rate = measure(lambda: simulate(model_type, backend=backend, seed=0, cache=False), n_steps, repeat)
+            results[f"simulate.{model_type}.{backend}"] = {"value": rate, "unit": "steps/s"}
+    return results
+
+
+def bench_micro(scale, repeat):
+    results = {}
+    n_calls = max(1, int(20_000 * scale))
+    model = create_model("nudge")
+    token = config.TOKENS[next(iter(config.TOKENS))]
+    state = {
+        "price": token["initial_price"], "circulation": token["initial_circulation"],
+        "fees": dict(token["fees"]), "rewards": dict(token["rewards"]),
+        "target": token["target_price"], "collateral": token["collateral"], "max_supply": token["max_supply"],
+    }
+
+    def predict_loop():
+        for _ in range(n_calls):
+            model.predict(state, 10.0, 5.0)
+
+    results["nudge.predict"] = {"value": measure(predict_loop, n_calls, repeat), "unit": "calls/s"}
+
+    batch_state = np.tile(np.array([[1.0], [1e6], [0.5], [1.0], [1.0], [1e5], [2e6], [10.0], [5.0]]), (1, 10_000))
+    batch_out = np.empty_like(batch_state)
+    noise = np.zeros(10_000)
+    n_batches = max(1, int(200 * scale))
+
+    def predict_batch_loop():
+        for _ in range(n_batches):
+            model.predict_batch(batch_state, noise, out=batch_out)
+
+    results["nudge.predict_batch_10k"] = {
+        "value": measure(predict_batch_loop, n_batches * 10_000, repeat), "unit": "rows/s",
+    }
+
+    controller = PIDController(config.K_P, config.K_I, config.K_D)
+
+    def pid_loop():
+        for _ in range(n_calls):
+            controller.update(0.1)
+
+    results["pid_controller.update"] = {"value": measure(pid_loop, n_calls, repeat), "unit": "calls/s"}
+
+    bank = PIDBank(config.K_P, config.K_I, config.K_D, shape=(2, 10_000))
+    error = np.full((2, 10_000), 0.1)
+    out = np.empty_like(error)
+
+    def bank_loop():
+        for _ in range(n_batches):
+            bank.update(error, out=out)
+
+    results["pid_bank.update_20k"] = {"value": measure(bank_loop, n_batches * 20_000, repeat), "unit": "controllers/s"}
+    return results
+
+
+def bench_database(scale, repeat):
+    results = {}
+    token = config.TOKENS[next(iter(config.TOKENS))]
+    n_single = max(1, int(200 * scale))
+    n_batched = max(1, int(100_000 * scale))
+    with tempfile.TemporaryDirectory() as tmp:
+        schema_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "schema", "schema.sql")
+        counter = iter(range(10 ** 9))
+
+        def fresh_db():
+            db_path = os.path.join(tmp, f"bench_{next(counter)}.db")
+            database.init_db(db_path, schema_path)
+            return db_path
+
+        def single_rows():
+            db_path = fresh_db()
+            for t in range(n_single):
+                database.store_simulation_step(db_path, t, "alpha", 1.0, 1e6, token["fees"], token["rewards"])
+
+        results["database.store_simulation_step"] = {
+            "value": measure(single_rows, n_single, repeat), "unit": "rows/s",
+        }
+
+        def batched_rows():
+            db_path = fresh_db()
+            with database.SimulationWriter(db_path, database.create_run(db_path)) as writer:
+                for t in range(n_batched):
+                    writer.store_simulation_step(t, "alpha", 1.0, 1e6, token["fees"], token["rewards"])
+
+        results["database.simulation_writer"] = {
+            "value": measure(batched_rows, n_batched, repeat), "unit": "rows/s",
+        }
+    return results
+
+
+def bench_scaling(scale, repeat):
+    results = {}
+    n_steps = max(1, int(2_000 * scale))
+    for n_tokens in (2, 8, 32):
+        with config_overrides(TIME_STEPS=n_steps, STORE_RESULTS=False, HISTORY_PATH=None,
+                              **synthetic_tokens(n_tokens, 3)):
+            simulate("nudge", backend="numpy", seed=0, cache=False)
+            rate = measure(lambda: simulate("nudge", backend="numpy", seed=0, cache=False), n_steps * n_tokens,
+                           repeat)
+        results[f"scaling.tokens.{n_tokens}"] = {"value": rate, "unit": "token-steps/s"}
+
+    for n_products in (3, 12, 48):
+        with config_overrides(TIME_STEPS=n_steps, STORE_RESULTS=False, HISTORY_PATH=None,
+                              **synthetic_tokens(2, n_products)):
+            simulate("nudge", backend="numpy", seed=0, cache=False)
+            rate = measure(lambda: simulate("nudge", backend="numpy", seed=0, cache=False), n_steps, repeat)
+        results[f"scaling.products.{n_products}"] = {"value": rate, "unit": "steps/s"}
+
+    ensemble_steps = max(1, int(200 * scale))
+    for n_paths in (100, 1_000, 10_000):
+        rate = measure(lambda: simulate_ensemble(n_paths, time_steps=ensemble_steps, seed=0, cache=False),
+                       n_paths * ensemble_steps, repeat)
+        results[f"scaling.ensemble_paths.{n_paths}"] = {"value": rate, "unit": "path-steps/s"}
+
+    n_paths = 8_192
+    for workers in (1, 2, 4):
+        rate = measure(lambda: run_ensemble(n_paths, time_steps=ensemble_steps, seed=0, workers=workers, cache=False),
+                       n_paths * ensemble_steps, repeat)
+        results[f"scaling.workers.{workers}"] = {"value": rate, "unit": "path-steps/s"}
+    return results
+
+
+BENCHMARKS = {
+    "simulate": bench_simulate,
+    "micro": bench_micro,
+    "database": bench_database,
+    "scaling": bench_scaling,
+}
+
+
+def run_benchmarks(groups=GROUPS, scale=1.0, repeat=3):
+    """
+    Run the selected benchmark groups.
+
+    Parameters:
+        groups (iterable): Names from GROUPS.
+        scale (float): Multiplier on the work per benchmark (e.g. 0.1 for a smoke run).
+        repeat (int): Timed repetitions; the best one is reported.
+
+    Returns:
+        dict: {"meta": {...}, "results": {name: {"value": float, "unit": str}}}.
+    """
+    results = {}
+    # Every run is timed for real: a result cache hit would skip the simulation
+    with config_overrides(CACHE_RESULTS=False):
+        for group in groups:
+            results.update(BENCHMARKS[group](scale, repeat))
+    meta = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "scale": scale,
+        "repeat": repeat,
+    }
+    return {"meta": meta, "results": results}
+
+
+def compare(current, baseline, tolerance=0.2):
+    """
+    Compare benchmark results against a baseline.
+
+    Parameters:
+        current (dict): Output of run_benchmarks().
+        baseline (dict): Saved output of an earlier run.
+        tolerance (float): Allowed relative slowdown before a benchmark counts as a regression.
+
+    Returns:
+        list: (name, baseline value, current value, ratio, regressed) tuples for
+        the benchmarks present in both.
+    """
+    rows = []
+    for name, result in current["results"].items():
+        if name not in baseline["results"]:
+            continue
+        old = baseline["results"][name]["value"]
+        ratio = result["value"] / old if old else float("inf")
+        rows.append((name, old, result["value"], ratio, ratio < 1.0 - tolerance))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the simulation hot paths.")
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    parser.add_argument("--baseline", help="Compare against results saved by an earlier run.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative slowdown (default 0.2).")
+    parser.add_argument("--only", nargs="+", choices=GROUPS, default=list(GROUPS), help="Benchmark groups to run.")
+    parser.add_argument("--scale", type=float, default=1.0, help="Work multiplier per benchmark.")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed repetitions per benchmark.")
+    args = parser.parse_args(argv)
+
+    current = run_benchmarks(args.only, args.scale, args.repeat)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+    else:
+        json.dump(current, sys.stdout, indent=2)
+        print()
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        rows = compare(current, baseline, args.tolerance)
+        for name, old, new, ratio, regressed in rows:
+            flag = "REGRESSION" if regressed else "ok"
+            print(f"{name:40s} {old:14.1f} -> {new:14.1f}  x{ratio:5.2f}  {flag}", file=sys.stderr)
+        if any(row[-1] for row in rows):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
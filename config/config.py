@@ -7,6 +7,10 @@ MODEL_TYPE = "nudge"
 TIME_STEPS = 100
 LEARNING_RATE = 0.01
 
+# Step loop backend: "numpy", "numba" (compiled nudge kernel), "python" (the same loop in plain
+# Python) or "auto" (numba when available, else python for small universes, else numpy)
+BACKEND = "auto"
+
 # Multi-token configuration.
 # Each token is defined with its starting price, supply, collateral, fees, rewards, target price, and max supply.
 TOKENS = {
@@ -73,6 +77,10 @@ REWARDS_COEFS = {
     }
 }
 
+# Optional token universe replacing TOKENS / FEES_COEFS / REWARDS_COEFS: a .json/.yaml/.toml
+# spec file, a spec dict or a TokenUniverse (see src/universe.py), e.g. generated tokens
+TOKEN_UNIVERSE = None
+
 # PID Controller parameters
 K_P = 0.1
 K_I = 0.01
@@ -81,7 +89,39 @@ K_D = 0.05
 # Noise level for simulation (standard deviation)
 NOISE_STD = 0.5
 
+# Price-noise mode of the ensemble engine: None (independent paths), "antithetic" (mirrored
+# path pairs) or "sobol" (scrambled quasi-Monte Carlo points, requires scipy); see src/variance.py
+VARIANCE_REDUCTION = None
+
+# Optional .npy file backing the simulation history as a memory map (None keeps it in memory)
+HISTORY_PATH = None
+
+# Steps between checkpoints when simulate() is given a checkpoint_path
+CHECKPOINT_EVERY = 10_000
+
+# Relative band around the target price counted as "in peg" by the run summaries
+PEG_TOLERANCE = 0.01
+
+# Content-addressed result cache (src/cache.py) for seeded simulate() / simulate_ensemble() runs:
+# entries live under CACHE_DIR, least recently used ones are evicted beyond CACHE_MAX_BYTES,
+# and the last CACHE_MEMO_SIZE entries are also kept in memory
+CACHE_RESULTS = False
+CACHE_DIR = ".result_cache"
+CACHE_MAX_BYTES = 1 << 30
+CACHE_MEMO_SIZE = 32
+
+# Instrumentation: per-phase timing table and an optional "cprofile"/"pyinstrument" profiler report
+TIMING = False
+PROFILER = None
+
 # Database options (for future use; can disable by setting STORE_RESULTS to False)
 STORE_RESULTS = False
 DB_PATH = "simulation.db"
+# Number of rows buffered by the database writer before each batched insert
+DB_BATCH_SIZE = 1000
+# Write rows from a background process (True), in the step loop (False) or "auto": in the
+# background only when more than one CPU is available, since otherwise nothing can overlap
+DB_BACKGROUND = "auto"
+# History blocks queued for the background writer before the simulation waits
+DB_QUEUE_SIZE = 64
 SCHEMA_PATH = "schema.sql"
@@ -1,11 +1,63 @@
 -- schema.sql
+
+-- One row per simulation run; run_id ties step rows together.
+CREATE TABLE IF NOT EXISTS simulation_runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    model_type TEXT,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+-- One row per (run, token, time step), with one REAL fee and reward column per product
+-- (NULL for products a run does not have; columns of new products are added on first use).
 CREATE TABLE IF NOT EXISTS simulation_results (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    time_step INTEGER NOT NULL,
+    run_id INTEGER NOT NULL,
     token_name TEXT NOT NULL,
+    time_step INTEGER NOT NULL,
     price REAL NOT NULL,
     circulation REAL NOT NULL,
-    fees TEXT NOT NULL,
-    rewards TEXT NOT NULL,
-    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-);
+    fee_minting REAL,
+    fee_staking REAL,
+    fee_transfers REAL,
+    reward_minting REAL,
+    reward_staking REAL,
+    reward_transfers REAL,
+    PRIMARY KEY (run_id, token_name, time_step)
+) WITHOUT ROWID;
+
+-- Range scans over steps across all runs of a token.
+CREATE INDEX IF NOT EXISTS idx_simulation_results_token_step
+    ON simulation_results (token_name, time_step);
+
+-- Per-run token parameters needed to interpret the step rows (targets, collateral).
+CREATE TABLE IF NOT EXISTS run_tokens (
+    run_id INTEGER NOT NULL,
+    token_name TEXT NOT NULL,
+    token_index INTEGER NOT NULL,
+    target_price REAL NOT NULL,
+    collateral REAL NOT NULL,
+    max_supply REAL NOT NULL,
+    PRIMARY KEY (run_id, token_name)
+) WITHOUT ROWID;
+
+-- Precomputed per-(run, token) summaries, see src/database/analytics.py.
+CREATE TABLE IF NOT EXISTS run_summaries (
+    run_id INTEGER NOT NULL,
+    token_name TEXT NOT NULL,
+    steps INTEGER NOT NULL,
+    tolerance REAL NOT NULL,
+    final_price REAL,
+    mean_abs_deviation REAL,
+    max_abs_deviation REAL,
+    rms_deviation REAL,
+    in_peg_share REAL,
+    time_to_peg INTEGER,
+    max_drawdown REAL,
+    net_increase REAL,
+    net_decrease REAL,
+    minted REAL,
+    burned REAL,
+    final_circulation REAL,
+    min_collateral_ratio REAL,
+    final_collateral_ratio REAL,
+    PRIMARY KEY (run_id, token_name)
+) WITHOUT ROWID;
@@ -0,0 +1,283 @@
+# src/cache.py
+#
+# Content-addressed cache of simulation results. A run is keyed by the SHA-256
+# of everything that determines its output: the resolved config knobs and
+# token universe, the model type and constants, the seed and the source code
+# of the engine. Entries are .npz files under config.CACHE_DIR, evicted least
+# recently used once the directory outgrows config.CACHE_MAX_BYTES; an
+# in-process memo in front of the disk serves repeated hits without I/O.
+
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+import numpy as np
+from config import config
+from src.models.abstract_model import AbstractModel
+from src.universe import TokenUniverse
+
+# Root of the sources hashed into code_version()
+SOURCE_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+_code_version = None
+_default_cache = None
+
+
+def code_version():
+    """
+    Return a hash of every engine source file under src/.
+
+    Any edit to the engine gives new keys, so stale entries are never served
+    (they age out through eviction). Computed once per process.
+    """
+    global _code_version
+    if _code_version is None:
+        digest = hashlib.sha256()
+        for root, dirs, files in os.walk(SOURCE_ROOT):
+            dirs[:] = sorted(d for d in dirs if d != "__pycache__")
+            for name in sorted(files):
+                if name.endswith(".py"):
+                    path = os.path.join(root, name)
+                    digest.update(os.path.relpath(path, SOURCE_ROOT).encode())
+                    with open(path, "rb") as f:
+                        digest.update(hashlib.sha256(f.read()).digest())
+        _code_version = digest.hexdigest()
+    return _code_version
+
+
+def _canonical(value):
+    """
+    Convert a key component into plain JSON values with a stable encoding.
+
+    Arrays are reduced to dtype, shape and a hash of their bytes; seeds to
+    their entropy and spawn key; token universes to their names and arrays;
+    other objects (e.g. stop conditions) to their class and attributes.
+    """
+    if isinstance(value, dict):
+        return {str(name): _canonical(item) for name, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(item) for item in value]
+    if isinstance(value, np.ndarray):
+        data = np.ascontiguousarray(value)
+        digest = hashlib.sha256(data.tobytes()).hexdigest()
+        return {"dtype": data.dtype.str, "shape": list(data.shape), "sha256": digest}
+    if isinstance(value, np.generic):
+        return value.item()
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, np.random.SeedSequence):
+        return {"entropy": value.entropy, "spawn_key": list(value.spawn_key)}
+    if isinstance(value, TokenUniverse):
+        return {"token_names": value.token_names, "products": value.products, "arrays": _canonical(value.arrays())}
+    return {"class": f"{type(value).__module__}.{type(value).__qualname__}", "attributes": _canonical(vars(value))}
+
+
+def cache_key(kind, **inputs):
+    """
+    Return the hex SHA-256 key of a run.
+
+    Parameters:
+        kind (str): Entry point, e.g. "simulate" or "ensemble".
+        **inputs: Everything else the result depends on (see _canonical for
+            the supported values); code_version() is added automatically.
+    """
+    payload = {"kind": kind, "code": code_version(), "inputs": _canonical(inputs)}
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"), allow_nan=True)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+def cacheable_model(model):
+    """
+    Whether get_state() captures everything a model's results depend on.
+
+    Models with extra state (e.g. the randomly initialized torch weights that
+    save_weights() writes) cannot be keyed and are never cached.
+    """
+    return type(model).save_weights is AbstractModel.save_weights
+
+
+class ResultCache:
+    """
+    Size-bounded on-disk store of result arrays with an in-process LRU memo.
+
+    An entry is a {name: array} dict written as <directory>/<key[:2]>/<key>.npz
+    through a temporary file, so concurrent writers (e.g. sweep workers)
+    never expose a partial entry. File modification times act as the LRU
+    clock: every disk hit touches its file, and after each write the oldest
+    files are deleted until the directory fits in max_bytes. Returned arrays
+    are read-only and shared with the memo.
+
+    Attributes:
+        directory (str): Cache directory.
+        max_bytes (int): Disk budget of the entries.
+        memo_size (int): Entries kept in memory.
+        hits (int): Lookups served from the memo.
+        disk_hits (int): Lookups served from disk.
+        misses (int): Lookups that found nothing.
+    """
+
+    def __init__(self, directory=None, max_bytes=None, memo_size=None):
+        """
+        Parameters:
+            directory (str): Cache directory (defaults to config.CACHE_DIR).
+            max_bytes (int): Disk budget (defaults to config.CACHE_MAX_BYTES).
+            memo_size (int): In-memory entries (defaults to config.CACHE_MEMO_SIZE).
+        """
+        self.directory = config.CACHE_DIR if directory is None else directory
+        self.max_bytes = config.CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self.memo_size = config.CACHE_MEMO_SIZE if memo_size is None else memo_size
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memo = OrderedDict()
+
+    def __repr__(self):
+        return (f"ResultCache({self.directory!r}, hits={self.hits}, disk_hits={self.disk_hits}, "
+                f"misses={self.misses})")
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".npz")
+
+    def _remember(self, key, entry):
+        self._memo[key] = entry
+        self._memo.move_to_end(key)
+        while len(self._memo) > self.memo_size:
+            self._memo.popitem(last=False)
+
+    def get(self, key):
+        """
+        Return the entry stored under key, or None.
+        """
+        entry = self._memo.get(key)
+        if entry is not None:
+            self._memo.move_to_end(key)
+            self.hits += 1
+            return entry
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                entry = {name: data[name] for name in data.files}
+            os.utime(path)
+        except (FileNotFoundError, OSError, ValueError):
+            # Missing, evicted by another process or unreadable
+            self.misses += 1
+            return None
+        for array in entry.values():
+            array.flags.writeable = False
+        self._remember(key, entry)
+        self.disk_hits += 1
+        return entry
+
+    def put(self, key, entry):
+        """
+        Store a {name: array} entry under key and evict old entries if needed.
+
+        Returns:
+            dict: The stored entry, as get() will return it.
+        """
+        entry = {name: np.array(value) for name, value in entry.items()}
+        for array in entry.values():
+            array.flags.writeable = False
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **entry)
+        os.replace(tmp_path, path)
+        self._remember(key, entry)
+        self.evict()
+        return entry
+
+    def get_or_compute(self, key, compute):
+        """
+        Return the entry under key, computing and storing compute() on a miss.
+        """
+        entry = self.get(key)
+        if entry is None:
+            entry = self.put(key, compute())
+        return entry
+
+    def _entries(self):
+        """Return (mtime, size, path) of every stored entry."""
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for item in os.scandir(shard.path):
+                if item.name.endswith(".npz"):
+                    try:
+                        stat = item.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, item.path))
+        return entries
+
+    def size(self):
+        """
+        Return the number of bytes used by the stored entries.
+        """
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self, max_bytes=None):
+        """
+        Delete least recently used entries until the directory fits in max_bytes.
+
+        Returns:
+            int: Number of entries deleted.
+        """
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+            self._memo.pop(os.path.basename(path)[:-len(".npz")], None)
+        return removed
+
+    def clear(self):
+        """
+        Delete every entry, on disk and in memory.
+        """
+        self._memo.clear()
+        self.evict(0)
+
+
+def resolve_cache(cache=None):
+    """
+    Return the ResultCache a run should use, or None.
+
+    Parameters:
+        cache: A ResultCache, True for the process-wide cache built from
+            config, False to disable caching, or None for config.CACHE_RESULTS.
+    """
+    global _default_cache
+    if cache is None:
+        cache = config.CACHE_RESULTS
+    if isinstance(cache, ResultCache):
+        return cache
+    if not cache:
+        return None
+    if _default_cache is None or _default_cache.directory != config.CACHE_DIR:
+        _default_cache = ResultCache()
+    return _default_cache
+
+
+def pack_meta(meta):
+    """Encode a JSON-serializable dict as a 0-d string array entry."""
+    return np.array(json.dumps(meta))
+
+
+def unpack_meta(array):
+    """Decode an entry written by pack_meta()."""
+    return json.loads(str(array))
@@ -1,5 +1,7 @@
 # controller.py
 
+import numpy as np
+
 def update_parameter(param, grad, learning_rate):
     """
     Perform a simple gradient descent update for a parameter.
@@ -43,6 +45,40 @@ def compute_gradients(P_next, target, fees_coefs, rewards_coefs):
     return grad_fees, grad_rewards
 
 
+def update_and_clip(params, error, coefs, control_signal, learning_rate, low=0.0, high=5.0, scratch=None):
+    """
+    Fused, in-place gradient step, control adjustment and clamp for fees or rewards.
+
+    Computes params = clip(params - learning_rate * 2 * error * coefs + control_signal, low, high)
+    without allocating when a scratch array is supplied. Scaling by 2 is exact
+    in floating point, so the result matches the dict-based update bit for bit.
+
+    Parameters:
+        params (np.ndarray): Fees or rewards of shape (products, ...), or both stacked as
+            (2, products, ...) (see TokenState.params), updated in place.
+        error (np.ndarray): P - target per token (and path).
+        coefs (np.ndarray): Coefficient matrix broadcasting against params.
+        control_signal (np.ndarray): PID output per token (and path).
+        learning_rate (float): Step size for the gradient update.
+        low (float): Lower clamp bound.
+        high (float): Upper clamp bound.
+        scratch (np.ndarray): Optional work array with the shape of params.
+
+    Returns:
+        np.ndarray: params.
+    """
+    if scratch is None:
+        scratch = np.empty_like(params)
+    np.multiply(error, coefs, out=scratch)
+    scratch *= 2.0 * learning_rate
+    params -= scratch
+    params += control_signal
+    # maximum/minimum clamp exactly like np.clip, without its Python-level dispatch
+    np.maximum(params, low, out=params)
+    np.minimum(params, high, out=params)
+    return params
+
+
 class PIDController:
     """
     A Proportional-Integral-Derivative (PID) controller is a feedback control mechanism widely used in control systems.
@@ -101,3 +137,98 @@ class PIDController:
         output = self.Kp * error + self.Ki * self.integral + self.Kd * derivative
         self.prev_error = error
         return output
+
+
+class PIDBank:
+    """
+    A bank of independent PID controllers updated in a single vectorized call.
+
+    Gains, integrals and previous errors are stored as NumPy arrays of a common
+    shape, e.g. (tokens,) for one run or (tokens, paths) for an ensemble, so
+    every controller is updated at once without per-controller Python calls.
+    With the default options each controller computes exactly what
+    PIDController.update() computes:
+
+        output = Kp * error + Ki * integral + Kd * derivative
+
+    Two optional refinements are available:
+
+        - Anti-windup: the integral is clamped to [-integral_limit, integral_limit]
+          after each accumulation, so long saturated phases cannot wind it up.
+        - Derivative filtering: the derivative is smoothed with a first-order
+          low-pass filter, d_t = a * d_{t-1} + (1 - a) * (error - prev_error),
+          where a = derivative_filter in [0, 1). 0 disables the filter.
+
+    Attributes:
+        Kp, Ki, Kd (np.ndarray): Gains, broadcastable to shape (per-controller gains allowed).
+        integral (np.ndarray): The accumulated sum of errors per controller.
+        prev_error (np.ndarray): The error of the previous update per controller.
+        derivative (np.ndarray): The (filtered) derivative of the last update.
+        integral_limit (float): Anti-windup bound, or None to disable.
+        derivative_filter (float): Low-pass coefficient of the derivative term.
+    """
+
+    def __init__(self, Kp, Ki, Kd, shape, integral_limit=None, derivative_filter=0.0):
+        """
+        Initialize the bank with zero integrals and previous errors.
+
+        Parameters:
+            Kp, Ki, Kd (float or array-like): Gains, broadcastable to shape.
+            shape (tuple): Shape of the controller array.
+            integral_limit (float): Optional anti-windup bound on |integral|.
+            derivative_filter (float): Optional derivative low-pass coefficient in [0, 1).
+        """
+        if not 0.0 <= derivative_filter < 1.0:
+            raise ValueError("derivative_filter must be in [0, 1)")
+        shape = tuple(shape)
+        self.Kp, self.Ki, self.Kd = (np.asarray(gain, dtype=np.float64) for gain in (Kp, Ki, Kd))
+        for gain in (self.Kp, self.Ki, self.Kd):
+            if np.broadcast_shapes(gain.shape, shape) != shape:
+                raise ValueError(f"PID gains of shape {gain.shape} do not broadcast to {shape}")
+        self.integral_limit = integral_limit
+        self.derivative_filter = derivative_filter
+        self.integral = np.zeros(shape)
+        self.prev_error = np.zeros(shape)
+        self.derivative = np.zeros(shape)
+        self._term = np.empty(shape)
+
+    def reset(self):
+        """
+        Clear the integral, previous error and derivative of every controller.
+        """
+        self.integral.fill(0.0)
+        self.prev_error.fill(0.0)
+        self.derivative.fill(0.0)
+
+    def update(self, error, out=None):
+        """
+        Update every controller with its current error and compute the control signals.
+
+        Parameters:
+            error (np.ndarray): Current errors, one per controller.
+            out (np.ndarray): Optional array to write the control signals to.
+
+        Returns:
+            np.ndarray: The control signal of every controller.
+        """
+        self.integral += error
+        if self.integral_limit is not None:
+            np.clip(self.integral, -self.integral_limit, self.integral_limit, out=self.integral)
+
+        if self.derivative_filter:
+            np.subtract(error, self.prev_error, out=self._term)
+            self._term *= 1.0 - self.derivative_filter
+            self.derivative *= self.derivative_filter
+            self.derivative += self._term
+        else:
+            np.subtract(error, self.prev_error, out=self.derivative)
+
+        if out is None:
+            out = np.empty(self.integral.shape)
+        np.multiply(self.Kp, error, out=out)
+        np.multiply(self.Ki, self.integral, out=self._term)
+        out += self._term
+        np.multiply(self.Kd, self.derivative, out=self._term)
+        out += self._term
+        np.copyto(self.prev_error, error)
+        return out
@@ -0,0 +1,304 @@
+# src/controllers/q_learning.py
+#
+# Tabular Q-learning controller for fees and rewards, replacing the dict-keyed
+# TokenSimulation.balance_prices_rl_based of deprecated/python_sim.py. States
+# are discretized on a fixed grid into a dense (states, actions) Q-array, and
+# every step updates the table from a whole batch of parallel environments
+# (tokens x paths) at once.
+
+import numpy as np
+from config import config
+from src.models.abstract_model import FEE_TOTAL, PRICE, REWARD_TOTAL, TARGET
+from src.models.registry import create_model
+from src.noise import NoiseBlocks, path_generators, root_seed
+from src.state import TokenState
+from src.universe import load_universe
+
+# Bin edges of the default state grid: relative peg deviation, and the mean fee
+# and reward per product (the actions are relative steps, so the level they
+# have accumulated to must be part of the state)
+DEVIATION_EDGES = (-0.75, -0.5, -0.25, -0.1, -0.02, 0.02, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0)
+LEVEL_EDGES = (0.05, 0.25, 0.5, 1.0, 2.0, 4.0)
+
+# Actions as (fee direction, reward direction): every combination of hold,
+# lower and raise, applied to all products of a token. Hold comes first, so
+# an untrained all-zero table (ties go to the first action) changes nothing.
+ACTIONS = tuple((fee, reward) for fee in (0, -1, 1) for reward in (0, -1, 1))
+
+
+class QLearningController:
+    """
+    Epsilon-greedy Q-learning over a fixed discretization of the token state.
+
+    The observation of every (token, path) environment is the bin of three
+    features on a fixed grid:
+
+        - peg deviation (price - target) / target,
+        - fee level, the mean fee per product,
+        - reward level, the mean reward per product,
+
+    flattened into one state index of a dense Q-array of shape
+    (n_states, len(ACTIONS)) shared by all tokens. An action moves every fee
+    and/or reward of a token by one step up or down (see ACTIONS), and the
+    reward of a transition is
+
+        -|deviation'| - drop_penalty * max(1 - price' / price, 0)
+
+    i.e. the deprecated simulator's penalty on peg distance and on sudden
+    depreciation. update() applies one batched TD step: the TD errors of all
+    environments landing in the same (state, action) cell are averaged, so the
+    step size does not grow with the number of environments.
+
+    Attributes:
+        q (np.ndarray): Q-values of shape (n_states, n_actions).
+        visits (np.ndarray): Number of updates per (state, action) cell.
+        edges (tuple): Bin edges of the deviation, fee level and reward level features.
+        fee_step, reward_step (float): Size of one fee/reward action.
+        alpha (float): Learning rate.
+        gamma (float): Discount factor.
+        epsilon (float): Exploration rate.
+        drop_penalty (float): Weight of the depreciation penalty.
+        rng (np.random.Generator): Source of exploration.
+    """
+
+    def __init__(self, deviation_edges=DEVIATION_EDGES, fee_edges=LEVEL_EDGES, reward_edges=LEVEL_EDGES,
+                 fee_step=0.05, reward_step=0.05, alpha=0.05, gamma=0.9, epsilon=0.1, drop_penalty=1.0, seed=None):
+        """
+        Initialize an all-zero Q-table on the given grid.
+
+        Parameters:
+            deviation_edges, fee_edges, reward_edges (iterable):
+                Increasing bin edges of each feature; n edges make n + 1 bins.
+            fee_step (float): Fee change of one fee action, per product.
+            reward_step (float): Reward change of one reward action, per product.
+            alpha (float): Learning rate.
+            gamma (float): Discount factor.
+            epsilon (float): Exploration rate.
+            drop_penalty (float): Weight of the depreciation penalty in the reward.
+            seed (int or np.random.SeedSequence): Seed of the exploration generator.
+        """
+        self.edges = tuple(np.asarray(edges, dtype=np.float64)
+                           for edges in (deviation_edges, fee_edges, reward_edges))
+        for edges in self.edges:
+            if np.any(np.diff(edges) <= 0):
+                raise ValueError("Bin edges must be strictly increasing")
+        self.grid_shape = tuple(len(edges) + 1 for edges in self.edges)
+        self.n_states = int(np.prod(self.grid_shape))
+        self.actions = np.array(ACTIONS, dtype=np.float64)
+        self.q = np.zeros((self.n_states, len(ACTIONS)))
+        self.visits = np.zeros((self.n_states, len(ACTIONS)), dtype=np.int64)
+        self.fee_step = fee_step
+        self.reward_step = reward_step
+        self.alpha = alpha
+        self.gamma = gamma
+        self.epsilon = epsilon
+        self.drop_penalty = drop_penalty
+        self.rng = np.random.default_rng(seed)
+
+    def observe(self, state, n_products):
+        """
+        Return the grid state index of every environment.
+
+        Parameters:
+            state (np.ndarray): Compact state of shape (STATE_SIZE, ...) with
+                up-to-date fee and reward totals.
+            n_products (int): Number of products summed into the totals.
+
+        Returns:
+            np.ndarray: int64 state indices of shape state.shape[1:].
+        """
+        price, target = state[PRICE], state[TARGET]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            features = (
+                (price - target) / target,
+                state[FEE_TOTAL] / n_products,
+                state[REWARD_TOTAL] / n_products,
+            )
+        # NaN (e.g. a zero target) falls into the top bin
+        bins = [np.digitize(feature, edges) for feature, edges in zip(features, self.edges)]
+        return np.ravel_multi_index(bins, self.grid_shape)
+
+    def act(self, states, explore=True):
+        """
+        Pick an action per environment: greedy, or uniformly random with
+        probability epsilon when exploring. Ties go to the first best action.
+
+        Returns:
+            np.ndarray: int64 action indices shaped like states.
+        """
+        actions = np.argmax(self.q[states], axis=-1)
+        if explore and self.epsilon > 0:
+            random = self.rng.random(states.shape) < self.epsilon
+            actions[random] = self.rng.integers(len(ACTIONS), size=int(random.sum()))
+        return actions
+
+    def apply(self, actions, fees, rewards, low=0.0, high=5.0):
+        """
+        Apply actions to (products, ...) fee and reward arrays in place,
+        clamped to [low, high] as in the PID update.
+        """
+        directions = self.actions[actions]
+        fees += self.fee_step * directions[..., 0]
+        rewards += self.reward_step * directions[..., 1]
+        np.clip(fees, low, high, out=fees)
+        np.clip(rewards, low, high, out=rewards)
+
+    def reward(self, state, prev_price):
+        """
+        Return the reward of arriving at state from prices prev_price.
+        """
+        price, target = state[PRICE], state[TARGET]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            deviation = np.abs(price - target) / target
+            drop = np.where(prev_price > 0, np.maximum(1.0 - price / prev_price, 0.0), 0.0)
+        return -deviation - self.drop_penalty * drop
+
+    def update(self, states, actions, rewards, next_states, done=False):
+        """
+        One batched Q-learning step over all environments.
+
+        Parameters:
+            states, actions, next_states (np.ndarray): Indices of the transitions.
+            rewards (np.ndarray): Rewards of the transitions.
+            done (bool): Whether next_states are terminal (no bootstrap).
+
+        Returns:
+            float: Mean absolute TD error of the batch.
+        """
+        cells = (states * len(ACTIONS) + actions).ravel()
+        target = rewards.ravel()
+        if not done:
+            target = target + self.gamma * self.q[next_states.ravel()].max(axis=1)
+        td = target - self.q.ravel()[cells]
+        counts = np.bincount(cells, minlength=self.q.size)
+        sums = np.bincount(cells, weights=td, minlength=self.q.size)
+        hit = counts > 0
+        q = self.q.ravel()
+        q[hit] += self.alpha * sums[hit] / counts[hit]
+        self.visits.ravel()[hit] += counts[hit]
+        return float(np.abs(td).mean())
+
+    def save(self, path):
+        """
+        Save the Q-table, visit counts, grid and hyperparameters to an .npz file.
+        """
+        np.savez(path, q=self.q, visits=self.visits, deviation_edges=self.edges[0], fee_edges=self.edges[1],
+                 reward_edges=self.edges[2], params=np.array([self.fee_step, self.reward_step, self.alpha,
+                                                                 self.gamma, self.epsilon, self.drop_penalty]))
+
+    @classmethod
+    def load(cls, path, seed=None):
+        """
+        Load a controller written by save().
+        """
+        with np.load(path) as data:
+            fee_step, reward_step, alpha, gamma, epsilon, drop_penalty = data["params"].tolist()
+            controller = cls(data["deviation_edges"], data["fee_edges"], data["reward_edges"],
+                             fee_step, reward_step, alpha, gamma, epsilon, drop_penalty, seed)
+            controller.q[...] = data["q"]
+            controller.visits[...] = data["visits"]
+        return controller
+
+
+def run_q_learning(controller, n_envs, time_steps=None, seed=None, learn=True, explore=True, model_type=None,
+                   universe=None, volume=10.0, liquidity=5.0):
+    """
+    Run one episode of n_envs parallel environments driven by the controller.
+
+    Every environment is an independent noisy path of every token, laid out
+    as in simulate_ensemble(): each step observes all (token, path) states,
+    picks and applies the fee/reward actions, advances the model with
+    predict_batch() and, when learning, updates the Q-table from the whole
+    batch of transitions. The controller replaces the PID and gradient update.
+
+    Parameters:
+        controller (QLearningController): Controller to run (and train).
+        n_envs (int): Number of parallel paths.
+        time_steps (int): Episode length (defaults to config.TIME_STEPS).
+        seed (int or np.random.SeedSequence): Seed of the per-path noise streams.
+        learn (bool): Update the Q-table.
+        explore (bool): Use epsilon-greedy actions (False: greedy policy).
+        model_type (str): Registered model name (defaults to config.MODEL_TYPE).
+        universe: TokenUniverse, spec path or spec dict of the simulated tokens.
+        volume (float): Market volume fed to the model.
+        liquidity (float): Market liquidity fed to the model.
+
+    Returns:
+        dict: "reward" (steps,) mean reward per step, "td_error" (steps,) mean
+        absolute TD error (NaN when not learning), final "price" and
+        "circulation" of shape (paths, tokens) and "mean_abs_deviation" (tokens,)
+        over the whole episode.
+    """
+    if time_steps is None:
+        time_steps = config.TIME_STEPS
+    model = create_model(config.MODEL_TYPE if model_type is None else model_type)
+    tokens = TokenState.from_universe(load_universe(universe), n_paths=n_envs, volume=volume, liquidity=liquidity)
+    state = tokens.state
+    noise = None
+    if model.stochastic:
+        noise = NoiseBlocks(config.NOISE_STD, tokens.price.shape, path_generators(seed, 0, n_envs),
+                            total_steps=time_steps)
+
+    n_products = len(tokens.products)
+    price_before = np.empty_like(tokens.price)
+    observation = controller.observe(state, n_products)
+    rewards = np.empty(time_steps)
+    td_errors = np.full(time_steps, np.nan)
+    deviation = np.zeros(tokens.price.shape[0])
+    for t in range(time_steps):
+        actions = controller.act(observation, explore)
+        controller.apply(actions, tokens.fees, tokens.rewards)
+        np.copyto(price_before, tokens.price)
+        tokens.update_totals()
+        model.predict_batch(state, None if noise is None else noise.next(), out=state)
+
+        reward = controller.reward(state, price_before)
+        next_observation = controller.observe(state, n_products)
+        if learn:
+            # The episode end is a time limit, not a terminal state, so it still bootstraps
+            td_errors[t] = controller.update(observation, actions, reward, next_observation)
+        rewards[t] = reward.mean()
+        deviation += np.abs(tokens.price - tokens.target).mean(axis=1) / tokens.target[:, 0]
+        observation = next_observation
+
+    return {
+        "token_names": tokens.token_names,
+        "reward": rewards,
+        "td_error": td_errors,
+        "price": tokens.price.T.copy(),
+        "circulation": tokens.circulation.T.copy(),
+        "mean_abs_deviation": deviation / max(time_steps, 1),
+    }
+
+
+def train_q_controller(controller=None, episodes=100, n_envs=1024, time_steps=None, seed=None,
+                       epsilon_decay=1.0, min_epsilon=0.01, **kwargs):
+    """
+    Train a controller over several episodes of parallel environments.
+
+    Episode e draws its noise from child e of the seed (a new controller
+    explores with child `episodes`), and epsilon is multiplied by
+    epsilon_decay after every episode (down to min_epsilon).
+
+    Parameters:
+        controller (QLearningController): Controller to train (a new one by default).
+        episodes (int): Number of episodes.
+        n_envs (int): Parallel paths per episode.
+        time_steps (int): Episode length (defaults to config.TIME_STEPS).
+        seed (int or np.random.SeedSequence): Root seed of the episodes.
+        epsilon_decay (float): Per-episode epsilon multiplier.
+        min_epsilon (float): Lower bound of the decayed epsilon.
+        **kwargs: Further run_q_learning() arguments (model_type, universe, ...).
+
+    Returns:
+        tuple: (controller, per-episode mean reward array).
+    """
+    *seeds, explore_seed = root_seed(seed).spawn(episodes + 1)
+    if controller is None:
+        controller = QLearningController(seed=explore_seed)
+    episode_rewards = np.empty(episodes)
+    for episode, episode_seed in enumerate(seeds):
+        result = run_q_learning(controller, n_envs, time_steps, seed=episode_seed, **kwargs)
+        episode_rewards[episode] = result["reward"].mean()
+        controller.epsilon = max(controller.epsilon * epsilon_decay, min_epsilon)
+    return controller, episode_rewards
@@ -0,0 +1,392 @@
+# src/database/analytics.py
+#
+# Read stored runs back as NumPy columns and maintain the run_summaries table.
+# Step rows are streamed with fetchmany() into preallocated (steps, tokens)
+# arrays; dashboards should read load_summaries(), which touches one small
+# row per (run, token) instead of scanning the step table.
+
+import sqlite3
+
+import numpy as np
+from config import config
+from src.database import database
+from src.models.registry import create_model
+from src.state import sum_products
+
+# Step columns of a database holding the default products; universes with other
+# products add their own fee_/reward_ columns (see stored_columns)
+RESULT_COLUMNS = database.result_columns()
+
+# Per-token metrics of summarize(), in run_summaries column order
+SUMMARY_COLUMNS = (
+    "steps", "tolerance", "final_price", "mean_abs_deviation", "max_abs_deviation", "rms_deviation",
+    "in_peg_share", "time_to_peg", "max_drawdown", "net_increase", "net_decrease", "minted", "burned",
+    "final_circulation", "min_collateral_ratio", "final_collateral_ratio",
+)
+
+# Rows fetched per fetchmany() call
+CHUNK_SIZE = 50_000
+
+
+def run_ids(db_path):
+    """
+    Return the ids of every stored run, in creation order.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        return [row[0] for row in conn.execute("SELECT run_id FROM simulation_runs ORDER BY run_id")]
+    finally:
+        conn.close()
+
+
+def _stored_columns(conn):
+    return tuple(
+        row[1] for row in conn.execute("PRAGMA table_info(simulation_results)")
+        if row[1] not in ("run_id", "token_name", "time_step")
+    )
+
+
+def stored_columns(db_path):
+    """
+    Return the step columns load_run() can read from a database, including
+    the fee_/reward_ columns of every product stored so far.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        return _stored_columns(conn)
+    finally:
+        conn.close()
+
+
+def _run_tokens(conn, run_id):
+    """
+    Return (token_names, {parameter: (tokens,) array}) for a run.
+
+    Runs stored before run_tokens existed fall back to the stored token names
+    and to the configured target and collateral of tokens with the same name
+    (NaN for unknown tokens).
+    """
+    rows = conn.execute(
+        "SELECT token_name, target_price, collateral, max_supply FROM run_tokens "
+        "WHERE run_id = ? ORDER BY token_index", (run_id,)
+    ).fetchall()
+    if not rows:
+        names = [row[0] for row in conn.execute(
+            "SELECT DISTINCT token_name FROM simulation_results WHERE run_id = ? ORDER BY token_name", (run_id,)
+        )]
+        rows = [
+            (name,) + tuple(config.TOKENS.get(name, {}).get(key, np.nan)
+                            for key in ("target_price", "collateral", "max_supply"))
+            for name in names
+        ]
+    token_names = [row[0] for row in rows]
+    values = np.array([row[1:] for row in rows], dtype=np.float64).reshape(len(rows), 3)
+    return token_names, {"target_price": values[:, 0], "collateral": values[:, 1], "max_supply": values[:, 2]}
+
+
+def load_run(db_path, run_id, columns=("price", "circulation"), chunk_size=CHUNK_SIZE):
+    """
+    Load a stored run into dense NumPy columns.
+
+    Each token's rows are read in time_step order along the primary key and
+    copied chunk by chunk (fetchmany) into preallocated arrays; steps
+    without a stored row are NaN.
+
+    Parameters:
+        db_path (str): SQLite database path.
+        run_id (int): Run to load.
+        columns (iterable): Step columns from stored_columns(); product
+            columns a run did not fill are NaN.
+        chunk_size (int): Rows per fetchmany() call.
+
+    Returns:
+        dict: "run_id", "token_names", "time_step" (steps,), one
+        (steps, tokens) array per requested column, and the (tokens,)
+        "target_price", "collateral" and "max_supply" of the run.
+    """
+    columns = tuple(columns)
+    conn = sqlite3.connect(db_path)
+    try:
+        unknown = set(columns) - set(_stored_columns(conn))
+        if unknown:
+            raise ValueError(f"Unknown result columns: {', '.join(sorted(unknown))}")
+        token_names, parameters = _run_tokens(conn, run_id)
+        last = conn.execute("SELECT MAX(time_step) FROM simulation_results WHERE run_id = ?", (run_id,)).fetchone()[0]
+        n_steps = 0 if last is None else last + 1
+        data = {name: np.full((n_steps, len(token_names)), np.nan) for name in columns}
+        query = (f"SELECT time_step, {', '.join(columns)} FROM simulation_results "
+                 "WHERE run_id = ? AND token_name = ? ORDER BY time_step")
+        for i, token_name in enumerate(token_names):
+            cursor = conn.execute(query, (run_id, token_name))
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                block = np.array(rows, dtype=np.float64)
+                steps = block[:, 0].astype(np.int64)
+                for k, name in enumerate(columns, 1):
+                    data[name][steps, i] = block[:, k]
+    finally:
+        conn.close()
+    result = {"run_id": run_id, "token_names": token_names, "time_step": np.arange(n_steps)}
+    result.update(data)
+    result.update(parameters)
+    return result
+
+
+def load_run_frame(db_path, run_id, columns=None, chunk_size=CHUNK_SIZE):
+    """
+    Load a stored run as a long pandas DataFrame with one row per (token, time step).
+
+    columns defaults to every stored column (see stored_columns).
+    """
+    try:
+        import pandas as pd
+    except ImportError as e:
+        raise ImportError("load_run_frame requires the pandas package") from e
+    if columns is None:
+        columns = stored_columns(db_path)
+    run = load_run(db_path, run_id, columns, chunk_size)
+    n_steps, n_tokens = len(run["time_step"]), len(run["token_names"])
+    frame = {
+        "run_id": np.full(n_steps * n_tokens, run_id),
+        "token_name": np.repeat(np.array(run["token_names"], dtype=object), n_steps),
+        "time_step": np.tile(run["time_step"], n_tokens),
+    }
+    frame.update({name: run[name].T.ravel() for name in columns})
+    return pd.DataFrame(frame).dropna(subset=list(columns), how="all").reset_index(drop=True)
+
+
+def minted_per_step(model, fees, rewards):
+    """
+    Return the gross tokens minted in every step of a run.
+
+    Row t of the fee and reward columns holds the values the model used in
+    time step t, so row t of the result is the amount minted in that step
+    (row 0, the initial state, mints nothing).
+
+    Parameters:
+        model (AbstractModel): Model of the run; its minted() rule is applied.
+        fees (list): (steps, tokens) arrays, one per product, in product order.
+        rewards (list): (steps, tokens) arrays, one per product, in product order.
+
+    Returns:
+        np.ndarray: (steps, tokens) minted amounts.
+    """
+    fees, rewards = np.asarray(fees, dtype=np.float64), np.asarray(rewards, dtype=np.float64)
+    fee_total = sum_products(fees, out=np.empty(fees.shape[1:]))
+    reward_total = sum_products(rewards, out=np.empty(rewards.shape[1:]))
+    minted = np.asarray(model.minted(fee_total, reward_total), dtype=np.float64)
+    minted[0] = 0.0
+    return minted
+
+
+def summarize(price, circulation, target_price, collateral, tolerance=None, minted=None):
+    """
+    Compute per-token summary metrics of one run.
+
+    Deviations are relative to the target, (price - target) / target. A step
+    is in peg when its absolute deviation is within tolerance. net_increase
+    and net_decrease total the per-step increases and decreases of
+    circulation, i.e. they split the net supply change of every step.
+    minted and burned are the gross amounts: the per-step minted amounts
+    (see minted_per_step) and, per step, minted - (circulation change). They
+    are NaN when minted is not given. The collateral ratio is
+    collateral / (price * circulation). NaN rows (steps not run or not
+    stored) are ignored.
+
+    Parameters:
+        price (np.ndarray): (steps, tokens) prices, row t being time step t.
+        circulation (np.ndarray): (steps, tokens) circulating supply.
+        target_price (np.ndarray): (tokens,) targets.
+        collateral (np.ndarray): (tokens,) collateral.
+        tolerance (float): Relative peg band (defaults to config.PEG_TOLERANCE).
+        minted (np.ndarray): Optional (steps, tokens) tokens minted per step.
+
+    Returns:
+        dict: SUMMARY_COLUMNS name -> (tokens,) array; time_to_peg is the
+        first in-peg time step, or -1 if the peg was never reached.
+    """
+    if tolerance is None:
+        tolerance = config.PEG_TOLERANCE
+    price = np.asarray(price, dtype=np.float64)
+    circulation = np.asarray(circulation, dtype=np.float64)
+    valid = ~np.isnan(price)
+    steps = valid.sum(axis=0)
+    # Row of the last stored step of every token
+    last = len(price) - 1 - np.argmax(valid[::-1], axis=0)
+    columns = np.arange(price.shape[1])
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        deviation = (price - target_price) / target_price
+        abs_deviation = np.abs(deviation)
+        in_peg = abs_deviation <= tolerance
+        running_max = np.fmax.accumulate(price, axis=0)
+        drawdown = np.where(running_max > 0, 1.0 - price / running_max, 0.0)
+        change = np.diff(circulation, axis=0)
+        ratio = collateral / (price * circulation)
+        if minted is None:
+            minted_total = burned_total = np.full(len(steps), np.nan)
+        else:
+            step_minted = np.asarray(minted, dtype=np.float64)[1:]
+            step_burned = step_minted - change
+            # Steps where the circulation change or the minted amount is unknown are skipped in both totals
+            known = ~np.isnan(step_burned)
+            minted_total = np.where(known, step_minted, 0.0).sum(axis=0)
+            burned_total = np.where(known, step_burned, 0.0).sum(axis=0)
+
+        summary = {
+            "steps": steps,
+            "tolerance": np.full(len(steps), float(tolerance)),
+            "final_price": price[last, columns],
+            "mean_abs_deviation": np.nanmean(abs_deviation, axis=0),
+            "max_abs_deviation": np.nanmax(abs_deviation, axis=0),
+            "rms_deviation": np.sqrt(np.nanmean(deviation ** 2, axis=0)),
+            "in_peg_share": in_peg.sum(axis=0) / steps,
+            "time_to_peg": np.where(in_peg.any(axis=0), np.argmax(in_peg, axis=0), -1),
+            "max_drawdown": np.nanmax(np.where(valid, drawdown, np.nan), axis=0),
+            "net_increase": np.nansum(np.maximum(change, 0.0), axis=0),
+            "net_decrease": np.nansum(np.maximum(-change, 0.0), axis=0),
+            "minted": minted_total,
+            "burned": burned_total,
+            "final_circulation": circulation[last, columns],
+            "min_collateral_ratio": np.nanmin(ratio, axis=0),
+            "final_collateral_ratio": ratio[last, columns],
+        }
+    return summary
+
+
+def store_summary(db_path, run_id, token_names, summary):
+    """
+    Write (or replace) the run_summaries rows of a run.
+
+    Parameters:
+        db_path (str): SQLite database path (must already be initialized).
+        run_id (int): Summarized run.
+        token_names (list): Token names, in summary order.
+        summary (dict): Output of summarize().
+    """
+    values = [summary[name].tolist() for name in SUMMARY_COLUMNS]
+    rows = [(run_id, token_name) + row for token_name, row in zip(token_names, zip(*values))]
+    # SQLite stores NaN as NULL
+    rows = [tuple(None if isinstance(v, float) and np.isnan(v) else v for v in row) for row in rows]
+    sql = (f"INSERT OR REPLACE INTO run_summaries (run_id, token_name, {', '.join(SUMMARY_COLUMNS)}) "
+           f"VALUES ({', '.join('?' * (len(SUMMARY_COLUMNS) + 2))})")
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            conn.executemany(sql, rows)
+    finally:
+        conn.close()
+
+
+def _run_model(db_path, run_id):
+    """
+    Return a default instance of a run's recorded model, or None if it is
+    unknown (e.g. 'legacy') or cannot be loaded.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        row = conn.execute("SELECT model_type FROM simulation_runs WHERE run_id = ?", (run_id,)).fetchone()
+    finally:
+        conn.close()
+    try:
+        return None if row is None else create_model(row[0])
+    except (ValueError, ImportError):
+        return None
+
+
+def summarize_run(db_path, run_id, tolerance=None, chunk_size=CHUNK_SIZE, model=None):
+    """
+    Summarize a stored run from its step rows and store the result.
+
+    The minted and burned totals apply the mint rule of model, by default a
+    fresh instance of the run's recorded model type (with its default
+    constants); they are NaN when the model is unknown.
+
+    Returns:
+        dict: The summarize() metrics plus "token_names".
+    """
+    if model is None:
+        model = _run_model(db_path, run_id)
+    products = [name[len("fee_"):] for name in stored_columns(db_path) if name.startswith("fee_")]
+    columns = ["price", "circulation"] + [f"fee_{prod}" for prod in products] + [f"reward_{prod}" for prod in products]
+    run = load_run(db_path, run_id, columns, chunk_size)
+    minted = None
+    # Product columns the run did not fill are NaN throughout
+    used = [prod for prod in products if not np.isnan(run[f"fee_{prod}"]).all()]
+    if model is not None and used:
+        minted = minted_per_step(model, [run[f"fee_{prod}"] for prod in used],
+                                 [run[f"reward_{prod}"] for prod in used])
+    summary = summarize(run["price"], run["circulation"], run["target_price"], run["collateral"], tolerance,
+                        minted)
+    store_summary(db_path, run_id, run["token_names"], summary)
+    summary["token_names"] = run["token_names"]
+    return summary
+
+
+def summarize_runs(db_path, tolerance=None, recompute=False, chunk_size=CHUNK_SIZE):
+    """
+    Precompute the summaries of every stored run that has none yet.
+
+    Runs written through DatabaseStage are summarized when they finish; this
+    backfills older runs (or recomputes all of them, e.g. for a new tolerance).
+
+    Returns:
+        list: Ids of the runs summarized by this call.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        query = "SELECT DISTINCT run_id FROM simulation_results"
+        if not recompute:
+            query += " WHERE run_id NOT IN (SELECT run_id FROM run_summaries)"
+        pending = [row[0] for row in conn.execute(query + " ORDER BY run_id")]
+    finally:
+        conn.close()
+    for run_id in pending:
+        summarize_run(db_path, run_id, tolerance, chunk_size)
+    return pending
+
+
+def load_summaries(db_path, run_ids=None, as_frame=False):
+    """
+    Load the precomputed run summaries.
+
+    Parameters:
+        db_path (str): SQLite database path.
+        run_ids (iterable): Optional runs to load (defaults to all).
+        as_frame (bool): Return a pandas DataFrame instead of NumPy columns.
+
+    Returns:
+        dict: "run_id" and "token_name" arrays plus one array per
+        SUMMARY_COLUMNS entry (NULL read as NaN), one element per (run, token);
+        or the same columns as a DataFrame.
+    """
+    query = f"SELECT run_id, token_name, {', '.join(SUMMARY_COLUMNS)} FROM run_summaries"
+    params = ()
+    if run_ids is not None:
+        run_ids = list(run_ids)
+        query += f" WHERE run_id IN ({', '.join('?' * len(run_ids))})"
+        params = tuple(run_ids)
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute(query + " ORDER BY run_id, token_name", params).fetchall()
+    finally:
+        conn.close()
+
+    columns = {
+        "run_id": np.array([row[0] for row in rows], dtype=np.int64),
+        "token_name": np.array([row[1] for row in rows], dtype=object),
+    }
+    values = np.array([row[2:] for row in rows], dtype=np.float64).reshape(len(rows), len(SUMMARY_COLUMNS))
+    for k, name in enumerate(SUMMARY_COLUMNS):
+        columns[name] = values[:, k]
+    for name in ("steps", "time_to_peg"):
+        columns[name] = columns[name].astype(np.int64)
+    if as_frame:
+        try:
+            import pandas as pd
+        except ImportError as e:
+            raise ImportError("as_frame=True requires the pandas package") from e
+        return pd.DataFrame(columns)
+    return columns
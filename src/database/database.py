@@ -1,48 +1,633 @@
 # src/database/database.py
 
 import sqlite3
+import itertools
 import json
 import os
+import multiprocessing
+import queue
+import traceback
+import numpy as np
 from config import config
 
+# Products with fee_<product>/reward_<product> columns in a new database; the
+# columns of other products are added when a run first stores them (see prepare_products)
+PRODUCTS = ("minting", "staking", "transfers")
+
+# Used when no schema file is found; kept in sync with schema/schema.sql
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS simulation_runs (
+        run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        model_type TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE IF NOT EXISTS simulation_results (
+        run_id INTEGER NOT NULL,
+        token_name TEXT NOT NULL,
+        time_step INTEGER NOT NULL,
+        price REAL NOT NULL,
+        circulation REAL NOT NULL,
+        fee_minting REAL,
+        fee_staking REAL,
+        fee_transfers REAL,
+        reward_minting REAL,
+        reward_staking REAL,
+        reward_transfers REAL,
+        PRIMARY KEY (run_id, token_name, time_step)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_simulation_results_token_step
+        ON simulation_results (token_name, time_step);
+    CREATE TABLE IF NOT EXISTS run_tokens (
+        run_id INTEGER NOT NULL,
+        token_name TEXT NOT NULL,
+        token_index INTEGER NOT NULL,
+        target_price REAL NOT NULL,
+        collateral REAL NOT NULL,
+        max_supply REAL NOT NULL,
+        PRIMARY KEY (run_id, token_name)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS run_summaries (
+        run_id INTEGER NOT NULL,
+        token_name TEXT NOT NULL,
+        steps INTEGER NOT NULL,
+        tolerance REAL NOT NULL,
+        final_price REAL,
+        mean_abs_deviation REAL,
+        max_abs_deviation REAL,
+        rms_deviation REAL,
+        in_peg_share REAL,
+        time_to_peg INTEGER,
+        max_drawdown REAL,
+        net_increase REAL,
+        net_decrease REAL,
+        minted REAL,
+        burned REAL,
+        final_circulation REAL,
+        min_collateral_ratio REAL,
+        final_collateral_ratio REAL,
+        PRIMARY KEY (run_id, token_name)
+    ) WITHOUT ROWID;
+'''
+
+def result_columns(products=PRODUCTS):
+    """
+    Return the simulation_results value columns storing the given products.
+    """
+    return (
+        ("price", "circulation")
+        + tuple(f"fee_{prod}" for prod in products)
+        + tuple(f"reward_{prod}" for prod in products)
+    )
+
+def insert_step_sql(products=PRODUCTS):
+    """
+    Return the INSERT statement of a step row storing the given products.
+    """
+    columns = ("run_id", "token_name", "time_step") + result_columns(products)
+    return f"INSERT INTO simulation_results ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+
+INSERT_STEP_SQL = insert_step_sql()
+
+# Token name given to rows of the oldest legacy layout, which stored a single token and no token_name column
+LEGACY_TOKEN_NAME = "legacy"
+
+# run_summaries columns renamed since they were first written: the first minted/burned
+# columns held the positive and negative parts of the net circulation change
+RENAMED_SUMMARY_COLUMNS = {"minted": "net_increase", "burned": "net_decrease"}
+
+# run_summaries columns added since the table was first written, with their types
+ADDED_SUMMARY_COLUMNS = {"minted": "REAL", "burned": "REAL"}
+
+# Columns a legacy simulation_results table must have to be migrated
+LEGACY_COLUMNS = ("id", "time_step", "price", "circulation", "fees", "rewards")
+
 def init_db(db_path, schema_path=config.SCHEMA_PATH):
     """
     Initialize the SQLite database using the provided SQL schema file.
+
+    A results table in the legacy JSON layout is migrated to the columnar
+    layout first (see migrate_legacy_results). run_summaries tables from
+    before the net_increase/net_decrease rename get their net columns renamed
+    (see RENAMED_SUMMARY_COLUMNS), and missing newer columns are added
+    (see ADDED_SUMMARY_COLUMNS).
     """
+    migrate_legacy_results(db_path, schema_path)
     conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
+    cursor.executescript(_read_schema(schema_path))
+    summary_columns = [row[1] for row in cursor.execute("PRAGMA table_info(run_summaries)")]
+    for old_name, new_name in RENAMED_SUMMARY_COLUMNS.items():
+        if old_name in summary_columns and new_name not in summary_columns:
+            cursor.execute(f"ALTER TABLE run_summaries RENAME COLUMN {old_name} TO {new_name}")
+    summary_columns = [row[1] for row in cursor.execute("PRAGMA table_info(run_summaries)")]
+    for name, sql_type in ADDED_SUMMARY_COLUMNS.items():
+        if name not in summary_columns:
+            cursor.execute(f"ALTER TABLE run_summaries ADD COLUMN {name} {sql_type}")
+    conn.commit()
+    conn.close()
+
+def _read_schema(schema_path):
     if os.path.exists(schema_path):
         with open(schema_path, "r") as f:
-            schema = f.read()
-        cursor.executescript(schema)
-    else:
-        # Fallback if no schema file found
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS simulation_results (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                time_step INTEGER NOT NULL,
-                token_name TEXT NOT NULL,
-                price REAL NOT NULL,
-                circulation REAL NOT NULL,
-                fees TEXT NOT NULL,
-                rewards TEXT NOT NULL,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+            return f.read()
+    # Fallback if no schema file found
+    return SCHEMA
+
+def _schema_statements(schema):
+    """
+    Split a schema script into its statements (semicolons inside comments do not split).
+    """
+    statement = ""
+    for line in schema.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            yield statement
+            statement = ""
+
+def step_row(run_id, time_step, token_name, price, circulation, fees, rewards, products=PRODUCTS):
+    """
+    Flatten a simulation step into a row matching insert_step_sql(products).
+    """
+    return (
+        (run_id, token_name, time_step, price, circulation)
+        + tuple(fees[prod] for prod in products)
+        + tuple(rewards[prod] for prod in products)
+    )
+
+def prepare_products(db_path, products):
+    """
+    Make simulation_results able to store runs with the given products.
+
+    Products without columns yet get nullable fee_<product>/reward_<product>
+    columns; product columns a run does not fill stay NULL.
+
+    Raises:
+        ValueError: If a product name is not a plain ASCII identifier, or if
+            the database was created with NOT NULL product columns that the
+            run cannot fill.
+    """
+    invalid = [prod for prod in products if not (prod.isascii() and prod.isidentifier())]
+    if invalid:
+        raise ValueError(f"Product names must be plain identifiers to be stored: {', '.join(invalid)}")
+    conn = sqlite3.connect(db_path)
+    try:
+        info = conn.execute("PRAGMA table_info(simulation_results)").fetchall()
+        existing = {row[1] for row in info}
+        wanted = set(result_columns(products))
+        unfilled = [
+            row[1] for row in info
+            if row[3] and row[1].startswith(("fee_", "reward_")) and row[1] not in wanted
+        ]
+        if unfilled:
+            raise ValueError(
+                f"{db_path} requires product columns {', '.join(unfilled)}, which a run with products "
+                f"{', '.join(products)} cannot fill; use a new database for this token universe"
             )
-        ''')
-    conn.commit()
+        with conn:
+            for column in result_columns(products):
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE simulation_results ADD COLUMN {column} REAL")
+    finally:
+        conn.close()
+
+def delete_run(db_path, run_id):
+    """
+    Remove a run and everything stored under it.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            for table in ("simulation_results", "run_tokens", "run_summaries", "simulation_runs"):
+                conn.execute(f"DELETE FROM {table} WHERE run_id = ?", (run_id,))
+    finally:
+        conn.close()
+
+def create_run(db_path, model_type=config.MODEL_TYPE):
+    """
+    Register a new simulation run and return its run_id.
+    """
+    conn = sqlite3.connect(db_path)
+    with conn:
+        run_id = conn.execute(
+            "INSERT INTO simulation_runs (model_type) VALUES (?)", (model_type,)
+        ).lastrowid
     conn.close()
+    return run_id
 
-def store_simulation_step(db_path, time_step, token_name, price, circulation, fees, rewards):
+def store_simulation_step(db_path, time_step, token_name, price, circulation, fees, rewards, run_id=0):
     """
     Store a simulation step's results in the database.
     """
     conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
-    fees_json = json.dumps(fees)
-    rewards_json = json.dumps(rewards)
-    cursor.execute('''
-        INSERT INTO simulation_results (time_step, token_name, price, circulation, fees, rewards)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (time_step, token_name, price, circulation, fees_json, rewards_json))
+    cursor.execute(INSERT_STEP_SQL, step_row(run_id, time_step, token_name, price, circulation, fees, rewards))
     conn.commit()
     conn.close()
+
+def migrate_legacy_results(db_path, schema_path=config.SCHEMA_PATH, batch_size=10_000):
+    """
+    Convert a legacy simulation_results table (JSON-encoded fees/rewards) to
+    the columnar layout.
+
+    Legacy rows carry no run id, so runs are recovered from the insertion
+    order: a token's time_step dropping back to or below its previous value
+    marks the start of a new run. Every recovered run is registered in
+    simulation_runs with model_type 'legacy'. Tables from before the
+    token_name column (single-token runs) store their rows under
+    LEGACY_TOKEN_NAME. The JSON is decoded exactly once here, and the whole
+    migration runs in a single transaction.
+
+    Returns:
+        int: Number of migrated rows (0 if there was nothing to migrate).
+    """
+    conn = sqlite3.connect(db_path)
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(simulation_results)")]
+    if "fees" not in columns:
+        conn.close()
+        return 0
+    missing = [column for column in LEGACY_COLUMNS if column not in columns]
+    if missing:
+        conn.close()
+        raise ValueError(
+            f"Cannot migrate the legacy simulation_results table of {db_path}: missing column(s) {', '.join(missing)}"
+        )
+    token_column = "token_name" if "token_name" in columns else "? AS token_name"
+    token_params = () if "token_name" in columns else (LEGACY_TOKEN_NAME,)
+
+    # Manage the transaction explicitly: DDL would otherwise auto-commit
+    conn.isolation_level = None
+    migrated = 0
+    try:
+        conn.execute("BEGIN")
+        conn.execute("ALTER TABLE simulation_results RENAME TO simulation_results_legacy")
+        for statement in _schema_statements(_read_schema(schema_path)):
+            conn.execute(statement)
+
+        run_ids = {}
+        last_step = {}
+        run_for_index = []
+        read_cursor = conn.execute(
+            f"SELECT time_step, {token_column}, price, circulation, fees, rewards "
+            "FROM simulation_results_legacy ORDER BY id",
+            token_params
+        )
+        while True:
+            rows = read_cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            batch = []
+            for time_step, token_name, price, circulation, fees, rewards in rows:
+                run_index = run_ids.get(token_name, -1)
+                if token_name not in last_step or time_step <= last_step[token_name]:
+                    run_index += 1
+                    run_ids[token_name] = run_index
+                    if run_index == len(run_for_index):
+                        run_for_index.append(
+                            conn.execute("INSERT INTO simulation_runs (model_type) VALUES ('legacy')").lastrowid
+                        )
+                last_step[token_name] = time_step
+                batch.append(step_row(
+                    run_for_index[run_index], time_step, token_name, price, circulation,
+                    json.loads(fees), json.loads(rewards)
+                ))
+            conn.executemany(INSERT_STEP_SQL, batch)
+            migrated += len(batch)
+        conn.execute("DROP TABLE simulation_results_legacy")
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    return migrated
+
+
+def history_block(history, products, start, stop):
+    """
+    Return the stored columns of history rows start..stop-1 as a compact
+    (steps, tokens, columns) array in result_columns(products) order.
+    """
+    missing = [name for name in result_columns(products) if name not in history.fields]
+    if missing:
+        raise ValueError(f"The history has no {', '.join(missing)} field(s) to store")
+    columns = [history.fields.index(name) for name in result_columns(products)]
+    return history.data[start:stop][:, :, columns]
+
+
+class SimulationWriter:
+    """
+    Persistent, batched writer for simulation results.
+
+    Unlike store_simulation_step(), which opens a connection and commits once
+    per row, the writer keeps a single connection open, buffers rows in memory
+    and inserts them with executemany() inside one transaction per batch.
+    The connection runs in WAL mode with synchronous=NORMAL so a commit does
+    not wait for a full fsync of the database file.
+
+    Usage:
+        with SimulationWriter(db_path, create_run(db_path)) as writer:
+            writer.store_simulation_step(t, "alpha", price, circulation, fees, rewards)
+
+    Attributes:
+        db_path (str): Path to the SQLite database.
+        run_id (int): Run the stored steps belong to.
+        batch_size (int): Number of buffered rows that triggers a flush.
+        products (tuple): Products whose fees and rewards are stored.
+    """
+
+    def __init__(self, db_path, run_id, batch_size=config.DB_BATCH_SIZE, products=PRODUCTS):
+        """
+        Open the connection and configure it for bulk inserts.
+
+        Parameters:
+            db_path (str): Path to the SQLite database (must already be initialized).
+            run_id (int): Run the stored steps belong to (see create_run).
+            batch_size (int): Number of buffered rows that triggers a flush.
+            products (iterable): Products whose fees and rewards are stored;
+                other than PRODUCTS they need prepare_products() first.
+        """
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        self.db_path = db_path
+        self.run_id = run_id
+        self.batch_size = batch_size
+        self.products = tuple(products)
+        self._insert_sql = insert_step_sql(self.products)
+        self._rows = []
+        self._conn = sqlite3.connect(db_path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+
+    def store_simulation_step(self, time_step, token_name, price, circulation, fees, rewards):
+        """
+        Buffer a simulation step's results, flushing once a full batch is pending.
+        """
+        self._rows.append(step_row(self.run_id, time_step, token_name, price, circulation, fees, rewards,
+                                   self.products))
+        if len(self._rows) >= self.batch_size:
+            self.flush()
+
+    def store_tokens(self, time_step, tokens):
+        """
+        Buffer one row per token of a single-run TokenState.
+        """
+        index = [tokens.products.index(prod) for prod in self.products]
+        fees = tokens.fees[index].T.tolist()
+        rewards = tokens.rewards[index].T.tolist()
+        for i, (token_name, price, circulation) in enumerate(
+                zip(tokens.token_names, tokens.price.tolist(), tokens.circulation.tolist())):
+            self._rows.append((self.run_id, token_name, time_step, price, circulation, *fees[i], *rewards[i]))
+        if len(self._rows) >= self.batch_size:
+            self.flush()
+
+    def store_run_tokens(self, token_names, target_price, collateral, max_supply):
+        """
+        Record the per-token parameters of the run (written immediately).
+
+        Parameters:
+            token_names (list): Token names, in index order.
+            target_price, collateral, max_supply (array-like): One value per token.
+        """
+        rows = [
+            (self.run_id, name, i, float(target), float(coll), float(supply))
+            for i, (name, target, coll, supply) in enumerate(zip(token_names, target_price, collateral, max_supply))
+        ]
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO run_tokens "
+                "(run_id, token_name, token_index, target_price, collateral, max_supply) VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def store_history(self, history, start, stop):
+        """
+        Buffer the rows of time steps start..stop-1 of a SimulationHistory.
+        """
+        self.store_block(history_block(history, self.products, start, stop), start, history.token_names)
+
+    def store_block(self, block, start, token_names):
+        """
+        Buffer the rows of a history_block() starting at time step start.
+
+        Rows are zipped from whole columns instead of being built step by
+        step, which makes the conversion about three times cheaper.
+        """
+        steps, n_tokens, n_columns = block.shape
+        columns = block.reshape(steps * n_tokens, n_columns).T.tolist()
+        time_steps = np.repeat(np.arange(start, start + steps), n_tokens).tolist()
+        self._rows.extend(zip(itertools.repeat(self.run_id), list(token_names) * steps, time_steps, *columns))
+        if len(self._rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Write all buffered rows in a single transaction.
+        """
+        if not self._rows:
+            return
+        with self._conn:
+            self._conn.executemany(self._insert_sql, self._rows)
+        self._rows = []
+
+    def close(self):
+        """
+        Flush any pending rows and close the connection.
+        """
+        if self._conn is None:
+            return
+        try:
+            self.flush()
+        finally:
+            self._conn.close()
+            self._conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _write_queued(db_path, run_id, batch_size, products, requests, replies):
+    """
+    Body of a BackgroundWriter process: apply queued (method, args) calls to a
+    SimulationWriter until None arrives, then close it.
+
+    Each flush is acknowledged with ("done", None). The first failure is sent
+    as ("error", traceback text), and every later call is discarded.
+    """
+    failed = False
+    writer = None
+    try:
+        writer = SimulationWriter(db_path, run_id, batch_size, products)
+    except BaseException:
+        failed = True
+        replies.send(("error", traceback.format_exc()))
+    while True:
+        item = requests.get()
+        if item is None:
+            break
+        if failed:
+            continue
+        method, args = item
+        try:
+            getattr(writer, method)(*args)
+            if method == "flush":
+                replies.send(("done", None))
+        except BaseException:
+            failed = True
+            replies.send(("error", traceback.format_exc()))
+    if writer is not None:
+        try:
+            writer.close()
+        except BaseException:
+            if not failed:
+                replies.send(("error", traceback.format_exc()))
+    replies.close()
+
+
+class BackgroundWriter:
+    """
+    SimulationWriter running in a separate process behind a bounded queue.
+
+    The caller only copies each history block into a compact array and
+    enqueues it; converting rows and inserting them happens in the writer
+    process, which owns the SQLite connection. Both steps hold the GIL for
+    most of their time, so they run in a separate process: in the
+    simulation's own process they would slow the step loop down by as much
+    as they save.
+    On a machine with a single CPU the process cannot overlap the step loop
+    either, and writing costs about the same as with a SimulationWriter.
+
+    When max_pending blocks are queued the caller waits (backpressure)
+    instead of buffering without bound. A failure in the writer process is
+    raised to the caller, as a RuntimeError carrying the writer's traceback,
+    by the next store, flush() or close(); blocks queued after the failure
+    are discarded.
+
+    Usage:
+        with BackgroundWriter(db_path, create_run(db_path)) as writer:
+            writer.store_history(history, start, stop)
+
+    Attributes:
+        db_path (str): Path to the SQLite database.
+        run_id (int): Run the stored steps belong to.
+        batch_size (int): Rows per insert transaction in the writer process.
+        max_pending (int): Queued blocks before store calls wait.
+        products (tuple): Products whose fees and rewards are stored.
+    """
+
+    # Seconds between checks for a failed writer while waiting on the queue
+    POLL_INTERVAL = 0.1
+
+    def __init__(self, db_path, run_id, batch_size=config.DB_BATCH_SIZE, max_pending=config.DB_QUEUE_SIZE,
+                 products=PRODUCTS):
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        if max_pending < 1:
+            raise ValueError("max_pending must be at least 1")
+        self.db_path = db_path
+        self.run_id = run_id
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.products = tuple(products)
+        self._queue = multiprocessing.Queue(maxsize=max_pending)
+        self._replies, replies = multiprocessing.Pipe(duplex=False)
+        self._error = None
+        self._closed = False
+        self._process = multiprocessing.Process(
+            target=_write_queued, name=f"SimulationWriter-{run_id}", daemon=True,
+            args=(db_path, run_id, batch_size, self.products, self._queue, replies),
+        )
+        self._process.start()
+        replies.close()
+
+    def _receive(self, timeout=0):
+        """
+        Read one reply if available within timeout; return its kind or None.
+        """
+        try:
+            if not self._replies.poll(timeout):
+                return None
+            kind, payload = self._replies.recv()
+        except (EOFError, OSError):
+            # The process closed its end: it has finished or died
+            return None
+        if kind == "error" and self._error is None:
+            self._error = payload
+        return kind
+
+    def _check(self):
+        while self._error is None and self._receive() is not None:
+            pass
+        if self._error is None and not self._closed and not self._process.is_alive():
+            self._error = f"the writer process exited with code {self._process.exitcode}"
+        if self._error is not None:
+            raise RuntimeError(f"Background database writer for run {self.run_id} failed:\n{self._error}")
+
+    def _put(self, item):
+        if self._closed:
+            raise RuntimeError("BackgroundWriter is closed")
+        while True:
+            self._check()
+            try:
+                self._queue.put(item, timeout=self.POLL_INTERVAL)
+                return
+            except queue.Full:
+                continue
+
+    def store_history(self, history, start, stop):
+        """
+        Queue the rows of time steps start..stop-1 of a SimulationHistory.
+        """
+        self.store_block(history_block(history, self.products, start, stop), start, history.token_names)
+
+    def store_block(self, block, start, token_names):
+        """
+        Queue the rows of a history_block() starting at time step start.
+        """
+        self._put(("store_block", (block, start, list(token_names))))
+
+    def store_run_tokens(self, token_names, target_price, collateral, max_supply):
+        """
+        Queue the per-token parameters of the run (see SimulationWriter.store_run_tokens).
+        """
+        self._put(("store_run_tokens", (list(token_names), [float(v) for v in target_price],
+                                        [float(v) for v in collateral], [float(v) for v in max_supply])))
+
+    def flush(self):
+        """
+        Wait until every queued block is written and committed.
+        """
+        self._put(("flush", ()))
+        while self._receive(self.POLL_INTERVAL) != "done":
+            self._check()
+
+    def close(self):
+        """
+        Write all queued blocks, stop the writer process and close its connection.
+        """
+        if self._closed:
+            return
+        try:
+            self._put(None)
+        except RuntimeError:
+            self._process.terminate()
+            raise
+        finally:
+            self._closed = True
+            self._process.join()
+            while self._error is None and self._receive() is not None:
+                pass
+            self._queue.close()
+            self._replies.close()
+        if self._error is None and self._process.exitcode != 0:
+            self._error = f"the writer process exited with code {self._process.exitcode}"
+        if self._error is not None:
+            raise RuntimeError(f"Background database writer for run {self.run_id} failed:\n{self._error}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,245 @@
+# src/differentiable.py
+#
+# Differentiable (torch, CPU) version of the nudge + PID step loop for
+# gradient-based calibration. The noise is reparameterized as
+# NOISE_STD * eps with fixed standard-normal draws eps, so a peg-tracking loss
+# over the whole horizon can be backpropagated to the PID gains, the learning
+# rate and the NudgeModel constants in one pass, instead of sweeping them.
+
+import numpy as np
+import torch
+import torch.nn as nn
+from config import config
+from src.models.nudge_model import NudgeModel
+from src.noise import NoiseBlocks, path_generators, root_seed
+from src.universe import load_universe
+
+# Config knobs the differentiable loop depends on
+CONFIG_PARAMETERS = ("K_P", "K_I", "K_D", "LEARNING_RATE", "NOISE_STD")
+
+# NudgeModel constants the differentiable loop depends on
+MODEL_PARAMETERS = (
+    "lambda_nudge", "k_fee", "k_reward", "k_market", "k_circ", "k_collateral",
+    "mint_factor_reward", "mint_factor_fee", "burn_surplus_pct", "burn_deficit_pct",
+)
+
+# Per-token (products, tokens) coefficient matrices of the gradient step
+COEFFICIENT_PARAMETERS = ("fees_coefs", "rewards_coefs")
+
+# Parameters calibrated by default
+CALIBRATION_PARAMETERS = (
+    "K_P", "K_I", "K_D", "LEARNING_RATE",
+    "lambda_nudge", "k_fee", "k_reward", "k_market", "k_circ", "k_collateral",
+)
+
+
+class DifferentiableSimulation(nn.Module):
+    """
+    The simulate_ensemble() step loop for the nudge model, written in torch.
+
+    Every step runs the PID update, the gradient step and [0, 5] clamp of
+    fees and rewards, and the NudgeModel price/supply update for all
+    (token, path) pairs, in float64 and in the same operation order as the
+    NumPy engine, so with the same noise it reproduces simulate_ensemble().
+    The clamps (fees, rewards, zero price floor, burn thresholds) are kept
+    exact; their gradients are zero where they are active.
+
+    Calibrated parameters use a log-scale parametrization, value =
+    initial * exp(theta) with theta starting at 0: signs are preserved and an
+    optimizer step changes each parameter by a relative amount, whatever its
+    magnitude (k_circ is 1e-9, LEARNING_RATE 1e-2).
+
+    Attributes:
+        names (tuple): Calibrated parameter names.
+        theta (nn.ParameterDict): Log-scale of every calibrated parameter.
+        token_names (list): Token names, in index order.
+    """
+
+    def __init__(self, parameters=CALIBRATION_PARAMETERS, params=None, universe=None, volume=10.0,
+                 liquidity=5.0):
+        """
+        Parameters:
+            parameters (iterable): Names to calibrate, from CONFIG_PARAMETERS,
+                MODEL_PARAMETERS and COEFFICIENT_PARAMETERS.
+            params (dict): Optional starting values overriding config and the
+                NudgeModel defaults (e.g. a previous calibration).
+            universe: TokenUniverse, spec path or spec dict of the simulated tokens.
+            volume (float): Market volume fed to the model.
+            liquidity (float): Market liquidity fed to the model.
+        """
+        super().__init__()
+        known = CONFIG_PARAMETERS + MODEL_PARAMETERS + COEFFICIENT_PARAMETERS
+        self.names = tuple(parameters)
+        unknown = (set(self.names) | set(params or {})) - set(known)
+        if unknown:
+            raise ValueError(f"Unknown simulation parameters: {', '.join(sorted(unknown))}")
+
+        universe = load_universe(universe)
+        self.token_names = list(universe.token_names)
+        model = NudgeModel()
+        initial = {name: getattr(config, name) for name in CONFIG_PARAMETERS}
+        initial.update({name: getattr(model, name) for name in MODEL_PARAMETERS})
+        initial.update({name: getattr(universe, name) for name in COEFFICIENT_PARAMETERS})
+        initial.update(params or {})
+        for name, value in initial.items():
+            self.register_buffer("initial_" + name, torch.as_tensor(np.array(value, dtype=np.float64)))
+        self.theta = nn.ParameterDict({
+            name: nn.Parameter(torch.zeros_like(getattr(self, "initial_" + name))) for name in self.names
+        })
+
+        def column(values):
+            return torch.as_tensor(np.array(values, dtype=np.float64))[:, None]
+
+        # Initial state, shaped (tokens, 1) and (products, tokens, 1) to broadcast over paths
+        self.register_buffer("price0", column(universe.initial_price))
+        self.register_buffer("circulation0", column(universe.initial_circulation))
+        self.register_buffer("target", column(universe.target_price))
+        self.register_buffer("collateral", column(universe.collateral))
+        self.register_buffer("max_supply", column(universe.max_supply))
+        self.register_buffer("fees0", torch.as_tensor(np.array(universe.fees))[:, :, None])
+        self.register_buffer("rewards0", torch.as_tensor(np.array(universe.rewards))[:, :, None])
+        self.market = float(volume + liquidity)
+
+    def value(self, name):
+        """
+        Return the current value of a parameter as a tensor.
+        """
+        initial = getattr(self, "initial_" + name)
+        if name in self.theta:
+            return initial * torch.exp(self.theta[name])
+        return initial
+
+    def values(self):
+        """
+        Return every parameter as plain numbers (matrices as NumPy arrays).
+
+        The scalar entries can be passed as params to simulate_ensemble() or
+        run_sweep().
+        """
+        names = CONFIG_PARAMETERS + MODEL_PARAMETERS + COEFFICIENT_PARAMETERS
+        values = {name: self.value(name).detach().numpy().copy() for name in names}
+        return {name: float(value) if value.ndim == 0 else value for name, value in values.items()}
+
+    def draw_noise(self, n_paths, time_steps, seed=None):
+        """
+        Draw standard-normal noise eps of shape (time_steps, tokens, n_paths).
+
+        Path p uses the same stream as in simulate_ensemble(seed=seed), so
+        NOISE_STD * eps is exactly the noise that run sees.
+        """
+        noise = NoiseBlocks(1.0, (len(self.token_names), n_paths), path_generators(seed, 0, n_paths),
+                            total_steps=time_steps)
+        return torch.as_tensor(noise.take(time_steps))
+
+    def forward(self, eps):
+        """
+        Run the loop over the given standard-normal noise.
+
+        Parameters:
+            eps (torch.Tensor): Noise of shape (time_steps, tokens, paths).
+
+        Returns:
+            tuple: (price, circulation) tensors of shape (time_steps + 1, tokens, paths).
+        """
+        v = {name: self.value(name) for name in CONFIG_PARAMETERS + MODEL_PARAMETERS + COEFFICIENT_PARAMETERS}
+        fees_coefs = v["fees_coefs"][:, :, None]
+        rewards_coefs = v["rewards_coefs"][:, :, None]
+        shape = (len(self.token_names), eps.shape[2])
+        price = self.price0.expand(shape)
+        circulation = self.circulation0.expand(shape)
+        fees = self.fees0.expand((-1,) + shape)
+        rewards = self.rewards0.expand((-1,) + shape)
+        integral = torch.zeros(shape, dtype=torch.float64)
+        prev_error = torch.zeros(shape, dtype=torch.float64)
+        prices, circulations = [price], [circulation]
+
+        for t in range(eps.shape[0]):
+            # A) PID update + gradient step on fees & rewards, then clamp
+            error = price - self.target
+            integral = integral + error
+            derivative = error - prev_error
+            control_signal = v["K_P"] * error + v["K_I"] * integral + v["K_D"] * derivative
+            prev_error = error
+            step = 2.0 * v["LEARNING_RATE"]
+            fees = torch.clamp(fees - error * fees_coefs * step + control_signal, 0.0, 5.0)
+            rewards = torch.clamp(rewards - error * rewards_coefs * step + control_signal, 0.0, 5.0)
+
+            # B) NudgeModel price & supply update (left-to-right product sums as in state.sum_products)
+            total_fee = fees[0]
+            total_reward = rewards[0]
+            for k in range(1, len(fees)):
+                total_fee = total_fee + fees[k]
+                total_reward = total_reward + rewards[k]
+            P, Q = price, circulation
+            P_next = (P + v["lambda_nudge"] * (self.target - P) + v["k_fee"] * total_fee
+                      + v["k_reward"] * total_reward + v["k_market"] * self.market
+                      + v["k_collateral"] * (self.collateral - Q) + -v["k_circ"] * Q + v["NOISE_STD"] * eps[t])
+            P_next = torch.clamp(P_next, min=0.0)
+            minted = v["mint_factor_reward"] * total_reward + v["mint_factor_fee"] * total_fee
+            burn = (v["burn_surplus_pct"] * torch.clamp(Q - self.max_supply, min=0.0)
+                    + v["burn_deficit_pct"] * torch.clamp(P_next * Q - self.collateral, min=0.0))
+            price, circulation = P_next, Q + minted - burn
+            prices.append(price)
+            circulations.append(circulation)
+        return torch.stack(prices), torch.stack(circulations)
+
+
+def peg_loss(price, target, burn_in=0):
+    """
+    Mean squared relative peg deviation ((price - target) / target)^2 over
+    every step after burn_in, token and path.
+    """
+    return (((price[burn_in + 1:] - target) / target) ** 2).mean()
+
+
+def calibrate(parameters=CALIBRATION_PARAMETERS, n_paths=64, time_steps=None, iterations=100, lr=0.05, seed=0,
+              resample=True, burn_in=0, max_grad_norm=10.0, params=None, universe=None, callback=None):
+    """
+    Fit parameters by gradient descent on the peg-tracking loss.
+
+    Each iteration simulates n_paths paths over the whole horizon, evaluates
+    peg_loss() and takes one Adam step on the log-scales of all calibrated
+    parameters at once. With resample, iteration i draws fresh noise from
+    child i of the seed (stochastic gradient on the expected loss);
+    otherwise the same noise is reused (common random numbers).
+
+    Parameters:
+        parameters (iterable): Names to calibrate (see DifferentiableSimulation).
+        n_paths (int): Paths per iteration.
+        time_steps (int): Horizon (defaults to config.TIME_STEPS).
+        iterations (int): Number of optimizer steps.
+        lr (float): Adam learning rate, a relative step of the parameters.
+        seed (int or np.random.SeedSequence): Root seed of the noise.
+        resample (bool): Draw new noise every iteration.
+        burn_in (int): Initial steps excluded from the loss.
+        max_grad_norm (float): Gradient norm clip (None disables it).
+        params (dict): Optional starting values.
+        universe: TokenUniverse, spec path or spec dict of the simulated tokens.
+        callback (callable): Optional callback(iteration, loss, simulation).
+
+    Returns:
+        dict: "params" (calibrated values, see DifferentiableSimulation.values),
+        "initial_params" and "loss" (iterations,) history.
+    """
+    if time_steps is None:
+        time_steps = config.TIME_STEPS
+    simulation = DifferentiableSimulation(parameters, params=params, universe=universe)
+    initial_params = simulation.values()
+    optimizer = torch.optim.Adam(simulation.parameters(), lr=lr)
+    seeds = root_seed(seed).spawn(iterations if resample else 1)
+    eps = None
+    losses = np.empty(iterations)
+    for i in range(iterations):
+        if eps is None or resample:
+            eps = simulation.draw_noise(n_paths, time_steps, seeds[i if resample else 0])
+        optimizer.zero_grad()
+        price, _ = simulation(eps)
+        loss = peg_loss(price, simulation.target, burn_in)
+        loss.backward()
+        if max_grad_norm is not None:
+            nn.utils.clip_grad_norm_(simulation.parameters(), max_grad_norm)
+        optimizer.step()
+        losses[i] = loss.item()
+        if callback is not None:
+            callback(i, losses[i], simulation)
+    return {"params": simulation.values(), "initial_params": initial_params, "loss": losses}
@@ -0,0 +1,243 @@
+# src/ensemble.py
+
+from concurrent.futures import ProcessPoolExecutor
+
+import warnings
+
+import numpy as np
+from config import config
+from src.cache import cache_key, cacheable_model, pack_meta, resolve_cache, unpack_meta
+from src.controllers.controller import PIDBank, update_and_clip
+from src.models.registry import create_model
+from src.noise import ensemble_noise, root_seed
+from src.state import TokenState
+from src.universe import load_universe
+
+# Config knobs that can be overridden per run through the params argument
+CONFIG_PARAMETERS = ("K_P", "K_I", "K_D", "LEARNING_RATE", "NOISE_STD")
+
+# Paths per chunk in run_ensemble(); fixed so the merge order never depends on the worker count
+CHUNK_PATHS = 1024
+
+
+def simulate_ensemble(n_paths, time_steps=None, seed=None, volume=10.0, liquidity=5.0, record_history=False,
+                      params=None, model_type=None, first_path=0, universe=None, cache=None,
+                      variance_reduction=None):
+    """
+    Run n_paths independent noisy paths of the simulation at once.
+
+    Each time step applies, for every (path, token) pair at once, the same
+    pipeline as simulate(): PID update on the price error, gradient step on
+    fees and rewards, clamping to [0, 5] and the model's predict_batch()
+    price/supply update. A single path driven by the same noise reproduces
+    simulate() exactly.
+
+    Path p draws its noise from its own stream (see noise.path_generators) in
+    bulk blocks, so its trajectory depends only on the seed and on p, not on
+    how many paths are simulated alongside it.
+
+    Parameters:
+        n_paths (int): Number of independent paths.
+        time_steps (int): Number of steps to run (defaults to config.TIME_STEPS).
+        seed (int or np.random.SeedSequence): Root seed of the per-path noise
+            streams (None draws fresh entropy).
+        volume (float): Market volume fed to the model.
+        liquidity (float): Market liquidity fed to the model.
+        record_history (bool): Keep full (steps + 1, paths, tokens) price and
+            circulation histories. Per-step cross-path mean and standard
+            deviation, of shape (steps + 1, tokens), are always recorded.
+        params (dict): Optional overrides for this run. Keys may be any of
+            CONFIG_PARAMETERS (e.g. "K_P", "NOISE_STD") or a NudgeModel
+            constant (e.g. "k_fee", "lambda_nudge"); config is left untouched.
+        model_type (str): Registered model name (defaults to config.MODEL_TYPE).
+        first_path (int): Stream index of the first path, used to simulate a
+            slice of a larger ensemble.
+        universe: TokenUniverse, spec path or spec dict of the simulated tokens
+            (defaults to config.TOKEN_UNIVERSE, then config.TOKENS).
+        cache: ResultCache, True, False or None for config.CACHE_RESULTS (see
+            src.cache). Seeded runs of cacheable models are then served from
+            the cache when the same inputs and code were run before; cached
+            arrays are read-only.
+        variance_reduction (str): Price-noise mode, False for independent
+            paths, "antithetic" for mirrored path pairs (2k, 2k + 1) or
+            "sobol" for scrambled quasi-Monte Carlo points (defaults to
+            config.VARIANCE_REDUCTION; see noise.ensemble_noise and
+            src.variance for estimates with their variance and ESS).
+
+    Returns:
+        dict: Final price/circulation of shape (paths, tokens), fees/rewards of
+        shape (paths, tokens, products), the (tokens,) target prices and the
+        recorded statistics.
+    """
+    if time_steps is None:
+        time_steps = config.TIME_STEPS
+    if model_type is None:
+        model_type = config.MODEL_TYPE
+    if variance_reduction is None:
+        variance_reduction = config.VARIANCE_REDUCTION
+    variance_reduction = variance_reduction or None
+
+    params = dict(params or {})
+    settings = {name: params.pop(name, getattr(config, name)) for name in CONFIG_PARAMETERS}
+    K_P, K_I, K_D = settings["K_P"], settings["K_I"], settings["K_D"]
+    learning_rate = settings["LEARNING_RATE"]
+    noise_std = settings["NOISE_STD"]
+
+    model = create_model(model_type)
+    for name, value in params.items():
+        if not hasattr(model, name):
+            raise ValueError(f"Unknown simulation parameter: {name}")
+        setattr(model, name, value)
+    universe = load_universe(universe)
+
+    result_cache = resolve_cache(cache)
+    if result_cache is not None:
+        if seed is None or not cacheable_model(model):
+            if cache is not None:
+                warnings.warn(f"Result cache skipped for {'an unseeded run' if seed is None else model_type}")
+        else:
+            key = cache_key("ensemble", n_paths=n_paths, time_steps=time_steps, seed=root_seed(seed),
+                            first_path=first_path, volume=volume, liquidity=liquidity,
+                            record_history=record_history, config=settings, model_type=model_type,
+                            model=model.get_state(), universe=universe, variance_reduction=variance_reduction)
+
+            def run():
+                result = simulate_ensemble(n_paths, time_steps, seed, volume, liquidity, record_history,
+                                           dict(settings, **params), model_type, first_path, universe, cache=False,
+                                           variance_reduction=variance_reduction)
+                meta = {"token_names": result.pop("token_names"), "products": result.pop("products")}
+                result["meta"] = pack_meta(meta)
+                return result
+
+            result = dict(result_cache.get_or_compute(key, run))
+            result.update(unpack_meta(result.pop("meta")))
+            return result
+
+    # Token state as (tokens, paths) / (products, tokens, paths) arrays with
+    # the path axis innermost; coefficients broadcast across paths
+    tokens = TokenState.from_universe(universe, n_paths=n_paths, volume=volume, liquidity=liquidity)
+    price = tokens.price
+    circulation = tokens.circulation
+    target = tokens.target
+    fees = tokens.fees
+    rewards = tokens.rewards
+    params = tokens.params
+    coefs = np.stack((universe.fees_coefs, universe.rewards_coefs))[..., None]
+    pids = PIDBank(K_P, K_I, K_D, shape=price.shape)
+    control_signal = np.empty(price.shape)
+    error = np.empty(price.shape)
+    scratch = np.empty_like(params)
+    noise = None
+    if model.stochastic:
+        noise = ensemble_noise(noise_std, price.shape, seed, first_path, time_steps, variance_reduction)
+
+    n_tokens = len(tokens.token_names)
+    price_mean = np.empty((time_steps + 1, n_tokens))
+    price_std = np.empty((time_steps + 1, n_tokens))
+    price_mean[0] = price.mean(axis=1)
+    price_std[0] = price.std(axis=1)
+    if record_history:
+        price_history = np.empty((time_steps + 1, n_tokens, n_paths))
+        circulation_history = np.empty((time_steps + 1, n_tokens, n_paths))
+        price_history[0] = price
+        circulation_history[0] = circulation
+
+    for t in range(1, time_steps + 1):
+        # A) PID update + gradient step on fees & rewards, then clamp
+        np.subtract(price, target, out=error)
+        pids.update(error, out=control_signal)
+        update_and_clip(params, error, coefs, control_signal, learning_rate, 0.0, 5.0, scratch)
+
+        # B) Next price & supply for every path and token, written in place
+        tokens.update_totals()
+        model.predict_batch(tokens.state, None if noise is None else noise.next(), out=tokens.state)
+
+        # C) Record statistics
+        price_mean[t] = price.mean(axis=1)
+        price_std[t] = price.std(axis=1)
+        if record_history:
+            price_history[t] = price
+            circulation_history[t] = circulation
+
+    result = {
+        "token_names": tokens.token_names,
+        "products": tokens.products,
+        "target": np.array(universe.target_price),
+        "price": price.T,
+        "circulation": circulation.T,
+        "fees": fees.transpose(2, 1, 0),
+        "rewards": rewards.transpose(2, 1, 0),
+        "price_mean": price_mean,
+        "price_std": price_std,
+    }
+    if record_history:
+        result["price_history"] = price_history.transpose(0, 2, 1)
+        result["circulation_history"] = circulation_history.transpose(0, 2, 1)
+    return result
+
+
+def _merge_chunks(chunks):
+    """
+    Combine simulate_ensemble() results of consecutive path chunks into one.
+
+    Per-path arrays are concatenated along the path axis; the per-step mean
+    and standard deviation are pooled chunk by chunk in path order.
+    """
+    merged = {key: chunks[0][key] for key in ("token_names", "products", "target")}
+    for key in ("price", "circulation", "fees", "rewards"):
+        merged[key] = np.concatenate([chunk[key] for chunk in chunks], axis=0)
+    for key in ("price_history", "circulation_history"):
+        if key in chunks[0]:
+            merged[key] = np.concatenate([chunk[key] for chunk in chunks], axis=1)
+
+    sizes = [len(chunk["price"]) for chunk in chunks]
+    total = sum(sizes)
+    mean = sum(n * chunk["price_mean"] for n, chunk in zip(sizes, chunks)) / total
+    var = sum(n * (chunk["price_std"] ** 2 + (chunk["price_mean"] - mean) ** 2)
+              for n, chunk in zip(sizes, chunks)) / total
+    merged["price_mean"] = mean
+    merged["price_std"] = np.sqrt(var)
+    return merged
+
+
+def run_ensemble(n_paths, time_steps=None, seed=None, workers=None, chunk_paths=CHUNK_PATHS, **kwargs):
+    """
+    Run a large ensemble as fixed-size path chunks across a process pool.
+
+    Every chunk simulates its slice of paths with the streams those paths
+    would get in a single simulate_ensemble() call, so per-path results are
+    identical to the unsplit run. Chunks are merged in path order, which makes
+    the whole result independent of the number of workers. The per-step
+    price_mean and price_std are pooled from the chunk statistics, so they
+    match the unsplit run to rounding (a few ulp), not bit for bit.
+
+    Parameters:
+        n_paths (int): Number of independent paths.
+        time_steps (int): Number of steps to run (defaults to config.TIME_STEPS).
+        seed (int or np.random.SeedSequence): Root seed of the per-path noise streams.
+        workers (int): Number of worker processes (defaults to the CPU count);
+            1 runs every chunk in this process.
+        chunk_paths (int): Paths per chunk.
+        **kwargs: Further simulate_ensemble() arguments (params, model_type, ...).
+
+    Returns:
+        dict: The same layout as simulate_ensemble().
+    """
+    # Resolve the seed and token universe once so every chunk shares them; fresh
+    # entropy never repeats, so unseeded runs bypass the result cache
+    if seed is None:
+        kwargs["cache"] = False
+    seed = root_seed(seed)
+    kwargs["universe"] = load_universe(kwargs.get("universe"))
+    starts = range(0, n_paths, chunk_paths)
+    jobs = [
+        dict(kwargs, n_paths=min(chunk_paths, n_paths - start), time_steps=time_steps, seed=seed, first_path=start)
+        for start in starts
+    ]
+    if workers == 1:
+        chunks = [simulate_ensemble(**job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(simulate_ensemble, **job) for job in jobs]
+            chunks = [future.result() for future in futures]
+    return _merge_chunks(chunks)
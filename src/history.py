@@ -0,0 +1,153 @@
+# src/history.py
+
+import json
+import numpy as np
+
+
+def history_fields(products):
+    """
+    Return the ordered field names recorded for every token and time step.
+    """
+    return (
+        ["price", "circulation"]
+        + [f"fee_{prod}" for prod in products]
+        + [f"reward_{prod}" for prod in products]
+        + ["control_signal", "error"]
+    )
+
+
+class SimulationHistory:
+    """
+    Preallocated, typed store for per-step simulation trajectories.
+
+    Data lives in a single float64 array of shape (time_steps + 1, tokens, fields),
+    where row 0 holds the initial state. Row t holds the price and circulation
+    after step t together with the fees/rewards, PID control signal and price
+    error that produced them (control_signal and error are NaN in row 0).
+
+    When a path is given the array is backed by a memory-mapped .npy file, so
+    long runs stream to disk with constant RAM; token and field names are kept
+    in a JSON sidecar (<path>.json) and the run can be reopened zero-copy with
+    SimulationHistory.load().
+
+    Attributes:
+        token_names (list): Token names, in array order.
+        fields (list): Field names, in array order.
+        data (np.ndarray): The (time_steps + 1, tokens, fields) array.
+        path (str): Backing .npy file, or None for an in-memory history.
+    """
+
+    def __init__(self, time_steps, token_names, products, path=None):
+        """
+        Allocate the history.
+
+        Parameters:
+            time_steps (int): Number of simulated steps (rows = time_steps + 1).
+            token_names (list): Token names, in array order.
+            products (list): Product names used for the fee/reward fields.
+            path (str): Optional .npy file to back the array with.
+        """
+        self.token_names = list(token_names)
+        self.fields = history_fields(products)
+        self.path = path
+        shape = (time_steps + 1, len(self.token_names), len(self.fields))
+        if path is None:
+            self.data = np.full(shape, np.nan)
+        else:
+            self.data = np.lib.format.open_memmap(path, mode="w+", dtype=np.float64, shape=shape)
+            self.data[...] = np.nan
+            with open(path + ".json", "w") as f:
+                json.dump({"token_names": self.token_names, "fields": self.fields}, f)
+        self._field_index = {name: i for i, name in enumerate(self.fields)}
+
+    @classmethod
+    def load(cls, path, mmap_mode="r"):
+        """
+        Reopen a history written to disk without copying it into memory.
+
+        Parameters:
+            path (str): The .npy file passed when the history was created.
+            mmap_mode (str): Memory-map mode for np.load ("r", "r+" or "c").
+
+        Returns:
+            SimulationHistory: History whose data is a memory-mapped view of the file.
+        """
+        with open(path + ".json", "r") as f:
+            meta = json.load(f)
+        return cls.from_data(np.load(path, mmap_mode=mmap_mode), meta["token_names"], meta["fields"], path=path)
+
+    @classmethod
+    def from_data(cls, data, token_names, fields, path=None):
+        """
+        Wrap an existing (steps, tokens, fields) array without copying it.
+
+        Parameters:
+            data (np.ndarray): History array, e.g. read from a result cache.
+            token_names (list): Token names, in array order.
+            fields (list): Field names, in array order.
+            path (str): Backing .npy file, if any.
+
+        Returns:
+            SimulationHistory: History whose data is the given array.
+        """
+        history = cls.__new__(cls)
+        history.token_names = list(token_names)
+        history.fields = list(fields)
+        history.path = path
+        history.data = data
+        history._field_index = {name: i for i, name in enumerate(history.fields)}
+        return history
+
+    def record(self, t, token_index, price, circulation, fees, rewards, control_signal=np.nan, error=np.nan):
+        """
+        Record one token's state at time step t.
+
+        Parameters:
+            t (int): Time step (row).
+            token_index (int): Position of the token in token_names.
+            price (float): Token price.
+            circulation (float): Token circulation.
+            fees (dict): Fee per product, in product order.
+            rewards (dict): Reward per product, in product order.
+            control_signal (float): PID output used in this step.
+            error (float): Price error fed to the PID in this step.
+        """
+        self.data[t, token_index] = (price, circulation, *fees.values(), *rewards.values(), control_signal, error)
+
+    def record_tokens(self, t, tokens, control_signal=np.nan, error=np.nan):
+        """
+        Record every token of a single-run TokenState at time step t.
+
+        Parameters:
+            t (int): Time step (row).
+            tokens (TokenState): State with (tokens,) shaped arrays.
+            control_signal (np.ndarray): PID output per token used in this step.
+            error (np.ndarray): Price error per token fed to the PID in this step.
+        """
+        n_products = len(tokens.products)
+        row = self.data[t]
+        row[:, 0] = tokens.price
+        row[:, 1] = tokens.circulation
+        row[:, 2:2 + n_products] = tokens.fees.T
+        row[:, 2 + n_products:2 + 2 * n_products] = tokens.rewards.T
+        row[:, -2] = control_signal
+        row[:, -1] = error
+
+    def field(self, name):
+        """
+        Return a (time_steps + 1, tokens) view of one field.
+        """
+        return self.data[:, :, self._field_index[name]]
+
+    def token(self, token_name):
+        """
+        Return a (time_steps + 1, fields) view of one token.
+        """
+        return self.data[:, self.token_names.index(token_name), :]
+
+    def flush(self):
+        """
+        Write pending changes of a memory-mapped history to disk.
+        """
+        if isinstance(self.data, np.memmap):
+            self.data.flush()
@@ -0,0 +1,285 @@
+# src/kernels.py
+#
+# Fused step loops for the nudge model. When Numba is installed the whole
+# per-step pipeline (PID update, gradient step, clamp, nudge price and
+# mint/burn update) runs as one compiled loop over a block of time steps.
+# Without Numba, small universes run the same loop in plain Python on lists
+# (the "python" backend): every NumPy call of the vectorized step loop costs
+# about a microsecond regardless of size, so with a few tokens scalar Python
+# is faster. Larger universes keep using the NumPy step loop.
+
+import numpy as np
+from src.models.abstract_model import (
+    PRICE, CIRCULATION, FEE_TOTAL, REWARD_TOTAL,
+    TARGET, COLLATERAL, MAX_SUPPLY, VOLUME, LIQUIDITY,
+)
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+# Largest universe the "auto" backend runs with the Python kernel when Numba is
+# missing. The NumPy step loop costs about 50 us per step up to ~32 tokens, the
+# Python kernel about 3 us per token-step with 3 products (7 us for 2 tokens,
+# 26 us for 8, 97 us for 32), so they cross over at about 16 tokens.
+PYTHON_MAX_TOKENS = 12
+
+# Order of the scalar constants passed to the kernel
+KERNEL_PARAMETERS = (
+    "K_P", "K_I", "K_D", "learning_rate", "low", "high",
+    "lambda_nudge", "k_fee", "k_reward", "k_market", "k_circ", "k_collateral",
+    "mint_factor_reward", "mint_factor_fee", "burn_surplus_pct", "burn_deficit_pct",
+)
+
+
+def _nudge_steps(state, fees, rewards, fees_coefs, rewards_coefs, integral, prev_error, derivative, noise, out,
+                 params):
+    """
+    Advance a single run through len(noise) steps of the PID + nudge pipeline.
+
+    Every operation mirrors the array path (PIDBank.update, update_and_clip,
+    sum_products and NudgeModel.predict_batch) in the same order, so results
+    are bit-identical to simulate()'s NumPy loop for the same noise.
+
+    Parameters:
+        state (np.ndarray): Compact (STATE_SIZE, tokens) state, updated in place.
+        fees, rewards (np.ndarray): (products, tokens) arrays, updated in place.
+        fees_coefs, rewards_coefs (np.ndarray): (products, tokens) gradient coefficients.
+        integral, prev_error, derivative (np.ndarray): (tokens,) PID state, updated in place.
+        noise (np.ndarray): (steps, tokens) price noise.
+        out (np.ndarray): (steps, tokens, fields) history rows to fill, in
+            history.history_fields() order.
+        params (np.ndarray): Scalar constants in KERNEL_PARAMETERS order.
+    """
+    K_P, K_I, K_D, learning_rate, low, high = params[0], params[1], params[2], params[3], params[4], params[5]
+    lambda_nudge, k_fee, k_reward, k_market, k_circ, k_collateral = (
+        params[6], params[7], params[8], params[9], params[10], params[11])
+    mint_factor_reward, mint_factor_fee, burn_surplus_pct, burn_deficit_pct = (
+        params[12], params[13], params[14], params[15])
+    step_size = 2.0 * learning_rate
+    neg_k_circ = -k_circ
+    n_products, n_tokens = fees.shape
+
+    for s in range(noise.shape[0]):
+        for i in range(n_tokens):
+            P = state[PRICE, i]
+            Q = state[CIRCULATION, i]
+
+            # A) PID update
+            error = P - state[TARGET, i]
+            integral[i] += error
+            derivative[i] = error - prev_error[i]
+            control_signal = K_P * error + K_I * integral[i] + K_D * derivative[i]
+            prev_error[i] = error
+
+            # Gradient step, control signal and clamp, then totals
+            total_fee = 0.0
+            total_reward = 0.0
+            for k in range(n_products):
+                value = fees[k, i] - error * fees_coefs[k, i] * step_size + control_signal
+                if value < low:
+                    value = low
+                elif value > high:
+                    value = high
+                fees[k, i] = value
+                total_fee = value if k == 0 else total_fee + value
+
+                value = rewards[k, i] - error * rewards_coefs[k, i] * step_size + control_signal
+                if value < low:
+                    value = low
+                elif value > high:
+                    value = high
+                rewards[k, i] = value
+                total_reward = value if k == 0 else total_reward + value
+
+            # B) Nudge price update
+            P_next = (P + lambda_nudge * (state[TARGET, i] - P)
+                      + k_fee * total_fee
+                      + k_reward * total_reward
+                      + k_market * (state[VOLUME, i] + state[LIQUIDITY, i])
+                      + k_collateral * (state[COLLATERAL, i] - Q)
+                      + neg_k_circ * Q
+                      + noise[s, i])
+            if P_next < 0.0:
+                P_next = 0.0
+
+            # Mint/burn circulation update
+            minted_tokens = mint_factor_reward * total_reward + mint_factor_fee * total_fee
+            surplus = Q - state[MAX_SUPPLY, i]
+            if surplus < 0.0:
+                surplus = 0.0
+            deficit = P_next * Q - state[COLLATERAL, i]
+            if deficit < 0.0:
+                deficit = 0.0
+            Q_next = Q + minted_tokens - (burn_surplus_pct * surplus + burn_deficit_pct * deficit)
+
+            state[PRICE, i] = P_next
+            state[CIRCULATION, i] = Q_next
+            state[FEE_TOTAL, i] = total_fee
+            state[REWARD_TOTAL, i] = total_reward
+
+            # C) History row
+            out[s, i, 0] = P_next
+            out[s, i, 1] = Q_next
+            for k in range(n_products):
+                out[s, i, 2 + k] = fees[k, i]
+                out[s, i, 2 + n_products + k] = rewards[k, i]
+            out[s, i, 2 + 2 * n_products] = control_signal
+            out[s, i, 3 + 2 * n_products] = error
+
+
+def _nudge_steps_python(state, fees, rewards, fees_coefs, rewards_coefs, integral, prev_error, derivative, noise,
+                        params):
+    """
+    Plain-Python counterpart of _nudge_steps on nested lists.
+
+    Performs the same float operations in the same order, so it is
+    bit-identical to the compiled kernel and the NumPy step loop.
+
+    Parameters:
+        state (list): STATE_SIZE lists of per-token values, updated in place.
+        fees, rewards (list): Per-token lists of per-product values, updated in place.
+        fees_coefs, rewards_coefs (list): Per-token lists of per-product coefficients.
+        integral, prev_error, derivative (list): Per-token PID state, updated in place.
+        noise (list): Per-step lists of per-token price noise.
+        params (list): Scalar constants in KERNEL_PARAMETERS order.
+
+    Returns:
+        list: Per-step lists of per-token history rows, in
+        history.history_fields() order.
+    """
+    (K_P, K_I, K_D, learning_rate, low, high,
+     lambda_nudge, k_fee, k_reward, k_market, k_circ, k_collateral,
+     mint_factor_reward, mint_factor_fee, burn_surplus_pct, burn_deficit_pct) = params
+    step_size = 2.0 * learning_rate
+    neg_k_circ = -k_circ
+    price, circulation, target = state[PRICE], state[CIRCULATION], state[TARGET]
+    fee_total, reward_total = state[FEE_TOTAL], state[REWARD_TOTAL]
+    collateral, max_supply = state[COLLATERAL], state[MAX_SUPPLY]
+    market = [volume + liquidity for volume, liquidity in zip(state[VOLUME], state[LIQUIDITY])]
+    products = range(len(fees[0]))
+
+    rows = []
+    for step_noise in noise:
+        step_rows = []
+        for i, token_noise in enumerate(step_noise):
+            P = price[i]
+            Q = circulation[i]
+
+            # A) PID update
+            error = P - target[i]
+            integral[i] += error
+            derivative[i] = error - prev_error[i]
+            control_signal = K_P * error + K_I * integral[i] + K_D * derivative[i]
+            prev_error[i] = error
+
+            # Gradient step, control signal and clamp, then totals
+            token_fees, token_rewards = fees[i], rewards[i]
+            token_fees_coefs, token_rewards_coefs = fees_coefs[i], rewards_coefs[i]
+            for k in products:
+                value = token_fees[k] - error * token_fees_coefs[k] * step_size + control_signal
+                token_fees[k] = low if value < low else high if value > high else value
+                value = token_rewards[k] - error * token_rewards_coefs[k] * step_size + control_signal
+                token_rewards[k] = low if value < low else high if value > high else value
+            total_fee = token_fees[0]
+            total_reward = token_rewards[0]
+            for k in products[1:]:
+                total_fee += token_fees[k]
+                total_reward += token_rewards[k]
+
+            # B) Nudge price update
+            P_next = (P + lambda_nudge * (target[i] - P)
+                      + k_fee * total_fee
+                      + k_reward * total_reward
+                      + k_market * market[i]
+                      + k_collateral * (collateral[i] - Q)
+                      + neg_k_circ * Q
+                      + token_noise)
+            if P_next < 0.0:
+                P_next = 0.0
+
+            # Mint/burn circulation update
+            minted_tokens = mint_factor_reward * total_reward + mint_factor_fee * total_fee
+            surplus = Q - max_supply[i]
+            if surplus < 0.0:
+                surplus = 0.0
+            deficit = P_next * Q - collateral[i]
+            if deficit < 0.0:
+                deficit = 0.0
+            Q_next = Q + minted_tokens - (burn_surplus_pct * surplus + burn_deficit_pct * deficit)
+
+            price[i] = P_next
+            circulation[i] = Q_next
+            fee_total[i] = total_fee
+            reward_total[i] = total_reward
+
+            # C) History row
+            step_rows.append([P_next, Q_next, *token_fees, *token_rewards, control_signal, error])
+        rows.append(step_rows)
+    return rows
+
+
+if NUMBA_AVAILABLE:
+    _nudge_steps = njit(cache=True, nogil=True)(_nudge_steps)
+
+
+def applies(model, pids):
+    """
+    Return True if the fused nudge loop can replace the NumPy loop for this run.
+
+    Requires an exact NudgeModel (subclasses may change predict_batch) and a
+    PIDBank with scalar gains and no anti-windup/derivative filtering.
+    """
+    from src.models.nudge_model import NudgeModel
+
+    return (
+        type(model) is NudgeModel
+        and pids.integral_limit is None
+        and not pids.derivative_filter
+        and pids.Kp.ndim == pids.Ki.ndim == pids.Kd.ndim == 0
+    )
+
+
+def run_nudge(tokens, pids, model, fees_coefs, rewards_coefs, learning_rate, noise, out, low=0.0, high=5.0,
+              compiled=True):
+    """
+    Run len(noise) fused nudge steps for a single run in one call.
+
+    The kernel consumes the same noise values, in the same order, as the
+    NumPy step loop, so all backends produce bit-identical trajectories.
+
+    Parameters:
+        tokens (TokenState): Single-run state, updated in place.
+        pids (PIDBank): Controller bank, its integral/prev_error/derivative updated in place.
+        model (NudgeModel): Source of the nudge/mint/burn constants.
+        fees_coefs, rewards_coefs (np.ndarray): (products, tokens) coefficient matrices.
+        learning_rate (float): Gradient step size.
+        noise (np.ndarray): (steps, tokens) price noise.
+        out (np.ndarray): (steps, tokens, fields) history rows to fill.
+        low, high (float): Fee/reward clamp bounds.
+        compiled (bool): Run the Numba kernel; False runs the plain-Python
+            loop on lists, converting the arrays once per call.
+    """
+    params = [
+        pids.Kp, pids.Ki, pids.Kd, learning_rate, low, high,
+        model.lambda_nudge, model.k_fee, model.k_reward, model.k_market, model.k_circ, model.k_collateral,
+        model.mint_factor_reward, model.mint_factor_fee, model.burn_surplus_pct, model.burn_deficit_pct,
+    ]
+    if compiled:
+        _nudge_steps(tokens.state, tokens.fees, tokens.rewards, fees_coefs, rewards_coefs,
+                     pids.integral, pids.prev_error, pids.derivative, np.ascontiguousarray(noise), out,
+                     np.array(params, dtype=np.float64))
+        return
+
+    state = tokens.state.tolist()
+    fees = tokens.fees.T.tolist()
+    rewards = tokens.rewards.T.tolist()
+    pid_state = [pids.integral.tolist(), pids.prev_error.tolist(), pids.derivative.tolist()]
+    out[...] = _nudge_steps_python(state, fees, rewards, fees_coefs.T.tolist(), rewards_coefs.T.tolist(),
+                                   *pid_state, noise.tolist(), [float(value) for value in params])
+    tokens.state[...] = state
+    tokens.fees[...] = np.array(fees).T
+    tokens.rewards[...] = np.array(rewards).T
+    pids.integral[...], pids.prev_error[...], pids.derivative[...] = pid_state
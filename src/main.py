@@ -1,6 +1,7 @@
 # main.py
 
 from simulation import simulate
+from reporting import show_figures
 
 if __name__ == '__main__':
-    simulate()
+    show_figures(simulate())
@@ -1,20 +1,79 @@
 # abstract_model.py
 
 from abc import ABC, abstractmethod
+import numpy as np
+
+# Rows of the compact state array consumed by predict_batch(). The field axis
+# comes first so each row is a contiguous block covering every token/path,
+# e.g. a state of shape (STATE_SIZE, tokens, paths) in ensemble runs.
+STATE_FIELDS = (
+    "price", "circulation", "fee_total", "reward_total",
+    "target", "collateral", "max_supply", "volume", "liquidity",
+)
+(PRICE, CIRCULATION, FEE_TOTAL, REWARD_TOTAL,
+ TARGET, COLLATERAL, MAX_SUPPLY, VOLUME, LIQUIDITY) = range(len(STATE_FIELDS))
+STATE_SIZE = len(STATE_FIELDS)
+
+
+def state_from_dict(state, volume, liquidity):
+    """
+    Pack a per-token state dict (as used by simulate()) into a compact state
+    array of shape (STATE_SIZE, 1).
+    :param state: Dict with price, circulation, fees, rewards, target, collateral and max_supply.
+    :param volume: Market volume.
+    :param liquidity: Market liquidity.
+    :return: The state array.
+    """
+    return np.array([
+        [state["price"]],
+        [state["circulation"]],
+        [sum(state["fees"].values())],
+        [sum(state["rewards"].values())],
+        [state["target"]],
+        [state["collateral"]],
+        [state["max_supply"]],
+        [volume],
+        [liquidity],
+    ], dtype=np.float64)
+
 
 class AbstractModel(ABC):
+    # Whether predict_batch() consumes a noise term
+    stochastic = True
+
     @abstractmethod
-    def predict(self, P, params, volume, liquidity, circulation):
+    def predict_batch(self, state, noise=None, out=None):
+        """
+        Advance a batch of token states by one step.
+        :param state: Compact state array of shape (STATE_SIZE, ...), see STATE_FIELDS.
+        :param noise: Optional price noise broadcastable to state[PRICE]; stochastic
+            models draw it from np.random with config.NOISE_STD when omitted.
+        :param out: Optional array to write the next state to (may be state itself).
+        :return: Next state array; only the price and circulation rows change.
         """
-        Predict the next price given the current state.
-        :param P: Current price.
-        :param params: Dictionary of parameters (fees and rewards).
+        pass
+
+    def predict(self, state, volume, liquidity):
+        """
+        Scalar adapter around predict_batch() for a single token.
+        :param state: Per-token state dict (see state_from_dict).
         :param volume: Market volume.
         :param liquidity: Market liquidity.
-        :param circulation: Tokens in circulation.
-        :return: Predicted next price.
+        :return: Tuple (next price, next circulation).
         """
-        pass
+        packed = state_from_dict(state, volume, liquidity)
+        self.predict_batch(packed, out=packed)
+        return float(packed[PRICE, 0]), float(packed[CIRCULATION, 0])
+
+    def minted(self, fee_total, reward_total):
+        """
+        Gross amount of tokens minted in a step.
+        :param fee_total: Fee totals of the step (array of any shape).
+        :param reward_total: Reward totals of the step, shaped like fee_total.
+        :return: Minted tokens per element. The default is zero, for models that
+            carry circulation over unchanged; models with a mint rule override it.
+        """
+        return np.zeros(np.shape(fee_total))
 
     @abstractmethod
     def update(self, data):
@@ -23,3 +82,50 @@ class AbstractModel(ABC):
         :param data: Training data.
         """
         pass
+
+    def get_state(self):
+        """
+        Return the model's checkpointable state.
+        :return: Dict of public numeric attributes (e.g. the Nudge Model constants);
+            values may be numbers, NumPy arrays or JSON-serializable dicts.
+        """
+        return {
+            name: value for name, value in vars(self).items()
+            if not name.startswith("_") and isinstance(value, (int, float)) and not isinstance(value, bool)
+        }
+
+    def set_state(self, state):
+        """
+        Restore state returned by get_state().
+        :param state: Dict as returned by get_state().
+        """
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    def save_weights(self, path):
+        """
+        Optional: Write state that does not fit get_state() (e.g. torch weights) to path.
+        :param path: File to write.
+        :return: True if a file was written.
+        """
+        return False
+
+    def load_weights(self, path):
+        """
+        Optional: Restore state written by save_weights().
+        :param path: File written by save_weights().
+        """
+        pass
+
+    @staticmethod
+    def _write_next(state, out, P_next, Q_next):
+        """
+        Store the next price and circulation in out (a copy of state if None).
+        """
+        if out is None:
+            out = state.copy()
+        elif out is not state:
+            out[...] = state
+        out[PRICE] = P_next
+        out[CIRCULATION] = Q_next
+        return out
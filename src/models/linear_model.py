@@ -2,7 +2,9 @@
 
 import numpy as np
 from config import config
-from src.models.abstract_model import AbstractModel
+from src.models.abstract_model import (
+    AbstractModel, PRICE, CIRCULATION, FEE_TOTAL, REWARD_TOTAL, VOLUME, LIQUIDITY,
+)
 
 class LinearModel(AbstractModel):
     """
@@ -16,48 +18,45 @@ class LinearModel(AbstractModel):
     - Noise (from config.NOISE_STD)
     
     This model does not learn online; it simply applies a fixed formula.
+    Circulation is not modelled and stays constant.
     """
 
     def __init__(self):
         """
         Initialize any constants or hyperparameters. For this basic example,
         we do not store separate coefficients in the class because they
-        are hard-coded in the predict() function.
+        are hard-coded in the predict_batch() function.
         """
         super().__init__()  # Not strictly necessary here, but good practice.
 
-    def predict(self, P, params, volume, liquidity, circulation):
+    def predict_batch(self, state, noise=None, out=None):
         """
-        Predict the next price for a single token using a linear formula.
+        Predict the next price for a batch of token states using a linear formula.
         
-        :param P: Current token price.
-        :param params: Dictionary with keys "fees" and "rewards", each itself a dict.
-        :param volume: Market volume (float).
-        :param liquidity: Market liquidity (float).
-        :param circulation: Current token circulation (float).
-        :return: Predicted next price (float).
+        :param state: Compact state array of shape (STATE_SIZE, ...); the fee and
+            reward totals enter the formula directly.
+        :param noise: Optional price noise; drawn with config.NOISE_STD when omitted.
+        :param out: Optional array to write the next state to.
+        :return: Next state array. This model does not track supply, so the
+            circulation row is carried over unchanged.
         """
-        # Sum up fee parameters
-        fee_effect = sum(params["fees"].values())
-        
-        # Sum up reward parameters
-        reward_effect = sum(params["rewards"].values())
-
-        # Sample random noise
-        noise = np.random.normal(0, config.NOISE_STD)
+        P = state[PRICE]
+        if noise is None:
+            # Sample random noise
+            noise = np.random.normal(0, config.NOISE_STD, size=P.shape)
 
         # A simple example linear formula; adapt as needed
         P_next = (
-            0.1               # base offset
-            + 0.9 * P         # factor on current price
-            + 0.05 * volume   # factor on volume
-            + 0.05 * liquidity
-            - 0.00001 * circulation
-            + fee_effect
-            + reward_effect
+            0.1                           # base offset
+            + 0.9 * P                     # factor on current price
+            + 0.05 * state[VOLUME]        # factor on volume
+            + 0.05 * state[LIQUIDITY]
+            - 0.00001 * state[CIRCULATION]
+            + state[FEE_TOTAL]
+            + state[REWARD_TOTAL]
             + noise
         )
-        return P_next
+        return self._write_next(state, out, P_next, state[CIRCULATION])
 
     def update(self, data):
         """
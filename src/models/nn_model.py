@@ -1,10 +1,13 @@
 # src/models/nn_model.py
 
+import numpy as np
 import torch
 import torch.nn as nn
 import torch.optim as optim
 from config import config
-from src.models.abstract_model import AbstractModel
+from src.models.abstract_model import (
+    AbstractModel, PRICE, CIRCULATION, FEE_TOTAL, REWARD_TOTAL, VOLUME, LIQUIDITY,
+)
 
 class NeuralNetwork(nn.Module):
     """
@@ -29,6 +32,50 @@ class NeuralNetwork(nn.Module):
         out = self.fc2(out)
         return out
 
+class ReplayBuffer:
+    """
+    Fixed-capacity ring buffer of (input, target) training pairs.
+
+    Storage is preallocated as NumPy arrays; once full, the oldest samples
+    are overwritten.
+    """
+    def __init__(self, capacity, input_dim):
+        self.inputs = np.empty((capacity, input_dim), dtype=np.float32)
+        self.targets = np.empty((capacity, 1), dtype=np.float32)
+        self.capacity = capacity
+        self.size = 0
+        self._next = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, inputs, targets):
+        """
+        Append a batch of samples.
+
+        :param inputs: Array-like of shape (batch_size, input_dim).
+        :param targets: Array-like of shape (batch_size,) or (batch_size, 1).
+        """
+        inputs = np.asarray(inputs, dtype=np.float32).reshape(-1, self.inputs.shape[1])
+        targets = np.asarray(targets, dtype=np.float32).reshape(-1, 1)
+        # Only the most recent `capacity` samples can survive anyway
+        inputs, targets = inputs[-self.capacity:], targets[-self.capacity:]
+        idx = (self._next + np.arange(len(inputs))) % self.capacity
+        self.inputs[idx] = inputs
+        self.targets[idx] = targets
+        self._next = (self._next + len(inputs)) % self.capacity
+        self.size = min(self.size + len(inputs), self.capacity)
+
+    def sample(self, batch_size, rng):
+        """
+        Draw a mini-batch uniformly (with replacement) from the stored samples.
+
+        :return: Tuple (inputs, targets) of NumPy arrays.
+        """
+        idx = rng.integers(0, self.size, size=batch_size)
+        return self.inputs[idx], self.targets[idx]
+
+
 class NNModel(AbstractModel):
     """
     A neural network-based model that predicts the next token price.
@@ -37,6 +84,11 @@ class NNModel(AbstractModel):
     a vector of fee/reward parameters.
     """
 
+    stochastic = False
+
+    # State rows forming the network input, in input order
+    FEATURE_ROWS = (PRICE, FEE_TOTAL, REWARD_TOTAL, VOLUME, LIQUIDITY, CIRCULATION)
+
     def __init__(self):
         """
         Construct the neural network model, define the loss function (MSE),
@@ -53,51 +105,160 @@ class NNModel(AbstractModel):
         self.criterion = nn.MSELoss()
         self.optimizer = optim.Adam(self.model.parameters(), lr=0.001)
 
-    def predict(self, P, params, volume, liquidity, circulation):
+        # Online training: every update() stores its samples in the replay
+        # buffer and runs `train_steps` mini-batch steps drawn from it.
+        self.replay_buffer = ReplayBuffer(capacity=100_000, input_dim=self.input_dim)
+        self.batch_size = 256
+        self.train_steps = 4
+        self.rng = np.random.default_rng()
+
+        # Preallocated inference input, grown on demand
+        self._input_buffer = torch.empty((0, self.input_dim), dtype=torch.float32)
+
+    def predict_batch(self, state, noise=None, out=None):
         """
-        Predict the next price using the neural network.
+        Predict the next price for a batch of token states using the neural network.
         
-        :param P: Current token price (float).
-        :param params: Dictionary with "fees" and "rewards" sub-dicts.
-        :param volume: Market volume (float).
-        :param liquidity: Market liquidity (float).
-        :param circulation: Token circulation (float).
-        :return: Predicted next price (float).
-        """
-        # Summation of all fees and rewards. 
-        sum_of_fees = sum(params["fees"].values())
-        sum_of_rewards = sum(params["rewards"].values())
-
-        # Construct input vector
-        input_vec = [
-            P,
-            sum_of_fees,
-            sum_of_rewards,
-            volume,
-            liquidity,
-            circulation
-        ]
-        input_tensor = torch.tensor(input_vec, dtype=torch.float32).unsqueeze(0)  # shape: (1, input_dim)
-
-        self.model.eval()
-        with torch.no_grad():
-            output = self.model(input_tensor)
-        return output.item()
+        :param state: Compact state array of shape (STATE_SIZE, ...); every
+            token/path position becomes one row of a single forward pass.
+        :param noise: Ignored; the network is deterministic.
+        :param out: Optional array to write the next state to.
+        :return: Next state array. Circulation is carried over unchanged.
+        """
+        # Construct input matrix: one [price, sum_of_fees, sum_of_rewards,
+        # volume, liquidity, circulation] row per token/path
+        features = state[list(self.FEATURE_ROWS)].reshape(len(self.FEATURE_ROWS), -1).T
+        P_next = self.predict_features(features).reshape(state.shape[1:])
+        return self._write_next(state, out, P_next, state[CIRCULATION])
+
+    def predict_features(self, inputs):
+        """
+        Predict next prices for a whole feature matrix in one forward pass.
+
+        Rows can mix tokens and ensemble paths freely. The inputs are copied
+        into a reused float32 tensor and evaluated under torch.inference_mode.
+
+        :param inputs: Array of shape (batch_size, 6) with columns
+            [price, sum_of_fees, sum_of_rewards, volume, liquidity, circulation].
+        :return: NumPy array of shape (batch_size,) with the predicted prices.
+        """
+        inputs = np.asarray(inputs)
+        n = inputs.shape[0]
+        if self._input_buffer.shape[0] < n:
+            self._input_buffer = torch.empty((n, self.input_dim), dtype=torch.float32)
+        batch = self._input_buffer[:n]
+        batch.copy_(torch.from_numpy(inputs))
+
+        if self.model.training:
+            self.model.eval()
+        with torch.inference_mode():
+            output = self.model(batch)
+        return output.numpy()[:, 0].astype(np.float64)
+
+    def get_state(self):
+        """
+        Return the training hyperparameters, replay buffer and sampling RNG state.
+
+        The network and optimizer are saved separately by save_weights().
+        """
+        state = super().get_state()
+        buffer = self.replay_buffer
+        state.update({
+            "replay_inputs": buffer.inputs[:buffer.size].copy(),
+            "replay_targets": buffer.targets[:buffer.size].copy(),
+            "replay_next": buffer._next,
+            "rng_state": self.rng.bit_generator.state,
+        })
+        return state
+
+    def set_state(self, state):
+        state = dict(state)
+        inputs = state.pop("replay_inputs")
+        targets = state.pop("replay_targets")
+        buffer = self.replay_buffer
+        buffer.inputs[:len(inputs)] = inputs
+        buffer.targets[:len(targets)] = targets
+        buffer.size = len(inputs)
+        buffer._next = int(state.pop("replay_next"))
+        self.rng.bit_generator.state = state.pop("rng_state")
+        super().set_state(state)
+
+    def save_weights(self, path):
+        """
+        Write the network and optimizer state_dicts to path with torch.save.
+        """
+        torch.save({"model": self.model.state_dict(), "optimizer": self.optimizer.state_dict()}, path)
+        return True
+
+    def load_weights(self, path):
+        """
+        Restore the network and optimizer state_dicts written by save_weights().
+        """
+        weights = torch.load(path)
+        self.model.load_state_dict(weights["model"])
+        self.optimizer.load_state_dict(weights["optimizer"])
+
+    @staticmethod
+    def training_data_from_history(history, volume, liquidity, start=1, stop=None):
+        """
+        Build (inputs, targets) pairs from a SimulationHistory.
+
+        Each sample pairs the state at step t - 1 (price, circulation) with the
+        fees/rewards applied during step t, and targets the price observed
+        after step t, for every step t in start..stop-1.
+
+        :param history: SimulationHistory returned by simulate().
+        :param volume: Market volume used during the run (scalar or per token).
+        :param liquidity: Market liquidity used during the run (scalar or per token).
+        :param start: First step t to sample (at least 1).
+        :param stop: End of the sampled steps (defaults to the whole history).
+        :return: Tuple (inputs, targets) of shapes (samples, 6) and (samples, 1).
+        """
+        if start < 1:
+            raise ValueError("start must be at least 1: step 0 has no previous state")
+        fee_cols = [i for i, name in enumerate(history.fields) if name.startswith("fee_")]
+        reward_cols = [i for i, name in enumerate(history.fields) if name.startswith("reward_")]
+        data = history.data[start - 1:stop]
+        price = data[:, :, history.fields.index("price")]
+        circulation = data[:, :, history.fields.index("circulation")]
+        shape = price[:-1].shape
+        inputs = np.stack([
+            price[:-1],
+            data[1:, :, fee_cols].sum(axis=-1),
+            data[1:, :, reward_cols].sum(axis=-1),
+            np.broadcast_to(np.asarray(volume, dtype=np.float64), shape),
+            np.broadcast_to(np.asarray(liquidity, dtype=np.float64), shape),
+            circulation[:-1],
+        ], axis=-1).reshape(-1, 6)
+        targets = price[1:].reshape(-1, 1)
+        return inputs, targets
 
     def update(self, data):
         """
-        Train the neural network with provided data.
+        Train the neural network online from new simulation data.
+
+        The samples are appended to the replay buffer, then `train_steps`
+        mini-batches of `batch_size` samples are drawn from the buffer and
+        used for Adam steps, so recent and older history are both replayed.
         
-        :param data: A tuple (inputs, targets) where:
-            - inputs is a tensor of shape (batch_size, input_dim)
-            - targets is a tensor of shape (batch_size, 1)
-        :return: The loss value (float) after the update step.
+        :param data: A tuple (inputs, targets) of arrays or tensors where:
+            - inputs has shape (batch_size, input_dim)
+            - targets has shape (batch_size, 1)
+        :return: The mean loss (float) over the mini-batch steps.
         """
         inputs, targets = data
+        if isinstance(inputs, torch.Tensor):
+            inputs, targets = inputs.detach().numpy(), targets.detach().numpy()
+        self.replay_buffer.add(inputs, targets)
+
         self.model.train()
-        outputs = self.model(inputs)
-        loss = self.criterion(outputs, targets)
-        self.optimizer.zero_grad()
-        loss.backward()
-        self.optimizer.step()
-        return loss.item()
+        total_loss = 0.0
+        for _ in range(self.train_steps):
+            batch_inputs, batch_targets = self.replay_buffer.sample(self.batch_size, self.rng)
+            outputs = self.model(torch.from_numpy(batch_inputs))
+            loss = self.criterion(outputs, torch.from_numpy(batch_targets))
+            self.optimizer.zero_grad()
+            loss.backward()
+            self.optimizer.step()
+            total_loss += loss.item()
+        return total_loss / self.train_steps
@@ -2,7 +2,10 @@
 
 import numpy as np
 from config import config
-from src.models.abstract_model import AbstractModel
+from src.models.abstract_model import (
+    AbstractModel, PRICE, CIRCULATION, FEE_TOTAL, REWARD_TOTAL,
+    TARGET, COLLATERAL, MAX_SUPPLY, VOLUME, LIQUIDITY,
+)
 
 class NudgeModel(AbstractModel):
     def __init__(self):
@@ -23,6 +26,9 @@ class NudgeModel(AbstractModel):
     def predict(self, state, volume, liquidity):
         """
         Return (P_next, Q_next), the next price and next circulation.
+
+        Pure-Python scalar reference path; overrides the generic adapter
+        because it avoids array overhead for a single token.
         """
         P = state["price"]
         Q = state["circulation"]
@@ -36,8 +42,10 @@ class NudgeModel(AbstractModel):
         error = target - P
         nudge = self.lambda_nudge * error
 
-        fee_effect = self.k_fee * sum(fees.values())
-        reward_effect = self.k_reward * sum(rewards.values())
+        total_fee = sum(fees.values())
+        total_reward = sum(rewards.values())
+        fee_effect = self.k_fee * total_fee
+        reward_effect = self.k_reward * total_reward
         market_effect = self.k_market * (volume + liquidity)
 
         # Collateral effect
@@ -58,8 +66,6 @@ class NudgeModel(AbstractModel):
         # P_next = max(1e-3, P_next)
 
         # 2) Circulation Update
-        total_fee = sum(fees.values())
-        total_reward = sum(rewards.values())
         minted_tokens = self.mint_factor_reward * total_reward + self.mint_factor_fee * total_fee
 
         burn_amount = 0.0
@@ -75,5 +81,56 @@ class NudgeModel(AbstractModel):
 
         return P_next, Q_next
 
+    def predict_batch(self, state, noise=None, out=None):
+        """
+        Vectorized counterpart of predict() over a compact state array.
+
+        state has shape (STATE_SIZE, ...) (see abstract_model.STATE_FIELDS);
+        every row is processed at once. The arithmetic is performed in the same
+        order as predict(), so a single path driven by the same noise
+        reproduces the scalar model exactly.
+
+        Return the next state (written to out when given).
+        """
+        P = state[PRICE]
+        Q = state[CIRCULATION]
+        total_fee = state[FEE_TOTAL]
+        total_reward = state[REWARD_TOTAL]
+        target = state[TARGET]
+        collateral = state[COLLATERAL]
+        max_supply = state[MAX_SUPPLY]
+        if noise is None:
+            noise = np.random.normal(0, config.NOISE_STD, size=P.shape)
+
+        # 1) Price Update (Nudge)
+        nudge = self.lambda_nudge * (target - P)
+        fee_effect = self.k_fee * total_fee
+        reward_effect = self.k_reward * total_reward
+        market_effect = self.k_market * (state[VOLUME] + state[LIQUIDITY])
+        # Both branches of the scalar collateral rule reduce to k * (collateral - Q)
+        coll_effect = self.k_collateral * (collateral - Q)
+        circ_effect = -self.k_circ * Q
+
+        P_next = P + nudge + fee_effect + reward_effect + market_effect + coll_effect + circ_effect + noise
+        np.maximum(P_next, 0.0, out=P_next)
+
+        # 2) Circulation Update
+        minted_tokens = self.minted(total_fee, total_reward)
+
+        # max(x, 0) reproduces the "burn only when positive" branches of predict()
+        surplus = np.maximum(Q - max_supply, 0.0)
+        deficit = np.maximum(P_next * Q - collateral, 0.0)
+        burn_amount = self.burn_surplus_pct * surplus + self.burn_deficit_pct * deficit
+
+        Q_next = Q + minted_tokens - burn_amount
+
+        return self._write_next(state, out, P_next, Q_next)
+
+    def minted(self, fee_total, reward_total):
+        """
+        Tokens minted in a step: the mint rule of predict(), on arrays.
+        """
+        return self.mint_factor_reward * reward_total + self.mint_factor_fee * fee_total
+
     def update(self, data):
         pass
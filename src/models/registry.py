@@ -0,0 +1,52 @@
+# src/models/registry.py
+
+import importlib
+
+# Model name -> (module path, class name). Modules are only imported when a
+# model is first requested, so e.g. torch is loaded only for "nn".
+MODEL_REGISTRY = {
+    "nudge": ("src.models.nudge_model", "NudgeModel"),
+    "linear": ("src.models.linear_model", "LinearModel"),
+    "nn": ("src.models.nn_model", "NNModel"),
+}
+
+_loaded_classes = {}
+
+
+def register_model(name, module_path, class_name):
+    """
+    Register a model class under a name without importing it.
+
+    Parameters:
+        name (str): Name used to select the model (e.g. in config.MODEL_TYPE).
+        module_path (str): Dotted path of the module defining the class.
+        class_name (str): Name of the model class within that module.
+    """
+    MODEL_REGISTRY[name] = (module_path, class_name)
+    _loaded_classes.pop(name, None)
+
+
+def available_models():
+    """
+    Return the registered model names.
+    """
+    return list(MODEL_REGISTRY)
+
+
+def get_model_class(name):
+    """
+    Import (on first use) and return the model class registered under name.
+    """
+    if name not in _loaded_classes:
+        if name not in MODEL_REGISTRY:
+            raise ValueError(f"Unknown model type: {name} (available: {', '.join(MODEL_REGISTRY)})")
+        module_path, class_name = MODEL_REGISTRY[name]
+        _loaded_classes[name] = getattr(importlib.import_module(module_path), class_name)
+    return _loaded_classes[name]
+
+
+def create_model(name, *args, **kwargs):
+    """
+    Instantiate the model registered under name.
+    """
+    return get_model_class(name)(*args, **kwargs)
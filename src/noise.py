@@ -0,0 +1,305 @@
+# src/noise.py
+
+import warnings
+
+import numpy as np
+
+# Steps of noise drawn per refill of a NoiseBlocks buffer
+BLOCK_SIZE = 256
+
+# Noise modes of ensemble_noise(): independent streams, antithetic path pairs
+# or scrambled Sobol points
+VARIANCE_REDUCTION_MODES = (None, "antithetic", "sobol")
+
+# Spawn-key entry of the Sobol scrambling stream, beyond any path index
+SOBOL_SCRAMBLE_KEY = 2 ** 32
+
+# Largest Sobol dimension (steps * tokens); later steps fall back to the path
+# streams. scipy supports 21201, but QMC gains fade well before that and the
+# points of a slice are held in memory.
+SOBOL_MAX_DIMENSION = 4096
+
+
+def root_seed(seed=None):
+    """
+    Return the SeedSequence every stream of a run is derived from.
+
+    Parameters:
+        seed (int or np.random.SeedSequence): Run seed; None draws fresh entropy.
+    """
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    return np.random.SeedSequence(seed)
+
+
+def path_generators(seed, start, stop):
+    """
+    Return one independent Generator per path in start..stop-1.
+
+    Path p always gets the stream root_seed(seed).spawn(...)[p], built
+    directly from its spawn key, so a path sees the same noise whether the
+    ensemble runs in one process or is split into chunks across workers.
+
+    Parameters:
+        seed (int or np.random.SeedSequence): Run seed.
+        start (int): First path index.
+        stop (int): One past the last path index.
+
+    Returns:
+        list: np.random.Generator objects, one per path.
+    """
+    return [_stream(root_seed(seed), p) for p in range(start, stop)]
+
+
+def _stream(root, key):
+    """Return the Generator of child `key` of a root SeedSequence."""
+    return np.random.Generator(np.random.PCG64(
+        np.random.SeedSequence(root.entropy, spawn_key=root.spawn_key + (key,), pool_size=root.pool_size)))
+
+
+def ensemble_noise(std, shape, seed, first_path, total_steps, mode=None):
+    """
+    Build the price noise of an ensemble slice for a variance-reduction mode.
+
+    With mode None every path draws from its own stream (path_generators).
+    "antithetic" pairs paths 2k and 2k + 1: both read stream k and the odd
+    path negates it, so the pair sees eps and -eps. "sobol" drives the first
+    SOBOL_MAX_DIMENSION // tokens steps of path p with point p of a scrambled
+    Sobol sequence in (steps * tokens) dimensions, mapped to normals through
+    the inverse CDF (requires scipy); later steps use the path streams.
+    Without scipy, or with more than SOBOL_MAX_DIMENSION tokens, "sobol"
+    warns and falls back to the independent path streams, which are still
+    valid (only less efficient) replicates for src.variance. Every mode depends only on the seed and the path index, so chunked runs
+    reproduce the unsplit ensemble.
+
+    Parameters:
+        std (float): Noise standard deviation.
+        shape (tuple): Per-step noise shape, (tokens, paths).
+        seed (int or np.random.SeedSequence): Run seed.
+        first_path (int): Path index of the first column.
+        total_steps (int): Number of steps that will be consumed.
+        mode (str): None, "antithetic" or "sobol".
+
+    Returns:
+        NoiseBlocks: The noise source.
+    """
+    if mode not in VARIANCE_REDUCTION_MODES:
+        raise ValueError(f"Unknown variance reduction mode: {mode} (expected 'antithetic', 'sobol' or None)")
+    stop = first_path + shape[1]
+    if mode == "antithetic":
+        if first_path % 2 or stop % 2:
+            raise ValueError(f"Antithetic paths come in pairs; got paths {first_path}..{stop - 1}")
+        root = root_seed(seed)
+        generators = [_stream(root, p // 2) for p in range(first_path, stop)]
+        signs = np.where(np.arange(first_path, stop) % 2, -1.0, 1.0)
+        return NoiseBlocks(std, shape, generators, total_steps=total_steps, signs=signs)
+    generators = path_generators(seed, first_path, stop)
+    if mode == "sobol" and total_steps > 0:
+        if shape[0] > SOBOL_MAX_DIMENSION:
+            reason = f"Sobol noise supports at most {SOBOL_MAX_DIMENSION} tokens, got {shape[0]}"
+        else:
+            try:
+                return SobolNoise(std, shape, generators, seed, first_path, total_steps)
+            except ImportError as e:
+                reason = str(e)
+        warnings.warn(f"{reason}; falling back to independent draws", RuntimeWarning)
+    return NoiseBlocks(std, shape, generators, total_steps=total_steps)
+
+
+class NoiseBlocks:
+    """
+    Price noise pre-generated in bulk blocks instead of one draw per step.
+
+    Every refill draws up to block_size steps at once into a buffer of shape
+    (block, tokens) for a single run or (block, tokens, paths) for an
+    ensemble; next() hands out one step and take(n) a block of steps.
+
+    Noise comes either from per-path Generators (see path_generators), each
+    drawing a (block, tokens) array, or - when generators is None - from the
+    legacy global np.random state. Drawing (block, tokens) from np.random
+    yields the same sequence as one (tokens,) draw per step, so a fixed
+    np.random.seed reproduces the per-step reference exactly; total_steps caps
+    the last block so no extra numbers are consumed.
+
+    Attributes:
+        std (float): Noise standard deviation.
+        shape (tuple): Per-step noise shape, (tokens,) or (tokens, paths).
+        generators (list): Per-path Generators, or None for np.random.
+        block_size (int): Steps per refill.
+        signs (np.ndarray): Optional (paths,) factors applied to the per-path
+            draws, e.g. -1 for the antithetic half of an ensemble.
+    """
+
+    def __init__(self, std, shape, generators=None, total_steps=None, block_size=BLOCK_SIZE, signs=None):
+        """
+        Parameters:
+            std (float): Noise standard deviation.
+            shape (tuple): Per-step noise shape, (tokens,) or (tokens, paths).
+            generators (list): One Generator per path (a single one for a
+                (tokens,) shape), or None to draw from np.random.
+            total_steps (int): Optional number of steps that will be consumed.
+            block_size (int): Steps per refill.
+            signs (np.ndarray): Optional (paths,) factors of the per-path draws.
+        """
+        self.std = std
+        self.shape = tuple(shape)
+        self.generators = generators
+        self.block_size = block_size
+        self.signs = signs
+        if generators is not None:
+            n_paths = 1 if len(self.shape) == 1 else self.shape[1]
+            if len(generators) != n_paths:
+                raise ValueError(f"Expected {n_paths} generators, got {len(generators)}")
+        self._remaining = total_steps
+        self._block = None
+        self._position = 0
+
+    def _draw(self, n_steps):
+        """
+        Draw n_steps fresh steps of noise as one (n_steps,) + shape array.
+        """
+        if self._remaining is not None:
+            self._remaining -= n_steps
+        if self.generators is None:
+            return np.random.normal(0, self.std, size=(n_steps,) + self.shape)
+        if len(self.shape) == 1:
+            return self.generators[0].normal(0, self.std, size=(n_steps,) + self.shape)
+        block = np.empty((n_steps,) + self.shape)
+        for p, generator in enumerate(self.generators):
+            block[:, :, p] = generator.normal(0, self.std, size=(n_steps, self.shape[0]))
+        if self.signs is not None:
+            block *= self.signs
+        return block
+
+    def _buffered(self):
+        if self._block is None:
+            return np.empty((0,) + self.shape)
+        return self._block[self._position:]
+
+    def take(self, n_steps):
+        """
+        Return the noise of the next n_steps steps as one (n_steps,) + shape array.
+
+        Buffered rows are used first; a refill draws at least block_size steps
+        (capped by total_steps) and keeps the surplus for later calls.
+        """
+        buffered = self._buffered()
+        if n_steps > len(buffered):
+            missing = n_steps - len(buffered)
+            n_fresh = max(missing, self.block_size)
+            if self._remaining is not None:
+                n_fresh = max(missing, min(n_fresh, self._remaining))
+            fresh = self._draw(n_fresh)
+            buffered = np.concatenate((buffered, fresh)) if len(buffered) else fresh
+            self._block = buffered
+            self._position = 0
+        self._position += n_steps
+        return buffered[:n_steps]
+
+    def next(self):
+        """
+        Return the noise of the next step.
+        """
+        return self.take(1)[0]
+
+    def push_back(self, block):
+        """
+        Return unused noise rows so the next steps consume them first.
+        """
+        if len(block):
+            self._block = np.concatenate((block, self._buffered()))
+            self._position = 0
+
+    def get_state(self):
+        """
+        Return the stream positions and buffered rows as (meta, buffered).
+
+        meta is JSON-serializable: the bit generator state of every path stream,
+        or the legacy np.random state when drawing from the global generator.
+        """
+        meta = {"std": self.std, "remaining": self._remaining}
+        if self.generators is None:
+            name, keys, position, has_gauss, cached_gaussian = np.random.get_state()
+            meta["global_state"] = [name, keys.tolist(), position, has_gauss, cached_gaussian]
+        else:
+            meta["generator_states"] = [generator.bit_generator.state for generator in self.generators]
+        return meta, self._buffered().copy()
+
+    def set_state(self, meta, buffered, total_steps=None):
+        """
+        Restore state returned by get_state(). With the legacy generator this
+        resets the global np.random state.
+
+        total_steps optionally replaces the number of steps still to be
+        consumed (e.g. when a restored run gets a new horizon).
+        """
+        self.std = meta["std"]
+        self._remaining = meta["remaining"] if total_steps is None else total_steps - len(buffered)
+        if "global_state" in meta:
+            name, keys, position, has_gauss, cached_gaussian = meta["global_state"]
+            np.random.set_state((name, np.array(keys, dtype=np.uint32), position, has_gauss, cached_gaussian))
+            self.generators = None
+        else:
+            self.generators = [np.random.Generator(np.random.PCG64()) for _ in meta["generator_states"]]
+            for generator, state in zip(self.generators, meta["generator_states"]):
+                generator.bit_generator.state = state
+        self._block = np.array(buffered).reshape((-1,) + self.shape)
+        self._position = 0
+
+
+class SobolNoise(NoiseBlocks):
+    """
+    Ensemble noise whose leading steps come from a scrambled Sobol sequence.
+
+    Path p is point first_path + p of a Sobol sequence with one dimension per
+    (step, token) of the first qmc_steps steps, scrambled with a stream
+    derived from the seed alone; its coordinates u become std * Phi^-1(u).
+    Steps beyond qmc_steps are drawn from the per-path generators.
+
+    Attributes:
+        qmc_steps (int): Leading steps covered by the Sobol points.
+    """
+
+    def __init__(self, std, shape, generators, seed, first_path, total_steps, block_size=BLOCK_SIZE):
+        """
+        Parameters:
+            std (float): Noise standard deviation.
+            shape (tuple): Per-step noise shape, (tokens, paths).
+            generators (list): Per-path Generators for the steps past qmc_steps.
+            seed (int or np.random.SeedSequence): Run seed (selects the scrambling).
+            first_path (int): Sobol point index of the first path.
+            total_steps (int): Number of steps that will be consumed.
+            block_size (int): Steps per refill.
+        """
+        n_tokens, n_paths = shape
+        qmc_steps = min(total_steps, SOBOL_MAX_DIMENSION // n_tokens)
+        if qmc_steps < 1:
+            raise ValueError(f"Sobol noise needs at least one step of at most {SOBOL_MAX_DIMENSION} dimensions; "
+                             f"got {n_tokens} tokens and {total_steps} steps")
+        try:
+            from scipy.special import ndtri
+            from scipy.stats import qmc
+        except ImportError as e:
+            raise ImportError("Sobol noise requires the scipy package") from e
+        super().__init__(std, shape, generators, total_steps=total_steps, block_size=block_size)
+        self.qmc_steps = qmc_steps
+        self._step = 0
+        sobol = qmc.Sobol(self.qmc_steps * n_tokens, scramble=True, seed=_stream(root_seed(seed), SOBOL_SCRAMBLE_KEY))
+        if first_path:
+            sobol.fast_forward(first_path)
+        # Scrambled points never hit 0 or 1 in practice; clip so the inverse CDF stays finite
+        u = np.clip(sobol.random(n_paths), np.finfo(np.float64).tiny, 1.0 - np.finfo(np.float64).epsneg)
+        self._points = ndtri(u).reshape(n_paths, self.qmc_steps, n_tokens).transpose(1, 2, 0)
+
+    def _draw(self, n_steps):
+        n_qmc = max(0, min(n_steps, self.qmc_steps - self._step))
+        block = self.std * self._points[self._step:self._step + n_qmc]
+        self._step += n_qmc
+        if n_qmc == n_steps:
+            if self._remaining is not None:
+                self._remaining -= n_steps
+            return block
+        fresh = super()._draw(n_steps - n_qmc)
+        if self._remaining is not None:
+            self._remaining -= n_qmc
+        return np.concatenate((block, fresh)) if n_qmc else fresh
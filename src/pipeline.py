@@ -0,0 +1,307 @@
+# src/pipeline.py
+#
+# Stop conditions and pipeline stages plugged into a Simulation. Both work on
+# blocks of finished history rows, so they cost one vectorized call per block
+# rather than Python code inside the step loop.
+
+import os
+from abc import ABC, abstractmethod
+from collections import namedtuple
+
+import numpy as np
+from config import config
+from src.database import analytics, database
+from src.models.abstract_model import COLLATERAL, LIQUIDITY, MAX_SUPPLY, TARGET, VOLUME
+from src.universe import load_universe
+
+# Per-step view of a single run, backed by the history row of step t.
+# fees and rewards have shape (tokens, products); the rest (tokens,).
+StepSnapshot = namedtuple(
+    "StepSnapshot", ("t", "price", "circulation", "fees", "rewards", "control_signal", "error")
+)
+
+
+def first_step(mask, start):
+    """
+    Return start plus the index of the first True in a (steps,) mask, or None.
+    """
+    hits = np.flatnonzero(mask)
+    return int(start + hits[0]) if len(hits) else None
+
+
+class StopCondition(ABC):
+    """
+    Base class of the conditions that end a Simulation early.
+
+    check() only looks at history rows (and the constant token parameters),
+    so a condition can be evaluated on a whole block of steps at once.
+
+    Attributes:
+        reason (str): Stop reason recorded on the Simulation when triggered.
+    """
+
+    reason = "stop condition"
+
+    @abstractmethod
+    def check(self, sim, start, stop):
+        """
+        Return the first step in start..stop-1 at which the run must stop, or None.
+
+        Parameters:
+            sim (Simulation): The running simulation; rows 0..stop-1 of
+                sim.history are filled.
+            start (int): First new step.
+            stop (int): One past the last new step.
+        """
+        pass
+
+
+class PegHeld(StopCondition):
+    """
+    Stop once every token has stayed within tolerance of its target for `steps` consecutive steps.
+
+    Attributes:
+        tolerance (float): Allowed relative deviation, e.g. 0.01 for +/-1%.
+        steps (int): Number of consecutive steps the peg must hold.
+    """
+
+    reason = "peg held"
+
+    def __init__(self, tolerance=0.01, steps=100):
+        if steps < 1:
+            raise ValueError("steps must be at least 1")
+        self.tolerance = tolerance
+        self.steps = steps
+
+    def check(self, sim, start, stop):
+        # Look back far enough to see runs that started before this block
+        first = max(1, start - self.steps + 1)
+        prices = sim.history.field("price")[first:stop]
+        within = np.all(np.abs(prices - sim.tokens.target) <= self.tolerance * sim.tokens.target, axis=1)
+        # Length of the run of in-peg steps ending at each step
+        breaks = np.flatnonzero(~within)
+        last_break = np.full(len(within), -1)
+        last_break[breaks] = breaks
+        np.maximum.accumulate(last_break, out=last_break)
+        run = np.arange(len(within)) - last_break
+        offset = start - first
+        return first_step(run[offset:] >= self.steps, start)
+
+
+class PriceAtZero(StopCondition):
+    """
+    Stop as soon as any token's price hits the zero clamp.
+    """
+
+    reason = "price at zero"
+
+    def check(self, sim, start, stop):
+        prices = sim.history.field("price")[start:stop]
+        return first_step(np.any(prices <= 0.0, axis=1), start)
+
+
+class Undercollateralized(StopCondition):
+    """
+    Stop as soon as any token's market cap exceeds its collateral by the given ratio.
+
+    Attributes:
+        min_ratio (float): Minimum collateral / (price * circulation) ratio;
+            1.0 stops once the deficit burn would kick in.
+    """
+
+    reason = "undercollateralized"
+
+    def __init__(self, min_ratio=1.0):
+        self.min_ratio = min_ratio
+
+    def check(self, sim, start, stop):
+        market_cap = sim.history.field("price")[start:stop] * sim.history.field("circulation")[start:stop]
+        collateral = sim.tokens.state[COLLATERAL]
+        return first_step(np.any(collateral < self.min_ratio * market_cap, axis=1), start)
+
+
+class Stage:
+    """
+    Base class of the consumers a Simulation feeds with finished steps.
+
+    on_steps() is called once per block with the range of history rows that
+    became final (starting with row 0, the initial state); close() once when
+    the simulation is closed. If the Simulation fails while it is being built
+    (including the first on_steps() call), abort() is called instead of close().
+    """
+
+    def on_steps(self, sim, start, stop):
+        pass
+
+    def close(self, sim):
+        pass
+
+    def abort(self):
+        pass
+
+
+class DatabaseStage(Stage):
+    """
+    Store every finished step in SQLite through a batched SimulationWriter,
+    on machines with more than one CPU by default from a background process
+    (database.BackgroundWriter) so storage overlaps the step loop.
+
+    The run's token parameters go to run_tokens with the first block, and
+    its run_summaries rows (see src.database.analytics) are computed from the
+    in-memory history when the simulation is closed. If the simulation fails
+    to start, the writer is stopped and the run is deleted again.
+
+    Attributes:
+        run_id (int): Database run the steps are stored under.
+        products (tuple): Products of the stored simulation.
+    """
+
+    def __init__(self, db_path=None, model_type=None, batch_size=None, schema_path=None, background=None,
+                 products=None):
+        """
+        Initialize the database and register a new run.
+
+        The products are checked (and missing product columns added) before
+        the run is registered, so a universe the database cannot store fails
+        without leaving a run row or a writer process behind.
+
+        Parameters:
+            db_path (str): SQLite database path (defaults to config.DB_PATH).
+            model_type (str): Model name recorded with the run (defaults to config.MODEL_TYPE).
+            batch_size (int): Rows per insert transaction (defaults to config.DB_BATCH_SIZE).
+            schema_path (str): Schema file (defaults to config.SCHEMA_PATH).
+            background (bool or str): Write from a background process; "auto"
+                when more than one CPU is available (defaults to config.DB_BACKGROUND).
+            products (iterable): Products of the simulated token universe
+                (defaults to those of the configured universe).
+        """
+        db_path = config.DB_PATH if db_path is None else db_path
+        self.db_path = db_path
+        self.products = tuple(load_universe().products if products is None else products)
+        database.init_db(db_path, config.SCHEMA_PATH if schema_path is None else schema_path)
+        database.prepare_products(db_path, self.products)
+        self.run_id = database.create_run(db_path, config.MODEL_TYPE if model_type is None else model_type)
+        batch_size = config.DB_BATCH_SIZE if batch_size is None else batch_size
+        background = config.DB_BACKGROUND if background is None else background
+        if background == "auto":
+            background = (os.cpu_count() or 1) > 1
+        if background:
+            self.writer = database.BackgroundWriter(db_path, self.run_id, batch_size, config.DB_QUEUE_SIZE,
+                                                    self.products)
+        else:
+            self.writer = database.SimulationWriter(db_path, self.run_id, batch_size, self.products)
+
+    def on_steps(self, sim, start, stop):
+        if start == 0:
+            if set(sim.products) != set(self.products):
+                raise ValueError(f"DatabaseStage was set up for products {', '.join(self.products)}, "
+                                 f"but the simulation has {', '.join(sim.products)}")
+            state = sim.tokens.state
+            self.writer.store_run_tokens(sim.token_names, state[TARGET], state[COLLATERAL], state[MAX_SUPPLY])
+        self.writer.store_history(sim.history, start, stop)
+
+    def close(self, sim):
+        self.writer.close()
+        history = sim.history
+        state = sim.tokens.state
+        steps = slice(0, sim.t + 1)
+        minted = analytics.minted_per_step(sim.model, [history.field(f"fee_{prod}")[steps] for prod in sim.products],
+                                           [history.field(f"reward_{prod}")[steps] for prod in sim.products])
+        summary = analytics.summarize(history.field("price")[steps], history.field("circulation")[steps],
+                                      state[TARGET], state[COLLATERAL], minted=minted)
+        analytics.store_summary(self.db_path, self.run_id, sim.token_names, summary)
+
+    def abort(self):
+        try:
+            self.writer.close()
+        except Exception:
+            # The simulation's own error is the one being raised
+            pass
+        database.delete_run(self.db_path, self.run_id)
+
+
+class CheckpointStage(Stage):
+    """
+    Write a checkpoint (see Simulation.save_checkpoint) every `every` steps and
+    when the simulation is closed.
+
+    Checkpoints are taken at the end of the first block reaching each multiple
+    of `every`. The path may contain "{t}" to keep one file per checkpoint;
+    otherwise every checkpoint replaces the previous one.
+
+    Attributes:
+        path (str): Checkpoint file (or "{t}" template).
+        every (int): Checkpoint interval in steps.
+    """
+
+    def __init__(self, path, every):
+        if every < 1:
+            raise ValueError("every must be at least 1")
+        self.path = path
+        self.every = every
+        self._last = None
+
+    def _save(self, sim):
+        if sim.t != self._last:
+            sim.save_checkpoint(self.path.format(t=sim.t))
+            self._last = sim.t
+
+    def on_steps(self, sim, start, stop):
+        # Row 0 (or the prefix replayed after a restore) needs no checkpoint
+        if start > 0 and (stop - 1) // self.every > (start - 1) // self.every:
+            self._save(sim)
+
+    def close(self, sim):
+        self._save(sim)
+
+
+class TrainingStage(Stage):
+    """
+    Train the model online from every finished block (opt-in; by default the
+    network of the "nn" model is never trained during a run).
+
+    Each block of steps start..stop-1 becomes NNModel.training_data_from_history
+    samples, passed to model.update(): they join its replay buffer and a few
+    mini-batch steps are taken, so later blocks are predicted by the updated
+    network. Training consumes the model's own RNG and is therefore not
+    reproduced by the run seed.
+
+    Attributes:
+        every (int): Minimum number of new steps between two updates.
+        losses (list): (step, mean mini-batch loss) of every update.
+    """
+
+    def __init__(self, every=1):
+        if every < 1:
+            raise ValueError("every must be at least 1")
+        self.every = every
+        self.losses = []
+        self._trained = None
+
+    def on_steps(self, sim, start, stop):
+        if start == 0:
+            if not hasattr(sim.model, "training_data_from_history"):
+                raise ValueError(f"TrainingStage needs a trainable model such as 'nn', not '{sim.model_type}'")
+            self._trained = stop
+            return
+        if stop - self._trained < self.every:
+            return
+        state = sim.tokens.state
+        data = sim.model.training_data_from_history(sim.history, state[VOLUME], state[LIQUIDITY],
+                                                    start=self._trained, stop=stop)
+        self.losses.append((stop - 1, sim.model.update(data)))
+        self._trained = stop
+
+
+class CallbackStage(Stage):
+    """
+    Call a function with the StepSnapshot of every finished step, e.g. to
+    update a live plot or a metric.
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def on_steps(self, sim, start, stop):
+        for t in range(start, stop):
+            self.callback(sim.snapshot(t))
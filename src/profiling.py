@@ -0,0 +1,147 @@
+# src/profiling.py
+#
+# Opt-in instrumentation of the simulation loop: per-phase wall-clock timers
+# and a switch between cProfile and pyinstrument. When a Simulation runs without
+# timing or a profiler, the step loop only pays one `is not None` test per phase.
+
+import io
+import time
+
+# Phases of the NumPy step loop, in loop order
+STEP_PHASES = ("A: pid + gradient", "B: model predict", "C: history")
+
+
+class PhaseTimer:
+    """
+    Accumulates wall-clock time and call counts per named phase.
+
+    Phases are free-form names: the step loop reports STEP_PHASES, the
+    compiled and Python backends "kernel" (A-C fused), and the block level
+    "noise", "stop conditions" and one "stage: <class>" entry per pipeline stage.
+
+    Every phase processes all tokens at once, so its time is only known per
+    step. The ns/token-step figure divides it evenly by steps * tokens: it is
+    an average cost per token, not a per-token breakdown, and says nothing
+    about which tokens are expensive.
+
+    Attributes:
+        label (str): Description of the timed run (e.g. model and backend).
+        n_tokens (int): Tokens per step, used for the average per-token-step figures.
+        steps (int): Number of timed steps.
+        seconds (dict): Phase name -> accumulated seconds.
+        calls (dict): Phase name -> number of timed calls.
+    """
+
+    clock = staticmethod(time.perf_counter)
+
+    def __init__(self, label="", n_tokens=1):
+        self.label = label
+        self.n_tokens = n_tokens
+        self.steps = 0
+        self.seconds = {}
+        self.calls = {}
+
+    def add(self, phase, seconds, calls=1):
+        """
+        Add seconds (over calls calls) to a phase.
+        """
+        self.seconds[phase] = self.seconds.get(phase, 0.0) + seconds
+        self.calls[phase] = self.calls.get(phase, 0) + calls
+
+    def as_dict(self):
+        """
+        Return the totals as a JSON-serializable dict.
+        """
+        return {
+            "label": self.label,
+            "steps": self.steps,
+            "n_tokens": self.n_tokens,
+            "phases": {
+                phase: {"seconds": seconds, "calls": self.calls[phase]} for phase, seconds in self.seconds.items()
+            },
+        }
+
+    def report(self):
+        """
+        Return a text table of the time spent per phase, with the average
+        cost per step and per token-step.
+        """
+        total = sum(self.seconds.values())
+        steps = max(self.steps, 1)
+        token_steps = steps * max(self.n_tokens, 1)
+        lines = [
+            f"Phase timings: {self.label} ({self.steps} steps, {self.n_tokens} tokens, {total:.3f} s)",
+            f"{'phase':28s} {'seconds':>10s} {'share':>7s} {'calls':>10s} {'us/step':>10s} "
+            f"{'avg ns/token-step':>18s}",
+        ]
+        for phase, seconds in sorted(self.seconds.items(), key=lambda item: -item[1]):
+            share = seconds / total if total else 0.0
+            lines.append(
+                f"{phase:28s} {seconds:10.4f} {share:7.1%} {self.calls[phase]:10d} "
+                f"{1e6 * seconds / steps:10.2f} {1e9 * seconds / token_steps:18.1f}"
+            )
+        lines.append("(avg ns/token-step spreads each phase evenly over the tokens; it is not a per-token breakdown)")
+        return "\n".join(lines)
+
+
+class Profiler:
+    """
+    Switch between cProfile and pyinstrument behind one start/stop interface.
+
+    start() and stop() may be called repeatedly; the samples of every
+    start/stop window are combined into one report.
+
+    Attributes:
+        kind (str): "cprofile" or "pyinstrument".
+    """
+
+    KINDS = ("cprofile", "pyinstrument")
+
+    def __init__(self, kind):
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown profiler: {kind} (expected one of {', '.join(self.KINDS)})")
+        self.kind = kind
+        if kind == "cprofile":
+            import cProfile
+            self._profiler = cProfile.Profile()
+        else:
+            try:
+                from pyinstrument import Profiler as PyinstrumentProfiler
+            except ImportError as e:
+                raise ImportError("profiler='pyinstrument' requires the pyinstrument package") from e
+            self._profiler_class = PyinstrumentProfiler
+            self._profiler = None
+            self._sessions = []
+
+    def start(self):
+        if self.kind == "cprofile":
+            self._profiler.enable()
+        else:
+            # One pyinstrument session per window; report() combines them
+            self._profiler = self._profiler_class()
+            self._profiler.start()
+
+    def stop(self):
+        if self.kind == "cprofile":
+            self._profiler.disable()
+        else:
+            self._sessions.append(self._profiler.stop())
+
+    def report(self, limit=25):
+        """
+        Return the profile as text: the top `limit` functions by cumulative
+        time for cProfile, the call tree for pyinstrument.
+        """
+        if self.kind == "cprofile":
+            import pstats
+            out = io.StringIO()
+            pstats.Stats(self._profiler, stream=out).sort_stats("cumulative").print_stats(limit)
+            return out.getvalue()
+        from pyinstrument.session import Session
+        session = None
+        for part in self._sessions:
+            session = part if session is None else Session.combine(session, part)
+        if session is None:
+            return ""
+        from pyinstrument.renderers import ConsoleRenderer
+        return ConsoleRenderer(unicode=False, color=False).render(session)
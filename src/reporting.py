@@ -0,0 +1,67 @@
+# src/reporting.py
+#
+# Plotting for simulation results. This module is only imported on demand, so
+# headless runs and pool workers never load matplotlib.
+
+import os
+
+# (history field, figure title, y-axis label, file name)
+FIGURES = [
+    ("price", "Token Prices Over Time", "Price", "prices"),
+    ("circulation", "Tokens in Circulation Over Time", "Circulation", "circulation"),
+]
+
+
+def _draw(ax, result, field, title, ylabel):
+    values = result.field(field)
+    label = field.capitalize()
+    for i, token_name in enumerate(result.token_names):
+        ax.plot(values[:, i], label=f'{token_name} {label}')
+    ax.set_title(title)
+    ax.set_xlabel('Time Step')
+    ax.set_ylabel(ylabel)
+    ax.legend()
+    ax.grid(True)
+
+
+def save_figures(result, output_dir, fmt="png"):
+    """
+    Render the price and circulation plots of a run to image files.
+
+    Figures are drawn with matplotlib's object-oriented API on an Agg canvas,
+    so no GUI backend is ever selected and this is safe in batch jobs.
+
+    Parameters:
+        result (SimulationResult): Result returned by simulate().
+        output_dir (str): Directory for the images (created if missing).
+        fmt (str): Image format understood by matplotlib (e.g. "png", "svg").
+
+    Returns:
+        list: Paths of the written files.
+    """
+    from matplotlib.figure import Figure
+
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for field, title, ylabel, name in FIGURES:
+        fig = Figure(figsize=(10, 6))
+        _draw(fig.add_subplot(), result, field, title, ylabel)
+        path = os.path.join(output_dir, f"{name}.{fmt}")
+        fig.savefig(path)
+        paths.append(path)
+    return paths
+
+
+def show_figures(result):
+    """
+    Display the price and circulation plots of a run interactively.
+
+    Parameters:
+        result (SimulationResult): Result returned by simulate().
+    """
+    import matplotlib.pyplot as plt
+
+    for field, title, ylabel, _ in FIGURES:
+        fig, ax = plt.subplots(figsize=(10, 6))
+        _draw(ax, result, field, title, ylabel)
+        plt.show()
@@ -1,149 +1,777 @@
 # src/simulation.py
 
+import contextlib
+import json
+import os
+import warnings
 import numpy as np
-import matplotlib.pyplot as plt
 from config import config
-from src.controllers.controller import PIDController, compute_gradients
-from src.database import database
-
-# Import the model based on config
-if config.MODEL_TYPE == "nudge":
-    from src.models.nudge_model import NudgeModel as BaseModel
-elif config.MODEL_TYPE == "linear":
-    from src.models.linear_model import LinearModel as BaseModel
-elif config.MODEL_TYPE == "nn":
-    from src.models.nn_model import NNModel as BaseModel
-else:
-    raise ValueError(f"Unknown MODEL_TYPE in config: {config.MODEL_TYPE}")
-
-def simulate():
-    # 1. Initialize token states from config
-    tokens = {}
-    for token_name, token_info in config.TOKENS.items():
-        tokens[token_name] = {
-            "price": token_info["initial_price"],
-            "circulation": token_info["initial_circulation"],
-            "collateral": token_info["collateral"],
-            "fees": token_info["fees"].copy(),
-            "rewards": token_info["rewards"].copy(),
-            "target": token_info["target_price"],
-            "max_supply": token_info["max_supply"]
+from src.cache import cache_key, cacheable_model, pack_meta, resolve_cache, unpack_meta
+from src.controllers.controller import PIDBank, update_and_clip
+from src.database import analytics
+from src.history import SimulationHistory
+from src.models.registry import get_model_class
+from src.noise import NoiseBlocks, path_generators, root_seed
+from src.pipeline import CheckpointStage, DatabaseStage, StepSnapshot
+from src.profiling import STEP_PHASES, PhaseTimer, Profiler
+from src.state import TokenState
+from src.universe import load_universe
+
+# Config knobs that can be overridden when restoring a checkpoint
+CHECKPOINT_PARAMETERS = ("K_P", "K_I", "K_D", "LEARNING_RATE", "NOISE_STD")
+
+# Steps advanced per block by Simulation.step(); stop conditions and stages run once per
+# block. Compiled blocks are larger since a compiled step costs far less than a NumPy one.
+STEP_BLOCK_SIZE = 256
+COMPILED_BLOCK_SIZE = 16_384
+
+# Values of the backend argument (see simulate)
+BACKENDS = ("numpy", "numba", "python", "auto")
+
+@contextlib.contextmanager
+def _aborting(stages):
+    """
+    Abort the given stages (see Stage.abort) if building a Simulation fails.
+    """
+    try:
+        yield
+    except BaseException:
+        for stage in stages:
+            stage.abort()
+        raise
+
+
+class SimulationResult:
+    """
+    Structured outcome of a simulate() run.
+
+    Attributes:
+        token_names (list): Simulated tokens, in history order.
+        products (list): Fee/reward products, in history order.
+        history (SimulationHistory): Per-step trajectories of every token.
+        model_type (str): Name of the model that drove the run.
+        run_id (int): Database run id, or None when results were not stored.
+        time_steps (int): Number of steps actually run (fewer than the
+            history holds when a stop condition ended the run early).
+        stop_reason (str): Reason of an early stop, or None.
+        timings (PhaseTimer): Per-phase timings if the run was timed, else None.
+        profiler (Profiler): The run's profiler if one was enabled, else None.
+        summary (dict): Per-token analytics.summarize() metrics of a cached
+            run, else None.
+        cached (bool): Whether the result was served from the result cache.
+    """
+
+    def __init__(self, token_names, products, history, model_type, run_id=None, time_steps=None,
+                 stop_reason=None, timings=None, profiler=None, summary=None, cached=False):
+        self.token_names = token_names
+        self.products = products
+        self.history = history
+        self.model_type = model_type
+        self.run_id = run_id
+        self.time_steps = len(history.data) - 1 if time_steps is None else time_steps
+        self.stop_reason = stop_reason
+        self.timings = timings
+        self.profiler = profiler
+        self.summary = summary
+        self.cached = cached
+
+    def field(self, name):
+        """(time_steps + 1, tokens) view of one history field over the steps that ran."""
+        return self.history.field(name)[:self.time_steps + 1]
+
+    @property
+    def prices(self):
+        """(time_steps + 1, tokens) view of the token prices."""
+        return self.field("price")
+
+    @property
+    def circulation(self):
+        """(time_steps + 1, tokens) view of the token circulation."""
+        return self.field("circulation")
+
+
+class Simulation:
+    """
+    Resumable single run of the PID + model pipeline.
+
+    The run is advanced with step(n), possibly over many calls, and every
+    finished step is stored in a preallocated SimulationHistory. Steps are
+    processed in blocks: each block takes its noise up front, runs either the
+    NumPy step loop or the fused nudge kernel (src.kernels), then checks
+    the stop conditions on the new history rows and hands them to the stages.
+    When a condition fires inside a block the run is rewound to the start of
+    the block and replayed up to the triggering step with the same noise, so
+    the state is exactly that of the stop step and the unused noise is kept
+    for a later resume.
+
+    Usage:
+        sim = Simulation(stop_conditions=[PegHeld(0.01, 50)], stages=[DatabaseStage()])
+        while sim.step(1000):
+            print(sim.t, sim.tokens.price)
+        result = sim.close()
+
+    Attributes:
+        model_type (str): Name of the model driving the run.
+        time_steps (int): Maximum number of steps (history length - 1).
+        tokens (TokenState): Current state of every token.
+        model (AbstractModel): The model instance.
+        pids (PIDBank): One PID controller per token.
+        history (SimulationHistory): Trajectories of the finished steps.
+        stop_conditions (list): StopCondition objects checked after every block.
+        stages (list): Stage objects fed with every finished block.
+        t (int): Number of steps run so far.
+        stop_reason (str): Reason of the stop condition that fired, or None.
+            Resetting it to None lets step() continue past the stop.
+        compiled (bool): Whether the compiled kernel drives the steps.
+        engine (str): Step loop in use: "numba", "python" or "numpy".
+    """
+
+    def __init__(self, model_type=None, time_steps=None, history_path=None, backend=None, seed=None,
+                 stop_conditions=(), stages=(), volume=10.0, liquidity=5.0, timing=False, profiler=None,
+                 universe=None):
+        """
+        Build the initial state, model and controllers and record step 0.
+
+        Parameters:
+            model_type (str): Registered model name, e.g. "nudge", "linear" or "nn"
+                (defaults to config.MODEL_TYPE).
+            time_steps (int): Maximum number of steps (defaults to config.TIME_STEPS).
+            history_path (str): Optional .npy file backing the history as a memory
+                map (defaults to config.HISTORY_PATH; None keeps it in memory).
+            backend (str): "numpy", "numba", "python" or "auto" (defaults to config.BACKEND).
+            seed (int or np.random.SeedSequence): Optional seed of a dedicated noise
+                stream; None draws from the global np.random state.
+            stop_conditions (iterable): StopCondition objects (see src.pipeline).
+            stages (iterable): Stage objects (see src.pipeline).
+            volume (float): Market volume fed to the model.
+            liquidity (float): Market liquidity fed to the model.
+            timing (bool): Record per-phase wall-clock timings (see src.profiling).
+            profiler (str): Optional "cprofile" or "pyinstrument" profiler run
+                around every step() call.
+            universe: TokenUniverse, spec path or spec dict of the simulated
+                tokens (defaults to config.TOKEN_UNIVERSE, then config.TOKENS).
+        """
+        stages = list(stages)
+        with _aborting(stages):
+            self.model_type = config.MODEL_TYPE if model_type is None else model_type
+            self.time_steps = config.TIME_STEPS if time_steps is None else time_steps
+            if history_path is None:
+                history_path = config.HISTORY_PATH
+            if backend is None:
+                backend = config.BACKEND
+            if backend not in BACKENDS:
+                raise ValueError(f"Unknown backend: {backend} (expected 'numpy', 'numba', 'python' or 'auto')")
+
+            # 1. Initialize the compact token state once from the compiled token universe
+            self.universe = load_universe(universe)
+            self.tokens = TokenState.from_universe(self.universe, volume=volume, liquidity=liquidity)
+            self.token_names = self.tokens.token_names
+            self.products = self.tokens.products
+            self.fees_coefs = self.universe.fees_coefs.copy()
+            self.rewards_coefs = self.universe.rewards_coefs.copy()
+
+            # 2. Create the model (shared by all tokens) & a bank of one PID per token
+            self.model = get_model_class(self.model_type)()
+            self.pids = PIDBank(config.K_P, config.K_I, config.K_D, shape=self.tokens.price.shape)
+            self.learning_rate = config.LEARNING_RATE
+            self._control_signal = np.empty(len(self.token_names))
+            self._error = np.empty(len(self.token_names))
+            self._scratch = np.empty_like(self.tokens.params)
+            generators = None if seed is None else path_generators(seed, 0, 1)
+            self.noise = NoiseBlocks(config.NOISE_STD, self.tokens.price.shape, generators,
+                                     total_steps=self.time_steps)
+
+            self.backend = backend
+            self._select_backend()
+
+            # 3. Preallocate the history (price, circulation, fees, rewards, control, error)
+            self.history = SimulationHistory(self.time_steps, self.token_names, self.products, path=history_path)
+            self.history.record_tokens(0, self.tokens)
+
+            self.stop_conditions = list(stop_conditions)
+            self.stages = list(stages)
+            self.timer = None
+            self.profiler = None
+            if timing:
+                self.timer = PhaseTimer(f"{self.model_type} model, {self.engine} backend", len(self.token_names))
+            if profiler:
+                self.profiler = Profiler(profiler)
+            self.t = 0
+            self.stop_reason = None
+            self._closed = False
+            for stage in self.stages:
+                stage.on_steps(self, 0, 1)
+
+    def _select_backend(self):
+        self.engine = "numpy"
+        if self.backend != "numpy":
+            from src import kernels
+            if kernels.applies(self.model, self.pids):
+                if self.backend != "python" and kernels.NUMBA_AVAILABLE:
+                    self.engine = "numba"
+                elif self.backend == "python" or (
+                        self.backend == "auto" and len(self.token_names) <= kernels.PYTHON_MAX_TOKENS):
+                    self.engine = "python"
+            if self.engine == "numpy" and self.backend == "numba":
+                warnings.warn("Compiled backend unavailable for this run (requires numba and the nudge model); "
+                              "falling back to the NumPy loop", RuntimeWarning)
+            elif self.engine == "numpy" and self.backend == "python":
+                warnings.warn("Python kernel unavailable for this run (requires the nudge model); "
+                              "falling back to the NumPy loop", RuntimeWarning)
+        self.compiled = self.engine == "numba"
+
+    @property
+    def done(self):
+        """True once the run reached time_steps or a stop condition fired."""
+        return self.t >= self.time_steps or self.stop_reason is not None
+
+    def snapshot(self, t=None):
+        """
+        Return the StepSnapshot of step t (defaults to the current step).
+        """
+        row = self.history.data[self.t if t is None else t]
+        n_products = len(self.products)
+        return StepSnapshot(
+            self.t if t is None else t, row[:, 0], row[:, 1],
+            row[:, 2:2 + n_products], row[:, 2 + n_products:2 + 2 * n_products], row[:, -2], row[:, -1],
+        )
+
+    def _save(self):
+        pids = self.pids
+        return self.tokens.copy(), pids.integral.copy(), pids.prev_error.copy(), pids.derivative.copy()
+
+    def _restore(self, saved):
+        tokens, integral, prev_error, derivative = saved
+        np.copyto(self.tokens.state, tokens.state)
+        np.copyto(self.tokens.params, tokens.params)
+        np.copyto(self.pids.integral, integral)
+        np.copyto(self.pids.prev_error, prev_error)
+        np.copyto(self.pids.derivative, derivative)
+
+    def _advance(self, start, n_steps, noise):
+        """
+        Run n_steps steps from step start, filling history rows start..start+n_steps-1.
+        """
+        tokens = self.tokens
+        timer = self.timer
+        if self.engine != "numpy":
+            from src import kernels
+            if timer is not None:
+                t0 = timer.clock()
+            kernels.run_nudge(tokens, self.pids, self.model, self.fees_coefs, self.rewards_coefs,
+                              self.learning_rate, noise, np.asarray(self.history.data[start:start + n_steps]),
+                              compiled=self.compiled)
+            if timer is not None:
+                timer.add("kernel", timer.clock() - t0)
+            return
+
+        error = self._error
+        control_signal = self._control_signal
+        coefs = np.stack((self.fees_coefs, self.rewards_coefs))
+        if timer is not None:
+            phase_a, phase_b, phase_c = STEP_PHASES
+        for s in range(n_steps):
+            if timer is not None:
+                t0 = timer.clock()
+            # A) For all tokens at once, we do:
+            #    1) Update fees & rewards with PID + gradient
+            #    2) Clamp them
+            #    3) Let the model compute next price & supply
+            np.subtract(tokens.price, tokens.target, out=error)
+            self.pids.update(error, out=control_signal)
+
+            # Gradient step on (P - target)^2, control signal and clamp (0 to 5)
+            update_and_clip(tokens.params, error, coefs, control_signal, self.learning_rate, 0.0, 5.0, self._scratch)
+            if timer is not None:
+                t1 = timer.clock()
+                timer.add(phase_a, t1 - t0)
+
+            # B) Compute next price & supply using the model
+            tokens.update_totals()
+            self.model.predict_batch(tokens.state, None if noise is None else noise[s], out=tokens.state)
+            if timer is not None:
+                t2 = timer.clock()
+                timer.add(phase_b, t2 - t1)
+
+            # C) Log data
+            self.history.record_tokens(start + s, tokens, control_signal, error)
+            if timer is not None:
+                timer.add(phase_c, timer.clock() - t2)
+
+    def step(self, n=1):
+        """
+        Advance the run by up to n steps.
+
+        Stops early at time_steps or when a stop condition fires (see
+        stop_reason).
+
+        Parameters:
+            n (int): Maximum number of steps to run.
+
+        Returns:
+            int: Number of steps actually run (0 once the run is done).
+        """
+        if self.profiler is not None:
+            self.profiler.start()
+        try:
+            taken = self._step(n)
+        finally:
+            if self.profiler is not None:
+                self.profiler.stop()
+        if self.timer is not None:
+            self.timer.steps += taken
+        return taken
+
+    def _step(self, n):
+        timer = self.timer
+        taken = 0
+        while taken < n and not self.done:
+            block_size = COMPILED_BLOCK_SIZE if self.compiled else STEP_BLOCK_SIZE
+            n_block = min(n - taken, block_size, self.time_steps - self.t)
+            start = self.t + 1
+            stop = start + n_block
+            saved = self._save() if self.stop_conditions and n_block > 1 else None
+            if timer is not None:
+                t0 = timer.clock()
+            noise = self.noise.take(n_block) if self.model.stochastic else None
+            if timer is not None:
+                timer.add("noise", timer.clock() - t0)
+            self._advance(start, n_block, noise)
+
+            if timer is not None:
+                t0 = timer.clock()
+            hit = None
+            for condition in self.stop_conditions:
+                t_stop = condition.check(self, start, stop)
+                if t_stop is not None and (hit is None or t_stop < hit[0]):
+                    hit = (t_stop, condition.reason)
+            if timer is not None and self.stop_conditions:
+                timer.add("stop conditions", timer.clock() - t0)
+            if hit is not None:
+                t_stop, self.stop_reason = hit
+                if t_stop + 1 < stop:
+                    # Replay the block up to the stop step and keep the unused noise
+                    n_kept = t_stop + 1 - start
+                    self._restore(saved)
+                    self._advance(start, n_kept, None if noise is None else noise[:n_kept])
+                    self.history.data[t_stop + 1:stop] = np.nan
+                    if noise is not None:
+                        self.noise.push_back(noise[n_kept:])
+                    stop = t_stop + 1
+
+            taken += stop - start
+            self.t = stop - 1
+            for stage in self.stages:
+                if timer is not None:
+                    t0 = timer.clock()
+                stage.on_steps(self, start, stop)
+                if timer is not None:
+                    timer.add(f"stage: {type(stage).__name__}", timer.clock() - t0)
+        return taken
+
+    def save_checkpoint(self, path):
+        """
+        Write the complete state of the run to a compact .npz checkpoint.
+
+        The checkpoint holds the token state, the PID integrals/errors and
+        gains, the model state (get_state(); torch weights and optimizer go to
+        a <path>.pt sidecar through save_weights()), the noise stream positions
+        with any buffered noise, and the history rows 0..t. A memory-mapped
+        history is flushed and referenced by path instead of copied. The file
+        is written to a temporary name first, so an interrupted write never
+        replaces a good checkpoint.
+
+        Parameters:
+            path (str): Checkpoint file, conventionally ending in .npz.
+        """
+        noise_meta, noise_buffer = self.noise.get_state()
+        model_state = self.model.get_state()
+        model_arrays = {name: value for name, value in model_state.items() if isinstance(value, np.ndarray)}
+        meta = {
+            "model_type": self.model_type,
+            "time_steps": self.time_steps,
+            "t": self.t,
+            "stop_reason": self.stop_reason,
+            "token_names": self.token_names,
+            "products": self.products,
+            "learning_rate": self.learning_rate,
+            "integral_limit": self.pids.integral_limit,
+            "derivative_filter": self.pids.derivative_filter,
+            "noise": noise_meta,
+            "model": {name: value for name, value in model_state.items() if name not in model_arrays},
+            "model_arrays": list(model_arrays),
+            "weights": self.model.save_weights(path + ".pt"),
+            "history_path": self.history.path,
         }
+        arrays = {
+            "state": self.tokens.state, "fees": self.tokens.fees, "rewards": self.tokens.rewards,
+            "fees_coefs": self.fees_coefs, "rewards_coefs": self.rewards_coefs,
+            "Kp": self.pids.Kp, "Ki": self.pids.Ki, "Kd": self.pids.Kd,
+            "integral": self.pids.integral, "prev_error": self.pids.prev_error,
+            "derivative": self.pids.derivative, "noise_buffer": noise_buffer,
+        }
+        arrays.update({"model_" + name: value for name, value in model_arrays.items()})
+        if self.history.path is None:
+            arrays["history"] = self.history.data[:self.t + 1]
+        else:
+            self.history.flush()
+
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, meta=np.array(json.dumps(meta)), **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def from_checkpoint(cls, checkpoint, time_steps=None, history_path=None, backend=None, seed=None,
+                        params=None, stop_conditions=(), stages=(), timing=False, profiler=None,
+                        universe=None):
+        """
+        Rebuild a Simulation from a checkpoint and continue where it stopped.
+
+        Without seed or params the restored run continues exactly as the
+        original would have. A seed gives the run a fresh noise stream and
+        params override parameters, which turns the restore into a what-if
+        branch of the checkpointed state (see fork_checkpoint()).
+
+        Parameters:
+            checkpoint (str or dict): Checkpoint path, or the dict returned by
+                read_checkpoint() to restore several runs from one read.
+            time_steps (int): New maximum number of steps (defaults to the
+                checkpointed run's; must be at least its current step).
+            history_path (str): Optional .npy file backing the new history.
+            backend (str): "numpy", "numba", "python" or "auto" (defaults to config.BACKEND).
+            seed (int or np.random.SeedSequence): Optional seed of a new noise stream.
+            params (dict): Optional overrides; keys may be any of
+                CHECKPOINT_PARAMETERS or a model attribute (e.g. "k_fee").
+            stop_conditions (iterable): StopCondition objects for the restored run.
+            stages (iterable): Stage objects; they first receive rows 0..t.
+            timing (bool): Record per-phase timings of the restored run.
+            profiler (str): Optional "cprofile" or "pyinstrument" profiler.
+            universe: Token universe of the checkpointed run (defaults to the
+                configured one); its tokens and products must match.
+
+        Returns:
+            Simulation: The restored run at step t.
+        """
+        stages = list(stages)
+        with _aborting(stages):
+            if isinstance(checkpoint, str):
+                checkpoint = read_checkpoint(checkpoint)
+            meta = checkpoint["meta"]
+            t = meta["t"]
+            if time_steps is None:
+                time_steps = meta["time_steps"]
+            if time_steps < t:
+                raise ValueError(f"time_steps ({time_steps}) is before the checkpointed step {t}")
+            # Read the history prefix before a new history file could replace it
+            if "history" in checkpoint:
+                prefix = checkpoint["history"]
+            else:
+                prefix = np.array(SimulationHistory.load(meta["history_path"]).data[:t + 1])
+
+            sim = cls(meta["model_type"], time_steps=time_steps, history_path=history_path, backend=backend,
+                      timing=timing, profiler=profiler, universe=universe)
+            if sim.token_names != meta["token_names"] or sim.products != meta["products"]:
+                raise ValueError("Checkpoint tokens or products do not match the token universe")
+
+            np.copyto(sim.tokens.state, checkpoint["state"])
+            np.copyto(sim.tokens.fees, checkpoint["fees"])
+            np.copyto(sim.tokens.rewards, checkpoint["rewards"])
+            sim.fees_coefs = checkpoint["fees_coefs"].copy()
+            sim.rewards_coefs = checkpoint["rewards_coefs"].copy()
+            sim.pids = PIDBank(checkpoint["Kp"], checkpoint["Ki"], checkpoint["Kd"], shape=sim.tokens.price.shape,
+                               integral_limit=meta["integral_limit"], derivative_filter=meta["derivative_filter"])
+            np.copyto(sim.pids.integral, checkpoint["integral"])
+            np.copyto(sim.pids.prev_error, checkpoint["prev_error"])
+            np.copyto(sim.pids.derivative, checkpoint["derivative"])
+            sim.learning_rate = meta["learning_rate"]
+
+            model_state = dict(meta["model"])
+            model_state.update({name: checkpoint["model_" + name].copy() for name in meta["model_arrays"]})
+            sim.model.set_state(model_state)
+            if meta["weights"]:
+                sim.model.load_weights(checkpoint["path"] + ".pt")
+
+            remaining = time_steps - t
+            if seed is None:
+                sim.noise.set_state(meta["noise"], checkpoint["noise_buffer"], total_steps=remaining)
+            else:
+                sim.noise = NoiseBlocks(meta["noise"]["std"], sim.tokens.price.shape, path_generators(seed, 0, 1),
+                                        total_steps=remaining)
+
+            for name, value in (params or {}).items():
+                if name in ("K_P", "K_I", "K_D"):
+                    setattr(sim.pids, "K" + name[-1].lower(), np.asarray(value, dtype=np.float64))
+                elif name == "LEARNING_RATE":
+                    sim.learning_rate = value
+                elif name == "NOISE_STD":
+                    sim.noise.std = value
+                elif hasattr(sim.model, name):
+                    setattr(sim.model, name, value)
+                else:
+                    raise ValueError(f"Unknown simulation parameter: {name}")
+            sim._select_backend()
+            if sim.timer is not None:
+                sim.timer.label = f"{sim.model_type} model, {sim.engine} backend"
+
+            sim.history.data[:t + 1] = prefix
+            sim.t = t
+            sim.stop_reason = meta["stop_reason"]
+            sim.stop_conditions = list(stop_conditions)
+            sim.stages = list(stages)
+            for stage in sim.stages:
+                stage.on_steps(sim, 0, t + 1)
+            return sim
+
+    def run(self):
+        """
+        Run until time_steps or a stop condition, then close and return the result.
+        """
+        try:
+            while self.step(self.time_steps):
+                pass
+        finally:
+            result = self.close()
+        return result
+
+    def result(self):
+        """
+        Return a SimulationResult over the steps run so far.
+        """
+        run_id = next((stage.run_id for stage in self.stages if isinstance(stage, DatabaseStage)), None)
+        return SimulationResult(self.token_names, self.products, self.history, self.model_type,
+                                run_id=run_id, time_steps=self.t, stop_reason=self.stop_reason,
+                                timings=self.timer, profiler=self.profiler)
+
+    def close(self):
+        """
+        Close every stage, flush the history and return the result.
+        """
+        if not self._closed:
+            self._closed = True
+            for stage in self.stages:
+                stage.close(self)
+            self.history.flush()
+        return self.result()
+
+
+def read_checkpoint(path):
+    """
+    Load a checkpoint written by Simulation.save_checkpoint() into memory.
+
+    Returns:
+        dict: The checkpoint arrays, its decoded "meta" and its "path".
+    """
+    with np.load(path) as data:
+        checkpoint = {name: data[name] for name in data.files}
+    checkpoint["meta"] = json.loads(str(checkpoint["meta"]))
+    checkpoint["path"] = path
+    return checkpoint
+
+
+def fork_checkpoint(path, n_branches, seed=None, params=None, **kwargs):
+    """
+    Restore several what-if branches from one warmed-up checkpoint.
+
+    The checkpoint is read once and every branch starts from its state, so
+    the burn-in is never re-run. Branch i draws its noise from child i of
+    SeedSequence(seed) (all branches continue the checkpointed stream when
+    seed is None) and applies params[i] if a list of overrides is given.
+
+    Parameters:
+        path (str): Checkpoint written by Simulation.save_checkpoint().
+        n_branches (int): Number of branches.
+        seed (int or np.random.SeedSequence): Root seed of the branch noise streams.
+        params (dict or list): Overrides applied to every branch, or one dict per branch.
+        **kwargs: Further Simulation.from_checkpoint() arguments (time_steps, ...).
+            history_path may contain "{branch}" to give each branch its own file.
+
+    Returns:
+        list: One Simulation per branch.
+    """
+    checkpoint = read_checkpoint(path)
+    seeds = [None] * n_branches if seed is None else root_seed(seed).spawn(n_branches)
+    if params is None or isinstance(params, dict):
+        params = [params] * n_branches
+    if len(params) != n_branches:
+        raise ValueError(f"Expected {n_branches} parameter sets, got {len(params)}")
+    history_path = kwargs.pop("history_path", None)
+
+    branches = []
+    for i in range(n_branches):
+        branch_history = None if history_path is None else history_path.format(branch=i)
+        branches.append(Simulation.from_checkpoint(checkpoint, history_path=branch_history, seed=seeds[i],
+                                                   params=params[i], **kwargs))
+    return branches
+
+
+def iter_simulation(block=1, **kwargs):
+    """
+    Run a Simulation as a generator of per-step StepSnapshot objects.
+
+    Step 0 (the initial state) is yielded first; stop conditions and stages
+    work as with Simulation, and the simulation is closed when the generator
+    is exhausted or closed.
+
+    Parameters:
+        block (int): Steps advanced per step() call; snapshots are still
+            yielded one step at a time.
+        **kwargs: Simulation arguments (model_type, stop_conditions, stages, ...).
+
+    Yields:
+        StepSnapshot: Views of the history row of each finished step.
+    """
+    sim = Simulation(**kwargs)
+    try:
+        yield sim.snapshot(0)
+        t = 0
+        while sim.step(block):
+            for t in range(t + 1, sim.t + 1):
+                yield sim.snapshot(t)
+    finally:
+        sim.close()
+
+
+def simulate(model_type=None, history_path=None, figures_dir=None, backend=None, seed=None,
+             stop_conditions=(), stages=(), checkpoint_path=None, checkpoint_every=None, resume_from=None,
+             timing=None, profiler=None, universe=None, cache=None):
+    """
+    Run the simulation headlessly and return a SimulationResult.
+
+    Parameters:
+        model_type (str): Registered model name, e.g. "nudge", "linear" or "nn"
+            (defaults to config.MODEL_TYPE). The model module is imported
+            lazily, so only the selected model's dependencies are loaded.
+        history_path (str): Optional .npy file backing the history as a memory
+            map (defaults to config.HISTORY_PATH; None keeps it in memory).
+        figures_dir (str): Optional directory to save the price and circulation
+            plots to, rendered with a non-interactive backend.
+        backend (str): "numpy" for the vectorized step loop, "numba" for the
+            compiled nudge kernel (src.kernels), "python" for the same loop in
+            plain Python, or "auto" to use the compiled kernel whenever it
+            applies and, without Numba, the Python one for universes of up to
+            kernels.PYTHON_MAX_TOKENS tokens (defaults to config.BACKEND).
+            All backends produce bit-identical results for the same seed.
+        seed (int or np.random.SeedSequence): Optional seed of a dedicated noise
+            stream, the same one simulate_ensemble() uses for path 0. None
+            draws from the global np.random state, as the reference loop does.
+        stop_conditions (iterable): Optional StopCondition objects ending the
+            run early (see src.pipeline).
+        stages (iterable): Optional extra Stage objects fed with every step.
+        checkpoint_path (str): Optional checkpoint file written every
+            checkpoint_every steps and at the end of the run (see CheckpointStage).
+        checkpoint_every (int): Checkpoint interval (defaults to config.CHECKPOINT_EVERY).
+        resume_from (str): Optional checkpoint to continue from instead of
+            starting a new run; model_type and seed are then taken from it.
+        timing (bool): Record per-phase timings and print a summary table at
+            the end of the run (defaults to config.TIMING).
+        profiler (str): Optional "cprofile" or "pyinstrument" profiler whose
+            report is printed at the end of the run (defaults to config.PROFILER).
+        universe: TokenUniverse, spec path or spec dict of the simulated tokens
+            (defaults to config.TOKEN_UNIVERSE, then config.TOKENS; see src.universe).
+        cache: ResultCache, True, False or None for config.CACHE_RESULTS (see
+            src.cache). Seeded runs are then looked up by a hash of their
+            inputs and code version, and stored with their summary metrics
+            after running. Runs with stages, checkpoints, a history file,
+            instrumentation or an uncacheable model always run (with a
+            warning when a cache was passed explicitly).
+    """
+    if timing is None:
+        timing = config.TIMING
+    if profiler is None:
+        profiler = config.PROFILER
+    stages = list(stages)
+    if checkpoint_path is not None:
+        if checkpoint_every is None:
+            checkpoint_every = config.CHECKPOINT_EVERY
+        stages.append(CheckpointStage(checkpoint_path, checkpoint_every))
+
+    if resume_from is not None:
+        checkpoint = read_checkpoint(resume_from)
+        model_type = checkpoint["meta"]["model_type"]
+    elif model_type is None:
+        model_type = config.MODEL_TYPE
+    universe = load_universe(universe)
+
+    result_cache = resolve_cache(cache)
+    key = None
+    if result_cache is not None:
+        model = get_model_class(model_type)()
+        blockers = {
+            "an unseeded run": seed is None, "resume_from": resume_from is not None, "stages": bool(stages),
+            "STORE_RESULTS": config.STORE_RESULTS,
+            "a history file": (config.HISTORY_PATH if history_path is None else history_path) is not None,
+            "timing": timing, "a profiler": profiler, f"the {model_type} model": not cacheable_model(model),
+        }
+        blocked = [name for name, active in blockers.items() if active]
+        if blocked:
+            if cache is not None:
+                warnings.warn(f"Result cache skipped for {', '.join(blocked)}")
+        else:
+            key = cache_key("simulate", model_type=model_type, model=model.get_state(), universe=universe,
+                            config={name: getattr(config, name) for name in ("TIME_STEPS",) + CHECKPOINT_PARAMETERS},
+                            seed=root_seed(seed), stop_conditions=list(stop_conditions))
+
+    entry = None if key is None else result_cache.get(key)
+    if entry is None and config.STORE_RESULTS:
+        # Store results in the database through a batched writer; the stage
+        # checks the universe's products before it registers the run
+        stages.insert(0, DatabaseStage(config.DB_PATH, model_type, config.DB_BATCH_SIZE, products=universe.products))
+    if entry is not None:
+        result = _entry_result(entry)
+    elif resume_from is not None:
+        sim = Simulation.from_checkpoint(checkpoint, history_path=history_path, backend=backend,
+                                         stop_conditions=stop_conditions, stages=stages,
+                                         timing=timing, profiler=profiler, universe=universe)
+        result = sim.run()
+    else:
+        sim = Simulation(model_type, history_path=history_path, backend=backend, seed=seed,
+                         stop_conditions=stop_conditions, stages=stages, timing=timing, profiler=profiler,
+                         universe=universe)
+        result = sim.run()
+        if key is not None:
+            result.summary = analytics.summarize(result.prices, result.circulation, sim.universe.target_price,
+                                                 sim.universe.collateral)
+            result_cache.put(key, _result_entry(result))
+
+    # Summary reports of the instrumented run
+    if result.timings is not None:
+        print(result.timings.report())
+    if result.profiler is not None:
+        print(result.profiler.report())
+
+    # Optionally render figures to files (matplotlib is only imported here)
+    if figures_dir is not None:
+        from src import reporting
+        reporting.save_figures(result, figures_dir)
+
+    return result
+
+def _result_entry(result):
+    """
+    Pack a summarized SimulationResult into ResultCache arrays.
+    """
+    meta = {
+        "token_names": result.token_names, "products": result.products, "fields": result.history.fields,
+        "model_type": result.model_type, "time_steps": result.time_steps, "stop_reason": result.stop_reason,
+    }
+    entry = {"meta": pack_meta(meta), "history": result.history.data}
+    entry.update({"summary_" + name: value for name, value in result.summary.items()})
+    return entry
+
+
+def _entry_result(entry):
+    """
+    Rebuild a SimulationResult from the arrays written by _result_entry().
+    """
+    meta = unpack_meta(entry["meta"])
+    history = SimulationHistory.from_data(entry["history"], meta["token_names"], meta["fields"])
+    summary = {name[len("summary_"):]: value for name, value in entry.items() if name.startswith("summary_")}
+    return SimulationResult(meta["token_names"], meta["products"], history, meta["model_type"],
+                            time_steps=meta["time_steps"], stop_reason=meta["stop_reason"], summary=summary,
+                            cached=True)
 
-    # 2. Create model & PID for each token
-    models = {}
-    pids = {}
-    for token_name in tokens:
-        models[token_name] = BaseModel()
-        pids[token_name] = PIDController(config.K_P, config.K_I, config.K_D)
-
-    # 3. Prepare data for plotting
-    prices_history = {token_name: [] for token_name in tokens}
-    circulation_history = {token_name: [] for token_name in tokens}
-
-    # 4. Initialize DB if storing results
-    if config.STORE_RESULTS:
-        database.init_db(config.DB_PATH, config.SCHEMA_PATH)
-
-    # 5. Store initial state in DB if needed
-    if config.STORE_RESULTS:
-        for token_name, token_state in tokens.items():
-            database.store_simulation_step(
-                db_path=config.DB_PATH,
-                time_step=0,
-                token_name=token_name,
-                price=token_state["price"],
-                circulation=token_state["circulation"],
-                fees=token_state["fees"],
-                rewards=token_state["rewards"]
-            )
-
-    # Example volume/liquidity
-    volume = 10.0
-    liquidity = 5.0
-
-    # 6. Main simulation loop
-    for t in range(1, config.TIME_STEPS + 1):
-        # A) For each token, we do:
-        #    1) Update fees & rewards with PID + gradient
-        #    2) Clamp them
-        #    3) Let the nudge model compute next price & supply
-
-        for token_name, token_state in tokens.items():
-            current_price = token_state["price"]
-            target_price = token_state["target"]
-            error = current_price - target_price
-            control_signal = pids[token_name].update(error)
-
-            # Compute gradients
-            grad_fees, grad_rewards = compute_gradients(
-                P_next=current_price,
-                target=target_price,
-                fees_coefs=config.FEES_COEFS[token_name],
-                rewards_coefs=config.REWARDS_COEFS[token_name]
-            )
-
-            # Update fees
-            for prod in token_state["fees"]:
-                token_state["fees"][prod] -= config.LEARNING_RATE * grad_fees.get(prod, 0)
-                token_state["fees"][prod] += control_signal
-
-            # Update rewards
-            for prod in token_state["rewards"]:
-                token_state["rewards"][prod] -= config.LEARNING_RATE * grad_rewards.get(prod, 0)
-                token_state["rewards"][prod] += control_signal
-
-            # Clamp fees/rewards (0 to 5)
-            for prod in token_state["fees"]:
-                token_state["fees"][prod] = max(0.0, min(5.0, token_state["fees"][prod]))
-            for prod in token_state["rewards"]:
-                token_state["rewards"][prod] = max(0.0, min(5.0, token_state["rewards"][prod]))
-
-        # B) Compute next price & supply using the nudge model
-        for token_name, token_state in tokens.items():
-            model = models[token_name]
-            P_next, circ_next = model.predict(token_state, volume, liquidity)
-            token_state["price"] = P_next
-            token_state["circulation"] = circ_next
-
-        # C) Log data
-        for token_name, token_state in tokens.items():
-            prices_history[token_name].append(token_state["price"])
-            circulation_history[token_name].append(token_state["circulation"])
-
-            if config.STORE_RESULTS:
-                database.store_simulation_step(
-                    db_path=config.DB_PATH,
-                    time_step=t,
-                    token_name=token_name,
-                    price=token_state["price"],
-                    circulation=token_state["circulation"],
-                    fees=token_state["fees"],
-                    rewards=token_state["rewards"]
-                )
-
-    # 7. Plot results
-    # Plot prices
-    plt.figure(figsize=(10, 6))
-    for token_name in tokens:
-        plt.plot(prices_history[token_name], label=f'{token_name} Price')
-    plt.title('Token Prices Over Time')
-    plt.xlabel('Time Step')
-    plt.ylabel('Price')
-    plt.legend()
-    plt.grid(True)
-    plt.show()
-
-    # Plot circulation
-    plt.figure(figsize=(10, 6))
-    for token_name in tokens:
-        plt.plot(circulation_history[token_name], label=f'{token_name} Circulation')
-    plt.title('Tokens in Circulation Over Time')
-    plt.xlabel('Time Step')
-    plt.ylabel('Circulation')
-    plt.legend()
-    plt.grid(True)
-    plt.show()
 
 if __name__ == '__main__':
-    simulate()
+    from src import reporting
+    reporting.show_figures(simulate())
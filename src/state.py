@@ -0,0 +1,120 @@
+# src/state.py
+
+import numpy as np
+from src.models.abstract_model import (
+    STATE_SIZE, PRICE, CIRCULATION, FEE_TOTAL, REWARD_TOTAL,
+    TARGET, COLLATERAL, MAX_SUPPLY, VOLUME, LIQUIDITY,
+)
+
+
+def sum_products(values, out):
+    """
+    Sum a (products, ...) array over its product axis into out.
+
+    Accumulates in the left-to-right order of sum(fees.values()), which keeps
+    the array-based engines bit-compatible with the scalar model path.
+    """
+    np.copyto(out, values[0])
+    for k in range(1, len(values)):
+        out += values[k]
+    return out
+
+
+class TokenState:
+    """
+    Compact, array-backed state of every simulated token.
+
+    Tokens and products get fixed integer indices, taken from the order of
+    the token universe (see src.universe). The model-facing quantities
+    live in one compact state array of shape (STATE_SIZE,) + shape (see
+    abstract_model.STATE_FIELDS), and the per-product fees and rewards in
+    one (2, products) + shape params array, where shape is (tokens,) for a
+    single run or (tokens, paths) for an ensemble. The path axis is innermost
+    so vectorized operations run over long contiguous rows, and fees and
+    rewards are updated, clamped and summed together.
+
+    Attributes:
+        token_names (list): Token names, in index order.
+        products (list): Product names, in index order.
+        state (np.ndarray): Compact model state.
+        params (np.ndarray): Fees (params[0]) and rewards (params[1]) per product and token.
+    """
+
+    __slots__ = ("token_names", "products", "state", "params")
+
+    def __init__(self, token_names, products, state, params):
+        self.token_names = token_names
+        self.products = products
+        self.state = state
+        self.params = params
+
+    @classmethod
+    def from_universe(cls, universe, n_paths=None, volume=10.0, liquidity=5.0):
+        """
+        Build the initial state from the compiled arrays of a TokenUniverse.
+
+        Parameters:
+            universe (TokenUniverse): Validated token parameters.
+            n_paths (int): Number of ensemble paths, or None for a single run.
+            volume (float): Market volume fed to the model.
+            liquidity (float): Market liquidity fed to the model.
+
+        Returns:
+            TokenState: State with every path starting from the universe's values.
+        """
+        token_names = list(universe.token_names)
+        products = list(universe.products)
+        shape = (len(token_names),) if n_paths is None else (len(token_names), n_paths)
+
+        def per_token(values):
+            return values if n_paths is None else values[:, None]
+
+        def per_product(values):
+            return values if n_paths is None else values[:, :, None]
+
+        state = np.empty((STATE_SIZE,) + shape)
+        state[PRICE] = per_token(universe.initial_price)
+        state[CIRCULATION] = per_token(universe.initial_circulation)
+        state[TARGET] = per_token(universe.target_price)
+        state[COLLATERAL] = per_token(universe.collateral)
+        state[MAX_SUPPLY] = per_token(universe.max_supply)
+        state[VOLUME] = volume
+        state[LIQUIDITY] = liquidity
+
+        params = np.empty((2, len(products)) + shape)
+        params[0] = per_product(universe.fees)
+        params[1] = per_product(universe.rewards)
+
+        token_state = cls(token_names, products, state, params)
+        token_state.update_totals()
+        return token_state
+
+    @property
+    def price(self):
+        return self.state[PRICE]
+
+    @property
+    def circulation(self):
+        return self.state[CIRCULATION]
+
+    @property
+    def target(self):
+        return self.state[TARGET]
+
+    @property
+    def fees(self):
+        return self.params[0]
+
+    @property
+    def rewards(self):
+        return self.params[1]
+
+    def update_totals(self):
+        """
+        Refresh the fee/reward totals of the compact state from fees and rewards.
+        """
+        # The FEE_TOTAL and REWARD_TOTAL rows are adjacent, so both sums run as one
+        sum_products(self.params.swapaxes(0, 1), out=self.state[FEE_TOTAL:REWARD_TOTAL + 1])
+
+    def copy(self):
+        return TokenState(list(self.token_names), list(self.products), self.state.copy(), self.params.copy())
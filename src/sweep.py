@@ -0,0 +1,206 @@
+# src/sweep.py
+
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from config import config
+from src.ensemble import simulate_ensemble
+from src.universe import load_universe
+
+
+def grid_spec(axes):
+    """
+    Build the full Cartesian grid over the given parameter values.
+
+    Parameters:
+        axes (dict): Parameter name -> list of values, e.g. {"K_P": [0.05, 0.1]}.
+
+    Returns:
+        list: One parameter dict per grid point.
+    """
+    names = list(axes)
+    return [dict(zip(names, values)) for values in itertools.product(*(axes[name] for name in names))]
+
+
+def random_spec(bounds, n_points, seed=None):
+    """
+    Sample parameter points uniformly at random within the given bounds.
+
+    Parameters:
+        bounds (dict): Parameter name -> (low, high).
+        n_points (int): Number of points to sample.
+        seed (int): Optional seed for the sampler.
+
+    Returns:
+        list: One parameter dict per sampled point.
+    """
+    rng = np.random.default_rng(seed)
+    names = list(bounds)
+    low = np.array([bounds[name][0] for name in names], dtype=np.float64)
+    high = np.array([bounds[name][1] for name in names], dtype=np.float64)
+    samples = low + rng.random((n_points, len(names))) * (high - low)
+    return [dict(zip(names, map(float, row))) for row in samples]
+
+
+def latin_hypercube_spec(bounds, n_points, seed=None):
+    """
+    Sample parameter points with a Latin hypercube design.
+
+    Each parameter range is split into n_points equal strata and every stratum
+    is hit exactly once, which covers the space far more evenly than plain
+    random sampling for the same number of runs.
+
+    Parameters:
+        bounds (dict): Parameter name -> (low, high).
+        n_points (int): Number of points to sample.
+        seed (int): Optional seed for the sampler.
+
+    Returns:
+        list: One parameter dict per sampled point.
+    """
+    rng = np.random.default_rng(seed)
+    names = list(bounds)
+    low = np.array([bounds[name][0] for name in names], dtype=np.float64)
+    high = np.array([bounds[name][1] for name in names], dtype=np.float64)
+    strata = np.column_stack([rng.permutation(n_points) for _ in names])
+    unit = (strata + rng.random((n_points, len(names)))) / n_points
+    samples = low + unit * (high - low)
+    return [dict(zip(names, map(float, row))) for row in samples]
+
+
+def run_point(index, params, n_paths, time_steps, seed, universe=None, cache=None, variance_reduction=None):
+    """
+    Run one sweep point and summarize it as a flat result row.
+
+    This is the worker entry point: it only depends on the ensemble engine, so
+    pool workers never import matplotlib or torch.
+
+    Parameters:
+        index (int): Position of the point in the sweep.
+        params (dict): Parameter overrides for this run; an optional
+            "model_type" entry selects the model for this point.
+        n_paths (int): Ensemble size.
+        time_steps (int): Number of steps to run.
+        seed (np.random.SeedSequence): Seed stream dedicated to this point.
+        universe (TokenUniverse): Simulated tokens (defaults to the configured universe).
+        cache (bool): Serve the ensemble from the result cache (defaults to
+            config.CACHE_RESULTS; see src.cache).
+        variance_reduction (str): Price-noise mode (see simulate_ensemble).
+
+    Returns:
+        dict: The point index, its parameters and per-token summary metrics.
+    """
+    overrides = dict(params)
+    model_type = overrides.pop("model_type", None)
+    result = simulate_ensemble(n_paths, time_steps=time_steps, seed=seed, params=overrides, model_type=model_type,
+                               universe=universe, cache=cache, variance_reduction=variance_reduction)
+    row = {"index": index}
+    row.update(params)
+    for i, token_name in enumerate(result["token_names"]):
+        target = result["target"][i]
+        row[f"{token_name}_final_price_mean"] = float(result["price"][:, i].mean())
+        row[f"{token_name}_final_price_std"] = float(result["price"][:, i].std())
+        row[f"{token_name}_final_circulation_mean"] = float(result["circulation"][:, i].mean())
+        row[f"{token_name}_mean_peg_deviation"] = float(np.abs(result["price_mean"][:, i] - target).mean())
+    return row
+
+
+def load_sweep_results(results_path):
+    """
+    Read the completed rows of a sweep, ignoring a truncated trailing line.
+
+    Returns:
+        list: Result rows sorted by point index.
+    """
+    rows = {}
+    if os.path.exists(results_path):
+        with open(results_path, "r") as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError:
+                    # Partial line left behind by a crash mid-write
+                    continue
+                rows[row["index"]] = row
+    return [rows[index] for index in sorted(rows)]
+
+
+def run_sweep(points, n_paths=1, time_steps=None, seed=0, workers=None, results_path=None, universe=None,
+              cache=None, variance_reduction=None, common_random_numbers=False):
+    """
+    Run every parameter point across a process pool and gather one result table.
+
+    Each point draws its noise from its own child of SeedSequence(seed), keyed
+    by the point's position, so results do not depend on the number of workers
+    or on completion order. When results_path is given, each finished row is
+    appended to it as a JSON line; rerunning the same sweep with the same path
+    skips the points already recorded there, so a crashed sweep resumes where
+    it stopped.
+
+    Parameters:
+        points (list): Parameter dicts, e.g. from grid_spec() or latin_hypercube_spec().
+        n_paths (int): Ensemble size per point.
+        time_steps (int): Number of steps per run (defaults to config.TIME_STEPS).
+        seed (int): Root seed of the sweep.
+        workers (int): Number of worker processes (defaults to the CPU count).
+        results_path (str): Optional JSON-lines file used for checkpointing.
+        universe: TokenUniverse, spec path or spec dict of the simulated tokens
+            (defaults to config.TOKEN_UNIVERSE, then config.TOKENS).
+        cache (bool): Look every point up in the on-disk result cache shared
+            by the workers (defaults to config.CACHE_RESULTS), so points run
+            by an earlier sweep with the same seed are not simulated again.
+        variance_reduction (str): Price-noise mode of every point (see simulate_ensemble).
+        common_random_numbers (bool): Drive every point with the same noise
+            streams instead of one child seed per point, so differences
+            between points reflect the parameters rather than the noise.
+
+    Returns:
+        list: One result row per point, sorted by point index.
+    """
+    if time_steps is None:
+        time_steps = config.TIME_STEPS
+    seeds = np.random.SeedSequence(seed).spawn(1 if common_random_numbers else len(points))
+    if common_random_numbers:
+        seeds *= len(points)
+    # Compile the token universe once; workers receive the arrays
+    universe = load_universe(universe)
+
+    done = {}
+    if results_path is not None:
+        for row in load_sweep_results(results_path):
+            expected = points[row["index"]] if row["index"] < len(points) else None
+            if expected is None or any(row.get(name) != value for name, value in expected.items()):
+                raise ValueError(f"{results_path} holds results of a different sweep (point {row['index']})")
+            done[row["index"]] = row
+
+    pending = [i for i in range(len(points)) if i not in done]
+    if pending:
+        out = None
+        if results_path is not None:
+            out = open(results_path, "a+")
+            # Terminate a partial line left by a crash so new rows start cleanly
+            if out.tell() > 0:
+                out.seek(out.tell() - 1)
+                if out.read(1) != "\n":
+                    out.write("\n")
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [
+                    executor.submit(run_point, i, points[i], n_paths, time_steps, seeds[i], universe, cache,
+                                    variance_reduction)
+                    for i in pending
+                ]
+                for future in as_completed(futures):
+                    row = future.result()
+                    done[row["index"]] = row
+                    if out is not None:
+                        out.write(json.dumps(row) + "\n")
+                        out.flush()
+        finally:
+            if out is not None:
+                out.close()
+
+    return [done[i] for i in sorted(done)]
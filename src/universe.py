@@ -0,0 +1,407 @@
+# src/universe.py
+#
+# Token universes: the set of simulated tokens and their parameters, compiled
+# once into dense (tokens,) and (products, tokens) arrays. A universe can come
+# from the TOKENS / FEES_COEFS / REWARDS_COEFS dicts in config.py, from a
+# compact JSON/YAML/TOML spec, or from a generator sampling parameters for
+# hundreds of tokens at once.
+#
+# Spec layout (JSON shown; YAML and TOML files carry the same structure):
+#
+#     {
+#       "products": ["minting", "staking", "transfers"],
+#       "defaults": {"target_price": 1.0},
+#       "tokens": {"alpha": {"initial_price": 0.1, ..., "fees_coefs": {...}}},
+#       "generate": {"count": 500, "prefix": "token_", "seed": 0,
+#                    "params": {"initial_price": {"uniform": [0.05, 0.15]}, "fees": 0.1}}
+#     }
+#
+# Every section is optional, but the universe needs at least one token.
+# "tokens" uses the config.TOKENS layout plus optional per-token "fees_coefs"
+# and "rewards_coefs"; the config.py layout with top-level "fees_coefs" and
+# "rewards_coefs" dicts is accepted too. "generate" may also be a list of
+# groups. Values in "defaults" and "params" are constants, per-product dicts
+# or distributions (see DISTRIBUTIONS).
+
+import json
+import os
+
+import numpy as np
+from config import config
+
+# Per-token scalar parameters, compiled to (tokens,) arrays
+TOKEN_FIELDS = ("initial_price", "initial_circulation", "collateral", "target_price", "max_supply")
+
+# Per-token, per-product parameters, compiled to (products, tokens) arrays
+PRODUCT_FIELDS = ("fees", "rewards", "fees_coefs", "rewards_coefs")
+
+# Distributions accepted by generated parameters, as {"name": [arguments]}
+DISTRIBUTIONS = ("uniform", "loguniform", "normal", "lognormal", "choice")
+
+# Parameters of generated tokens that a spec does not set; the ranges cover the
+# tokens configured in config.py
+GENERATOR_DEFAULTS = {
+    "initial_price": {"uniform": [0.05, 0.15]},
+    "initial_circulation": {"loguniform": [5e5, 1.5e6]},
+    "collateral": {"loguniform": [5e4, 2e5]},
+    "target_price": 1.0,
+    "max_supply": {"loguniform": [1.5e6, 4e6]},
+    "fees": {"uniform": [0.02, 0.2]},
+    "rewards": {"uniform": [0.15, 0.6]},
+    "fees_coefs": {"uniform": [-0.2, -0.1]},
+    "rewards_coefs": {"uniform": [0.1, 0.3]},
+}
+
+# Number of offending tokens listed per failed check
+MAX_REPORTED = 5
+
+
+class TokenUniverse:
+    """
+    Validated, array-compiled parameters of every simulated token.
+
+    Tokens and products get fixed integer indices from the order of
+    token_names and products. Arrays are read-only, so one universe can be
+    shared by many runs (TokenState.from_universe copies what a run mutates).
+
+    Attributes:
+        token_names (list): Token names, in index order.
+        products (list): Product names, in index order.
+        initial_price, initial_circulation, collateral, target_price,
+        max_supply (np.ndarray): (tokens,) float64 arrays.
+        fees, rewards, fees_coefs, rewards_coefs (np.ndarray): (products, tokens)
+            float64 arrays.
+    """
+
+    def __init__(self, token_names, products, **arrays):
+        """
+        Validate the parameters and compile them into float64 arrays.
+
+        Parameters:
+            token_names (list): Unique token names.
+            products (list): Unique product names.
+            **arrays: One array-like per TOKEN_FIELDS entry, of shape
+                (tokens,), and per PRODUCT_FIELDS entry, of shape (products, tokens).
+
+        Raises:
+            ValueError: Listing every failed check, with up to MAX_REPORTED
+                offending tokens each.
+        """
+        self.token_names = [str(name) for name in token_names]
+        self.products = [str(prod) for prod in products]
+        if not self.token_names:
+            raise ValueError("A token universe needs at least one token")
+        if not self.products:
+            raise ValueError("A token universe needs at least one product")
+        for kind, names in (("token", self.token_names), ("product", self.products)):
+            if len(set(names)) != len(names):
+                duplicates = sorted({name for name in names if names.count(name) > 1})
+                raise ValueError(f"Duplicate {kind} names: {', '.join(duplicates[:MAX_REPORTED])}")
+        unknown = set(arrays) - set(TOKEN_FIELDS) - set(PRODUCT_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown token parameters: {', '.join(sorted(unknown))}")
+
+        n_tokens, n_products = len(self.token_names), len(self.products)
+        for name in TOKEN_FIELDS + PRODUCT_FIELDS:
+            if name not in arrays:
+                raise ValueError(f"Missing token parameter: {name}")
+            shape = (n_tokens,) if name in TOKEN_FIELDS else (n_products, n_tokens)
+            values = np.array(arrays[name], dtype=np.float64)
+            if values.shape != shape:
+                raise ValueError(f"{name} has shape {values.shape}, expected {shape}")
+            values.flags.writeable = False
+            setattr(self, name, values)
+        self._validate()
+
+    def _validate(self):
+        errors = []
+
+        def check(name, bad, rule):
+            # bad is a (tokens,) mask, or (products, tokens) for per-product fields
+            if bad.ndim == 2:
+                bad = bad.any(axis=0)
+            if bad.any():
+                offenders = [self.token_names[i] for i in np.flatnonzero(bad)[:MAX_REPORTED]]
+                more = f" and {int(bad.sum()) - len(offenders)} more" if bad.sum() > len(offenders) else ""
+                errors.append(f"{name} must be {rule} (tokens: {', '.join(offenders)}{more})")
+
+        for name in TOKEN_FIELDS + PRODUCT_FIELDS:
+            check(name, ~np.isfinite(getattr(self, name)), "finite")
+        for name in ("initial_price", "initial_circulation", "collateral", "fees", "rewards"):
+            check(name, getattr(self, name) < 0.0, ">= 0")
+        for name in ("target_price", "max_supply"):
+            check(name, getattr(self, name) <= 0.0, "> 0")
+        # initial_circulation may exceed max_supply: the nudge model burns the surplus
+        if errors:
+            raise ValueError("Invalid token universe:\n  " + "\n  ".join(errors))
+
+    def __len__(self):
+        return len(self.token_names)
+
+    def __repr__(self):
+        return f"TokenUniverse({len(self.token_names)} tokens, products={self.products})"
+
+    @classmethod
+    def from_dicts(cls, tokens, fees_coefs=None, rewards_coefs=None):
+        """
+        Compile the config.py layout into a universe.
+
+        Parameters:
+            tokens (dict): {token: {parameter: value}} as in config.TOKENS; the
+                product order is taken from the first token's fees.
+            fees_coefs (dict): {token: {product: coef}} (defaults to config.FEES_COEFS).
+            rewards_coefs (dict): {token: {product: coef}} (defaults to config.REWARDS_COEFS).
+
+        Returns:
+            TokenUniverse: The validated universe.
+        """
+        coefs = {
+            "fees_coefs": config.FEES_COEFS if fees_coefs is None else fees_coefs,
+            "rewards_coefs": config.REWARDS_COEFS if rewards_coefs is None else rewards_coefs,
+        }
+        token_names = list(tokens)
+        if not token_names:
+            raise ValueError("A token universe needs at least one token")
+        products = list(tokens[token_names[0]]["fees"])
+        entries = {}
+        for name in token_names:
+            entry = dict(tokens[name])
+            for field, source in coefs.items():
+                if name not in source:
+                    raise ValueError(f"Token '{name}' has no {field} entry")
+                entry.setdefault(field, source[name])
+            entries[name] = entry
+        return cls(token_names, products, **_compile_entries(entries, products))
+
+    @classmethod
+    def from_spec(cls, spec):
+        """
+        Build a universe from a spec dict (see the module comment).
+
+        Generated groups without a "seed" use seed 0, so loading the same
+        spec always yields the same universe.
+
+        Returns:
+            TokenUniverse: The validated universe.
+        """
+        unknown = set(spec) - {"products", "defaults", "tokens", "generate", "fees_coefs", "rewards_coefs"}
+        if unknown:
+            raise ValueError(f"Unknown token universe spec sections: {', '.join(sorted(unknown))}")
+        defaults = dict(spec.get("defaults", {}))
+        explicit = spec.get("tokens", {})
+        products = spec.get("products")
+        if products is None:
+            fees = next(iter(explicit.values()), {}).get("fees", defaults.get("fees"))
+            products = list(fees) if isinstance(fees, dict) else None
+        if not products:
+            raise ValueError("The token universe spec must list its products")
+        products = list(products)
+
+        entries = {}
+        for name, token in explicit.items():
+            entry = dict(defaults, **token)
+            for field in ("fees_coefs", "rewards_coefs"):
+                if field in spec and name in spec[field]:
+                    entry.setdefault(field, spec[field][name])
+            entries[name] = entry
+        arrays = _compile_entries(entries, products) if entries else None
+        token_names = list(entries)
+
+        groups = spec.get("generate", [])
+        for group in [groups] if isinstance(groups, dict) else groups:
+            generated = generate_universe(
+                group["count"], products=products, params=dict(defaults, **group.get("params", {})),
+                seed=group.get("seed", 0), prefix=group.get("prefix", "token_"),
+            )
+            token_names += generated.token_names
+            arrays = generated.arrays() if arrays is None else {
+                name: np.concatenate((values, getattr(generated, name)), axis=-1) for name, values in arrays.items()
+            }
+        if arrays is None:
+            raise ValueError("A token universe needs at least one token")
+        return cls(token_names, products, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a spec file (.json, .yaml/.yml or .toml) and build its universe.
+        """
+        extension = os.path.splitext(path)[1].lower()
+        if extension == ".json":
+            with open(path, "r") as f:
+                spec = json.load(f)
+        elif extension in (".yaml", ".yml"):
+            try:
+                import yaml
+            except ImportError as e:
+                raise ImportError("Loading YAML token universes requires the pyyaml package") from e
+            with open(path, "r") as f:
+                spec = yaml.safe_load(f)
+        elif extension == ".toml":
+            try:
+                import tomllib
+            except ImportError:
+                import tomli as tomllib
+            with open(path, "rb") as f:
+                spec = tomllib.load(f)
+        else:
+            raise ValueError(f"Unsupported token universe file: {path} (expected .json, .yaml, .yml or .toml)")
+        return cls.from_spec(spec)
+
+    def arrays(self):
+        """
+        Return the parameter arrays as a {parameter: array} dict.
+        """
+        return {name: getattr(self, name) for name in TOKEN_FIELDS + PRODUCT_FIELDS}
+
+    def to_dicts(self):
+        """
+        Return the universe in the config.py layout.
+
+        Returns:
+            tuple: (tokens, fees_coefs, rewards_coefs) dicts as in config.TOKENS,
+            config.FEES_COEFS and config.REWARDS_COEFS.
+        """
+        def per_product(values, i):
+            return {prod: float(values[k, i]) for k, prod in enumerate(self.products)}
+
+        tokens, fees_coefs, rewards_coefs = {}, {}, {}
+        for i, name in enumerate(self.token_names):
+            tokens[name] = {field: float(getattr(self, field)[i]) for field in TOKEN_FIELDS}
+            tokens[name]["fees"] = per_product(self.fees, i)
+            tokens[name]["rewards"] = per_product(self.rewards, i)
+            fees_coefs[name] = per_product(self.fees_coefs, i)
+            rewards_coefs[name] = per_product(self.rewards_coefs, i)
+        return tokens, fees_coefs, rewards_coefs
+
+
+def _compile_entries(entries, products):
+    """
+    Compile {token: {parameter: value}} entries into parameter arrays.
+
+    Per-product parameters must be {product: value} dicts covering exactly
+    products, or a single value applied to every product.
+    """
+    token_names = list(entries)
+    arrays = {}
+    for field in TOKEN_FIELDS:
+        missing = [name for name in token_names if field not in entries[name]]
+        if missing:
+            raise ValueError(f"Tokens missing {field}: {', '.join(missing[:MAX_REPORTED])}")
+        arrays[field] = [entries[name][field] for name in token_names]
+    for field in PRODUCT_FIELDS:
+        columns = []
+        for name in token_names:
+            if field not in entries[name]:
+                raise ValueError(f"Token '{name}' is missing {field}")
+            value = entries[name][field]
+            if isinstance(value, dict):
+                if set(value) != set(products):
+                    raise ValueError(f"Token '{name}' must define {field} for products {products}")
+                columns.append([value[prod] for prod in products])
+            else:
+                columns.append([value] * len(products))
+        arrays[field] = np.array(columns, dtype=np.float64).T.reshape(len(products), len(token_names))
+    return arrays
+
+
+def sample(value, size, rng):
+    """
+    Draw a generated parameter.
+
+    Parameters:
+        value: A constant, or a {"distribution": [arguments]} dict with one
+            of DISTRIBUTIONS: uniform [low, high], loguniform [low, high],
+            normal [mean, std], lognormal [mean, sigma] (of the log) or
+            choice [values...].
+        size (tuple): Shape of the draw.
+        rng (np.random.Generator): Source of randomness.
+
+    Returns:
+        np.ndarray: float64 array of the given shape.
+    """
+    if not isinstance(value, dict):
+        return np.full(size, value, dtype=np.float64)
+    if len(value) != 1 or next(iter(value)) not in DISTRIBUTIONS:
+        raise ValueError(f"Expected a constant or one of {', '.join(DISTRIBUTIONS)}, got {value}")
+    kind, args = next(iter(value.items()))
+    if kind == "uniform":
+        return rng.uniform(args[0], args[1], size)
+    if kind == "loguniform":
+        if args[0] <= 0 or args[1] <= 0:
+            raise ValueError(f"loguniform bounds must be positive, got {args}")
+        return np.exp(rng.uniform(np.log(args[0]), np.log(args[1]), size))
+    if kind == "normal":
+        return rng.normal(args[0], args[1], size)
+    if kind == "lognormal":
+        return rng.lognormal(args[0], args[1], size)
+    return rng.choice(np.asarray(args, dtype=np.float64), size)
+
+
+def generate_universe(n_tokens, products=None, params=None, seed=None, prefix="token_"):
+    """
+    Generate a universe of n_tokens tokens with sampled parameters.
+
+    Parameters are drawn in TOKEN_FIELDS then PRODUCT_FIELDS order, one
+    vectorized draw per parameter (per product for per-product parameters),
+    so a seed reproduces the same universe.
+
+    Parameters:
+        n_tokens (int): Number of tokens.
+        products (list): Product names (defaults to the products of config.TOKENS).
+        params (dict): Parameter -> constant or distribution (see sample()),
+            falling back to GENERATOR_DEFAULTS. Per-product parameters may
+            also be {product: constant or distribution} dicts.
+        seed (int or np.random.SeedSequence): Sampler seed; None draws fresh entropy.
+        prefix (str): Token names are prefix + index.
+
+    Returns:
+        TokenUniverse: The validated universe.
+
+    Example:
+        generate_universe(500, params={"initial_price": {"uniform": [0.05, 0.5]}}, seed=1)
+    """
+    if n_tokens < 1:
+        raise ValueError("n_tokens must be at least 1")
+    if products is None:
+        products = list(config.TOKENS[next(iter(config.TOKENS))]["fees"])
+    params = dict(GENERATOR_DEFAULTS, **(params or {}))
+    unknown = set(params) - set(TOKEN_FIELDS) - set(PRODUCT_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown token parameters: {', '.join(sorted(unknown))}")
+    rng = np.random.default_rng(seed)
+
+    arrays = {field: sample(params[field], (n_tokens,), rng) for field in TOKEN_FIELDS}
+    for field in PRODUCT_FIELDS:
+        value = params[field]
+        is_per_product = isinstance(value, dict) and not (len(value) == 1 and next(iter(value)) in DISTRIBUTIONS)
+        if is_per_product and set(value) != set(products):
+            raise ValueError(f"{field} must cover products {products}")
+        arrays[field] = np.stack([
+            sample(value[prod] if is_per_product else value, (n_tokens,), rng) for prod in products
+        ])
+    token_names = [f"{prefix}{i}" for i in range(n_tokens)]
+    return TokenUniverse(token_names, products, **arrays)
+
+
+def load_universe(source=None):
+    """
+    Resolve the token universe of a run.
+
+    Parameters:
+        source: A TokenUniverse (returned as is), a spec file path, a spec
+            dict, or None for config.TOKEN_UNIVERSE - which itself falls back
+            to config.TOKENS / FEES_COEFS / REWARDS_COEFS when None.
+
+    Returns:
+        TokenUniverse: The validated universe.
+    """
+    if source is None:
+        source = config.TOKEN_UNIVERSE
+    if source is None:
+        return TokenUniverse.from_dicts(config.TOKENS, config.FEES_COEFS, config.REWARDS_COEFS)
+    if isinstance(source, TokenUniverse):
+        return source
+    if isinstance(source, dict):
+        return TokenUniverse.from_spec(source)
+    return TokenUniverse.load(os.fspath(source))
@@ -0,0 +1,187 @@
+# src/variance.py
+#
+# Monte Carlo estimates of per-path peg metrics with their estimator variance
+# and effective sample size (ESS), for each price-noise mode of the ensemble
+# engine: independent paths, antithetic pairs and randomized Sobol points,
+# plus common random numbers when comparing two parameter sets. The ESS is
+# the number of independent paths that would give the same variance, so
+# ess / n_paths is the saving of a mode.
+
+import numpy as np
+from src.ensemble import simulate_ensemble
+from src.noise import root_seed
+
+# Per-path metrics: name -> (needs the full history, function(result) -> (paths, tokens))
+PATH_METRICS = {
+    "final_price": (False, lambda result: result["price"]),
+    "final_deviation": (False, lambda result: (result["price"] - result["target"]) / result["target"]),
+    "final_abs_deviation": (False, lambda result: np.abs(result["price"] - result["target"]) / result["target"]),
+    "mean_abs_deviation": (True, lambda result: (
+        np.abs(result["price_history"][1:] - result["target"]) / result["target"]).mean(axis=0)),
+    "rms_deviation": (True, lambda result: np.sqrt(
+        (((result["price_history"][1:] - result["target"]) / result["target"]) ** 2).mean(axis=0))),
+}
+
+# Independent randomizations of a "sobol" estimate, used to measure its variance
+SOBOL_REPLICATES = 8
+
+
+def path_metric(result, metric):
+    """
+    Evaluate a per-path metric on a simulate_ensemble() result.
+
+    Parameters:
+        result (dict): Ensemble result (with record_history for history metrics).
+        metric (str or callable): PATH_METRICS name or function(result) -> (paths, tokens).
+
+    Returns:
+        np.ndarray: (paths, tokens) metric values.
+    """
+    if callable(metric):
+        return np.asarray(metric(result))
+    if metric not in PATH_METRICS:
+        raise ValueError(f"Unknown path metric: {metric} (expected one of {', '.join(PATH_METRICS)})")
+    return PATH_METRICS[metric][1](result)
+
+
+def _needs_history(metric):
+    """Whether a metric reads the per-path history (custom metrics always get it)."""
+    if callable(metric):
+        return True
+    if metric not in PATH_METRICS:
+        raise ValueError(f"Unknown path metric: {metric} (expected one of {', '.join(PATH_METRICS)})")
+    return PATH_METRICS[metric][0]
+
+
+def estimate(samples, mode=None, replicates=1, path_variance=None):
+    """
+    Estimate the mean of per-path samples with its variance and ESS.
+
+    The samples are first reduced to independent units: antithetic pairs
+    (rows 2k and 2k + 1) are averaged, and the rows of each of the
+    `replicates` Sobol randomizations (contiguous blocks) are averaged. The
+    estimator variance is the unit variance over the number of units; the
+    ESS compares it with independent sampling, path_variance / variance.
+
+    Parameters:
+        samples (np.ndarray): (paths, tokens) per-path values.
+        mode (str): Noise mode the samples were drawn with.
+        replicates (int): Independent Sobol randomizations in samples.
+        path_variance (np.ndarray): Per-path variance under independent
+            sampling (defaults to the sample variance of the rows).
+
+    Returns:
+        dict: (tokens,) "mean", "variance" (of the estimate), "std_error",
+        "path_variance", "ess" and "efficiency" (ess / paths), plus "mode"
+        and "n_paths".
+    """
+    samples = np.asarray(samples, dtype=np.float64)
+    if samples.ndim == 1:
+        samples = samples[:, None]
+    n_paths = len(samples)
+    if mode == "antithetic":
+        if n_paths % 2:
+            raise ValueError("Antithetic samples come in pairs; got an odd number of paths")
+        units = samples.reshape(n_paths // 2, 2, -1).mean(axis=1)
+    elif mode == "sobol":
+        if replicates < 2 or n_paths % replicates:
+            raise ValueError(f"Sobol estimates need at least 2 equal replicates; got {replicates} for {n_paths} paths")
+        units = samples.reshape(replicates, n_paths // replicates, -1).mean(axis=1)
+    elif mode is None:
+        units = samples
+    else:
+        raise ValueError(f"Unknown variance reduction mode: {mode} (expected 'antithetic', 'sobol' or None)")
+    if len(units) < 2:
+        raise ValueError("At least two independent units are needed to estimate a variance")
+
+    if path_variance is None:
+        path_variance = samples.var(axis=0, ddof=1)
+    variance = units.var(axis=0, ddof=1) / len(units)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ess = np.where(variance > 0, path_variance / variance, np.inf)
+    return {
+        "mode": mode,
+        "n_paths": n_paths,
+        "mean": units.mean(axis=0),
+        "variance": variance,
+        "std_error": np.sqrt(variance),
+        "path_variance": path_variance,
+        "ess": ess,
+        "efficiency": ess / n_paths,
+    }
+
+
+def _sample(n_paths, metric, mode, replicates, seed, **kwargs):
+    """
+    Simulate n_paths paths in the given mode and return (samples, token_names).
+
+    Sobol runs are split into `replicates` independent randomizations, one
+    child seed each, stacked in replicate order.
+    """
+    kwargs.setdefault("record_history", _needs_history(metric))
+    if mode == "sobol":
+        if n_paths % replicates:
+            raise ValueError(f"n_paths ({n_paths}) must be a multiple of replicates ({replicates})")
+        results = [
+            simulate_ensemble(n_paths // replicates, seed=child, variance_reduction="sobol", **kwargs)
+            for child in root_seed(seed).spawn(replicates)
+        ]
+        return np.concatenate([path_metric(result, metric) for result in results]), results[0]["token_names"]
+    result = simulate_ensemble(n_paths, seed=seed, variance_reduction=mode or False, **kwargs)
+    return path_metric(result, metric), result["token_names"]
+
+
+def run_estimate(n_paths, metric="final_price", mode=None, replicates=SOBOL_REPLICATES, seed=None, **kwargs):
+    """
+    Estimate the expected value of a per-path metric in a noise mode.
+
+    Parameters:
+        n_paths (int): Total paths (even for "antithetic", a multiple of
+            replicates for "sobol", ideally replicates * 2^k).
+        metric (str or callable): Per-path metric (see path_metric).
+        mode (str): None, "antithetic" or "sobol".
+        replicates (int): Independent Sobol randomizations.
+        seed (int or np.random.SeedSequence): Root seed.
+        **kwargs: Further simulate_ensemble() arguments (time_steps, params, ...).
+
+    Returns:
+        dict: The estimate() statistics plus "token_names".
+    """
+    samples, token_names = _sample(n_paths, metric, mode, replicates, seed, **kwargs)
+    stats = estimate(samples, mode, replicates)
+    stats["token_names"] = token_names
+    return stats
+
+
+def compare(params_a, params_b, n_paths, metric="final_price", mode=None, replicates=SOBOL_REPLICATES, seed=None,
+            common_random_numbers=True, **kwargs):
+    """
+    Estimate the difference E[metric | params_a] - E[metric | params_b].
+
+    With common_random_numbers both parameter sets are driven by the same
+    noise, path by path, so the noise largely cancels in the per-path
+    differences; otherwise they use independent child seeds. The ESS is
+    relative to independent sampling of both sets with n_paths paths each.
+
+    Parameters:
+        params_a (dict): First parameter set (see simulate_ensemble params).
+        params_b (dict): Second parameter set.
+        n_paths (int): Paths per parameter set.
+        metric (str or callable): Per-path metric (see path_metric).
+        mode (str): None, "antithetic" or "sobol", applied to both sets.
+        replicates (int): Independent Sobol randomizations.
+        seed (int or np.random.SeedSequence): Root seed.
+        common_random_numbers (bool): Share the noise between the two sets.
+        **kwargs: Further simulate_ensemble() arguments.
+
+    Returns:
+        dict: The estimate() statistics of the difference plus "token_names".
+    """
+    root = root_seed(seed)
+    seeds = root.spawn(1) * 2 if common_random_numbers else root.spawn(2)
+    a, token_names = _sample(n_paths, metric, mode, replicates, seeds[0], params=params_a, **kwargs)
+    b, _ = _sample(n_paths, metric, mode, replicates, seeds[1], params=params_b, **kwargs)
+    path_variance = a.var(axis=0, ddof=1) + b.var(axis=0, ddof=1)
+    stats = estimate(a - b, mode, replicates, path_variance)
+    stats["token_names"] = token_names
+    return stats
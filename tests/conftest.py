@@ -0,0 +1,7 @@
+# tests/conftest.py
+
+import os
+import sys
+
+# Make `config` and `src` importable when pytest runs from any directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
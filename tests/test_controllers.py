@@ -0,0 +1,33 @@
+# tests/test_controllers.py
+
+import numpy as np
+from src.controllers.q_learning import QLearningController, run_q_learning, train_q_controller
+
+
+def _greedy_deviation(controller, seeds=(101, 102)):
+    runs = [run_q_learning(controller, 256, time_steps=100, seed=seed, learn=False, explore=False,
+                           model_type="linear") for seed in seeds]
+    return float(np.mean([run["mean_abs_deviation"].mean() for run in runs]))
+
+
+def test_trained_greedy_policy_beats_untrained_on_held_out_seeds():
+    # The linear model adds the fee and reward totals to the price one for one,
+    # so the actions move the peg deviation well beyond the noise
+    untrained = _greedy_deviation(QLearningController(seed=0))
+    controller, _ = train_q_controller(episodes=10, n_envs=256, time_steps=100, seed=0, model_type="linear")
+    assert _greedy_deviation(controller) < 0.5 * untrained
+
+
+def test_training_resumes_an_existing_controller():
+    controller, first = train_q_controller(episodes=2, n_envs=8, time_steps=20, seed=0)
+    visits = controller.visits.sum()
+    controller, second = train_q_controller(controller, episodes=2, n_envs=8, time_steps=20, seed=1)
+    assert first.shape == second.shape == (2,)
+    assert controller.visits.sum() == 2 * visits
+
+
+def test_untrained_controller_holds_fees_and_rewards():
+    result = run_q_learning(QLearningController(seed=0), 4, time_steps=5, seed=0, learn=False, explore=False)
+    held = run_q_learning(QLearningController(seed=0, fee_step=0.0, reward_step=0.0), 4, time_steps=5, seed=0,
+                          learn=False, explore=False)
+    np.testing.assert_array_equal(result["price"], held["price"])
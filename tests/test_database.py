@@ -0,0 +1,180 @@
+# tests/test_database.py
+
+import multiprocessing
+import os
+import shutil
+import sqlite3
+
+import numpy as np
+import pytest
+from config import config
+from src.database import analytics, database
+from src.pipeline import DatabaseStage
+from src.simulation import Simulation, simulate
+from src.universe import generate_universe
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LEGACY_DB = os.path.join(REPO_ROOT, "src", "simulation.db")
+
+
+def test_migrate_committed_legacy_db(tmp_path):
+    db_path = str(tmp_path / "simulation.db")
+    shutil.copy(LEGACY_DB, db_path)
+    with sqlite3.connect(db_path) as conn:
+        legacy = conn.execute(
+            "SELECT time_step, price, circulation, fees FROM simulation_results ORDER BY id"
+        ).fetchall()
+
+    database.init_db(db_path, schema_path=os.path.join(REPO_ROOT, "schema", "schema.sql"))
+
+    with sqlite3.connect(db_path) as conn:
+        rows = conn.execute(
+            "SELECT run_id, token_name, time_step, price, circulation, fee_minting "
+            "FROM simulation_results ORDER BY run_id, time_step"
+        ).fetchall()
+        runs = conn.execute("SELECT run_id, model_type FROM simulation_runs ORDER BY run_id").fetchall()
+    assert len(rows) == len(legacy)
+    assert {row[1] for row in rows} == {database.LEGACY_TOKEN_NAME}
+    # time_step restarts at 0 for every run in the legacy file
+    assert len(runs) == sum(1 for row in legacy if row[0] == 0)
+    assert {model_type for _, model_type in runs} == {"legacy"}
+    assert [row[2:5] for row in rows] == [row[:3] for row in legacy]
+
+    # A second initialization finds nothing left to migrate
+    assert database.migrate_legacy_results(db_path) == 0
+
+
+def _new_run(tmp_path):
+    db_path = str(tmp_path / "results.db")
+    database.init_db(db_path, schema_path=os.path.join(REPO_ROOT, "schema", "schema.sql"))
+    return db_path, database.create_run(db_path)
+
+
+def _stored_rows(db_path, run_id):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute(
+            "SELECT * FROM simulation_results WHERE run_id = ? ORDER BY token_name, time_step", (run_id,)
+        ).fetchall()
+
+
+def test_background_writer_matches_simulation_writer(tmp_path):
+    block = np.random.default_rng(0).random((300, 2, len(database.result_columns())))
+    db_path, sync_run = _new_run(tmp_path)
+    with database.SimulationWriter(db_path, sync_run, batch_size=64) as writer:
+        writer.store_block(block[:100], 0, ["alpha", "omega"])
+        writer.store_block(block[100:], 100, ["alpha", "omega"])
+    background_run = database.create_run(db_path)
+    with database.BackgroundWriter(db_path, background_run, batch_size=64, max_pending=1) as writer:
+        writer.store_block(block[:100], 0, ["alpha", "omega"])
+        writer.store_block(block[100:], 100, ["alpha", "omega"])
+        writer.flush()
+        assert len(_stored_rows(db_path, background_run)) == 600
+
+    sync_rows = _stored_rows(db_path, sync_run)
+    assert len(sync_rows) == 600
+    assert [row[1:] for row in _stored_rows(db_path, background_run)] == [row[1:] for row in sync_rows]
+
+
+def test_background_writer_reports_failures(tmp_path):
+    block = np.zeros((10, 1, len(database.result_columns())))
+    db_path, run_id = _new_run(tmp_path)
+    writer = database.BackgroundWriter(db_path, run_id)
+    writer.store_block(block, 0, ["alpha"])
+    # The same (run, token, step) rows again violate the primary key
+    writer.store_block(block, 0, ["alpha"])
+    with pytest.raises(RuntimeError, match="IntegrityError"):
+        writer.flush()
+    with pytest.raises(RuntimeError, match="IntegrityError"):
+        writer.close()
+    assert not multiprocessing.active_children()
+
+
+def test_init_db_renames_former_summary_columns(tmp_path):
+    db_path = str(tmp_path / "results.db")
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("CREATE TABLE run_summaries (run_id INTEGER, token_name TEXT, minted REAL, burned REAL)")
+        conn.execute("INSERT INTO run_summaries VALUES (1, 'alpha', 2.0, 3.0)")
+    database.init_db(db_path, schema_path=os.path.join(REPO_ROOT, "schema", "schema.sql"))
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT net_increase, net_decrease FROM run_summaries").fetchall() == [(2.0, 3.0)]
+        # The gross columns are added back empty
+        assert conn.execute("SELECT minted, burned FROM run_summaries").fetchall() == [(None, None)]
+    database.init_db(db_path, schema_path=os.path.join(REPO_ROOT, "schema", "schema.sql"))
+
+
+@pytest.fixture
+def stored_runs(monkeypatch, tmp_path):
+    monkeypatch.setattr(config, "STORE_RESULTS", True)
+    monkeypatch.setattr(config, "CACHE_RESULTS", False)
+    monkeypatch.setattr(config, "HISTORY_PATH", None)
+    monkeypatch.setattr(config, "TIME_STEPS", 50)
+    monkeypatch.setattr(config, "DB_PATH", str(tmp_path / "results.db"))
+    monkeypatch.setattr(config, "SCHEMA_PATH", os.path.join(REPO_ROOT, "schema", "schema.sql"))
+    return config.DB_PATH
+
+
+@pytest.mark.parametrize("background", [False, True])
+def test_store_universe_with_other_products(monkeypatch, stored_runs, background):
+    monkeypatch.setattr(config, "DB_BACKGROUND", background)
+    universe = generate_universe(3, products=["lending", "swaps"], seed=1)
+    result = simulate(seed=1, universe=universe)
+
+    run = analytics.load_run(stored_runs, result.run_id, ("price", "fee_swaps", "reward_lending", "fee_minting"))
+    np.testing.assert_array_equal(run["price"], result.history.field("price"))
+    np.testing.assert_array_equal(run["fee_swaps"], result.history.field("fee_swaps"))
+    np.testing.assert_array_equal(run["reward_lending"], result.history.field("reward_lending"))
+    assert np.isnan(run["fee_minting"]).all()
+    # The default products still store into the same database
+    assert simulate(seed=1).run_id != result.run_id
+
+
+def test_unstorable_universe_leaves_no_run_behind(stored_runs):
+    with open(os.path.join(REPO_ROOT, "schema", "schema.sql")) as f:
+        schema = f.read()
+    # Databases created before the product columns became nullable
+    for column in database.result_columns()[2:]:
+        schema = schema.replace(f"    {column} REAL,", f"    {column} REAL NOT NULL,")
+    with sqlite3.connect(stored_runs) as conn:
+        conn.executescript(schema)
+
+    with pytest.raises(ValueError, match="cannot fill"):
+        simulate(seed=1, universe=generate_universe(3, products=["lending", "swaps"], seed=1))
+    with sqlite3.connect(stored_runs) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM simulation_runs").fetchone() == (0,)
+    assert not multiprocessing.active_children()
+
+
+def test_failed_simulation_start_deletes_its_run(stored_runs):
+    stage = DatabaseStage(products=database.PRODUCTS)
+    with pytest.raises(ValueError, match="was set up for products"):
+        Simulation(universe=generate_universe(3, products=["lending", "swaps"], seed=1), stages=[stage])
+    with sqlite3.connect(stored_runs) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM simulation_runs WHERE run_id = ?", (stage.run_id,)).fetchone() == (0,)
+    assert not multiprocessing.active_children()
+
+
+def test_summaries_record_gross_minted_and_burned(monkeypatch, stored_runs):
+    monkeypatch.setattr(config, "TIME_STEPS", 300)
+    result = simulate("nudge", backend="numpy", seed=2)
+    run = analytics.load_run(stored_runs, result.run_id)
+    price, circulation = run["price"], run["circulation"]
+    history = result.history
+    fee_total = sum(history.field(f"fee_{prod}") for prod in database.PRODUCTS)
+    reward_total = sum(history.field(f"reward_{prod}") for prod in database.PRODUCTS)
+
+    # The nudge model mints from the step's totals and burns surplus and deficit
+    minted = (0.5 * reward_total + 0.2 * fee_total)[1:].sum(axis=0)
+    burned = (0.1 * np.maximum(circulation[:-1] - run["max_supply"], 0.0)
+              + 0.01 * np.maximum(price[1:] * circulation[:-1] - run["collateral"], 0.0)).sum(axis=0)
+    assert (burned > 0).all()
+
+    summaries = analytics.load_summaries(stored_runs, [result.run_id])
+    np.testing.assert_allclose(summaries["minted"], minted, rtol=1e-9)
+    np.testing.assert_allclose(summaries["burned"], burned, rtol=1e-9)
+    np.testing.assert_allclose(summaries["minted"] - summaries["burned"],
+                               circulation[-1] - circulation[0], rtol=1e-9)
+
+    # Recomputing from the stored step rows gives the same totals
+    recomputed = analytics.summarize_run(stored_runs, result.run_id)
+    np.testing.assert_allclose(recomputed["minted"], minted, rtol=1e-9)
+    np.testing.assert_allclose(recomputed["burned"], burned, rtol=1e-9)
@@ -0,0 +1,40 @@
+# tests/test_ensemble.py
+
+import numpy as np
+import pytest
+from config import config
+from src.ensemble import run_ensemble, simulate_ensemble
+
+# Statistics pooled from the chunks rather than computed over every path at once
+POOLED = ("price_mean", "price_std")
+
+
+@pytest.fixture(autouse=True)
+def uncached_runs(monkeypatch):
+    monkeypatch.setattr(config, "CACHE_RESULTS", False)
+
+
+def _assert_same_result(result, expected, pooled_rtol=None):
+    assert result.keys() == expected.keys()
+    for name, value in expected.items():
+        if pooled_rtol is not None and name in POOLED:
+            np.testing.assert_allclose(result[name], value, rtol=pooled_rtol, atol=1e-15, err_msg=name)
+        elif isinstance(value, np.ndarray):
+            np.testing.assert_array_equal(result[name], value, err_msg=name)
+        else:
+            assert result[name] == value, name
+
+
+@pytest.mark.parametrize("variance_reduction", [None, "antithetic"])
+def test_run_ensemble_chunks_reproduce_the_unsplit_run(variance_reduction):
+    kwargs = dict(time_steps=60, seed=9, record_history=True, variance_reduction=variance_reduction)
+    expected = simulate_ensemble(24, **kwargs)
+    for chunk_paths in (24, 10, 8, 4):
+        _assert_same_result(run_ensemble(24, workers=1, chunk_paths=chunk_paths, **kwargs), expected, 1e-12)
+
+
+def test_run_ensemble_is_identical_for_any_number_of_workers():
+    kwargs = dict(time_steps=60, seed=9, record_history=True, chunk_paths=6)
+    expected = run_ensemble(24, workers=1, **kwargs)
+    for workers in (2, 3):
+        _assert_same_result(run_ensemble(24, workers=workers, **kwargs), expected)
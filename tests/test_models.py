@@ -0,0 +1,50 @@
+# tests/test_models.py
+
+import numpy as np
+import pytest
+from config import config
+from src.pipeline import TrainingStage
+from src.simulation import simulate
+
+torch = pytest.importorskip("torch")
+from src.models.nn_model import NNModel  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def in_memory_runs(monkeypatch):
+    monkeypatch.setattr(config, "TIME_STEPS", 600)
+    monkeypatch.setattr(config, "HISTORY_PATH", None)
+    monkeypatch.setattr(config, "STORE_RESULTS", False)
+    monkeypatch.setattr(config, "CACHE_RESULTS", False)
+
+
+def _loss(model, inputs, targets):
+    predictions = model.predict_features(inputs)
+    return float(np.mean((predictions - targets[:, 0]) ** 2))
+
+
+def test_nn_update_lowers_loss():
+    torch.manual_seed(0)
+    model = NNModel()
+    model.rng = np.random.default_rng(0)
+    history = simulate("nudge", backend="numpy", seed=0).history
+    inputs, targets = NNModel.training_data_from_history(history, 10.0, 5.0)
+
+    before = _loss(model, inputs, targets)
+    for _ in range(50):
+        model.update((inputs, targets))
+    assert _loss(model, inputs, targets) < 0.5 * before
+
+
+def test_training_stage_updates_the_nn_model_during_a_run():
+    torch.manual_seed(0)
+    stage = TrainingStage()
+    simulate("nn", seed=0, stages=[stage])
+    steps = [step for step, _ in stage.losses]
+    assert steps == sorted(steps) and steps[-1] == config.TIME_STEPS
+    assert stage.losses[-1][1] < stage.losses[0][1]
+
+
+def test_training_stage_rejects_untrainable_models():
+    with pytest.raises(ValueError, match="trainable model"):
+        simulate("nudge", seed=0, stages=[TrainingStage()])
@@ -0,0 +1,28 @@
+# tests/test_noise.py
+
+import sys
+
+import numpy as np
+import pytest
+from src import noise
+
+
+def _independent(shape, steps, seed=0):
+    return noise.NoiseBlocks(0.1, shape, noise.path_generators(seed, 0, shape[1]), total_steps=steps).take(steps)
+
+
+def test_sobol_without_scipy_falls_back_to_independent_draws(monkeypatch):
+    monkeypatch.setitem(sys.modules, "scipy.stats", None)
+    with pytest.warns(RuntimeWarning, match="requires the scipy package"):
+        source = noise.ensemble_noise(0.1, (2, 4), 0, 0, 10, "sobol")
+    assert not isinstance(source, noise.SobolNoise)
+    np.testing.assert_array_equal(source.take(10), _independent((2, 4), 10))
+
+
+def test_sobol_beyond_max_dimension_falls_back_to_independent_draws():
+    shape = (noise.SOBOL_MAX_DIMENSION + 1, 2)
+    with pytest.raises(ValueError, match="at least one step"):
+        noise.SobolNoise(0.1, shape, noise.path_generators(0, 0, 2), 0, 0, 10)
+    with pytest.warns(RuntimeWarning, match="at most"):
+        source = noise.ensemble_noise(0.1, shape, 0, 0, 10, "sobol")
+    np.testing.assert_array_equal(source.take(10), _independent(shape, 10))
@@ -0,0 +1,92 @@
+# tests/test_simulation.py
+
+import os
+
+import numpy as np
+import pytest
+from config import config
+from src import kernels
+from src.simulation import Simulation, simulate
+from src.universe import generate_universe
+
+# Prices and circulation of the original dict-based simulate() loop: nudge
+# model, the configured tokens, 200 steps after np.random.seed(3)
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "baseline_nudge_seed3.npz")
+
+BACKENDS = ["numpy", "python"] + (["numba"] if kernels.NUMBA_AVAILABLE else [])
+
+
+@pytest.fixture(autouse=True)
+def in_memory_runs(monkeypatch):
+    monkeypatch.setattr(config, "TIME_STEPS", 600)
+    monkeypatch.setattr(config, "HISTORY_PATH", None)
+    monkeypatch.setattr(config, "STORE_RESULTS", False)
+    monkeypatch.setattr(config, "CACHE_RESULTS", False)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_seeded_simulate_matches_baseline(monkeypatch, backend):
+    monkeypatch.setattr(config, "TIME_STEPS", 200)
+    baseline = np.load(BASELINE)
+    np.random.seed(3)
+    history = simulate("nudge", backend=backend).history
+    np.testing.assert_array_equal(history.field("price")[1:], baseline["price"])
+    np.testing.assert_array_equal(history.field("circulation")[1:], baseline["circulation"])
+
+
+@pytest.mark.skipif(not kernels.NUMBA_AVAILABLE, reason="requires numba")
+def test_numba_backend_matches_numpy(monkeypatch):
+    monkeypatch.setattr(config, "TIME_STEPS", 3000)
+    expected = simulate("nudge", backend="numpy", seed=11).history.data
+    np.testing.assert_array_equal(simulate("nudge", backend="numba", seed=11).history.data, expected)
+
+
+@pytest.mark.parametrize("model_type,backend", [("nudge", "numpy"), ("nudge", "python"), ("linear", "numpy")])
+def test_checkpoint_resume_is_exact(tmp_path, model_type, backend):
+    expected = simulate(model_type, backend=backend, seed=5).history.data
+
+    sim = Simulation(model_type, backend=backend, seed=5)
+    # An odd step count leaves noise buffered in the middle of a block
+    sim.step(257)
+    path = str(tmp_path / "run.npz")
+    sim.save_checkpoint(path)
+    sim.step(100)
+
+    resumed = Simulation.from_checkpoint(path, backend=backend)
+    assert resumed.t == 257
+    while resumed.step(123):
+        pass
+    np.testing.assert_array_equal(resumed.close().history.data, expected)
+
+
+def test_python_backend_matches_numpy():
+    expected = simulate("nudge", backend="numpy", seed=7).history.data
+    np.testing.assert_array_equal(simulate("nudge", backend="python", seed=7).history.data, expected)
+
+
+@pytest.mark.parametrize("backend", BACKENDS[1:])
+def test_fused_kernels_match_numpy_on_a_generated_universe(backend):
+    # More tokens and products than configured, circulation above max supply
+    # (surplus burn) and fees/rewards pinned at both clamp bounds
+    universe = generate_universe(6, products=["lending", "swaps", "staking", "bridging"], seed=4,
+                                 params={"initial_circulation": {"uniform": [1e6, 4e6]}})
+    expected = simulate("nudge", backend="numpy", seed=9, universe=universe).history
+    params = expected.data[:, :, 2:10]
+    assert (params == 0.0).any() and (params == 5.0).any()
+    assert (expected.field("circulation")[0] > universe.max_supply).any()
+    np.testing.assert_array_equal(simulate("nudge", backend=backend, seed=9, universe=universe).history.data,
+                                  expected.data)
+
+
+def test_python_backend_falls_back_for_other_models():
+    with pytest.warns(RuntimeWarning, match="Python kernel unavailable"):
+        sim = Simulation("linear", backend="python")
+    assert sim.engine == "numpy"
+
+
+def test_auto_backend_without_numba_picks_by_universe_size(monkeypatch):
+    monkeypatch.setattr(kernels, "NUMBA_AVAILABLE", False)
+    assert Simulation("nudge", backend="auto").engine == "python"
+    monkeypatch.setattr(kernels, "PYTHON_MAX_TOKENS", 1)
+    assert Simulation("nudge", backend="auto").engine == "numpy"
+